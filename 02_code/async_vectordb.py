@@ -0,0 +1,290 @@
+import asyncio
+from typing import List, Dict, Any, AsyncIterator, Union, Optional
+
+import httpx
+from dotenv import load_dotenv
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import PayloadSchemaType
+
+from embedding_cache import EmbeddingCache
+from query_cache import QueryEmbeddingCache
+from llm_gateway import LLMGateway, get_gateway
+from embedders import Embedder, OpenAIEmbedder
+from collection_config import CollectionConfig, match_collection_layout
+from sparse_encoder import BM25Encoder
+from vector_backends import build_points, build_query_requests, dense_vector_selector
+from vectordb import UPSERT_BATCH_SIZE, VectorDB, check_embedding_model
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+class AsyncVectorDB:
+    """
+    Asyncio twin of VectorDB, built on AsyncQdrantClient and the async client of the shared LLM gateway.
+    Both clients keep a keep-alive connection pool, and semaphores bound the number of
+    embedding and Qdrant requests in flight, so callers can fan out hundreds of searches with asyncio.gather.
+
+    Collections are created and searched with the CollectionConfig like QdrantBackend does, and an
+    existing collection is used with the vectors it has, so both classes can share a collection.
+
+    Usage:
+        async with AsyncVectorDB() as vector_db:
+            results = await asyncio.gather(*(vector_db.search(query) for query in queries))
+    """
+    def __init__(self, host: str = "localhost", port: int = 6333, collection_name: str = "documents",
+                 openai_api_key: str = None, embedding_cache: EmbeddingCache = None,
+                 use_embedding_cache: bool = True, max_concurrent_embeddings: int = 8,
+                 max_concurrent_searches: int = 32, max_connections: int = 64, gateway: LLMGateway = None,
+                 query_cache: QueryEmbeddingCache = None, use_query_cache: bool = True, embedder: Embedder = None,
+                 collection_config: CollectionConfig = None, client: AsyncQdrantClient = None):
+        self.client = client or AsyncQdrantClient(
+            host=host,
+            port=port,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.collection_name = collection_name
+        self.collection_config = collection_config or CollectionConfig()
+        self.sparse_encoder = None
+
+        # Embedding calls go through the shared gateway, which owns the OpenAI connection pool and retries,
+        # unless another embedder is given
+        if embedder is None:
+            embedder = OpenAIEmbedder(gateway=gateway or get_gateway(openai_api_key))
+        self.embedder = embedder
+        self.embedding_model = embedder.model_name
+        self.vector_size = embedder.dimensions
+
+        if embedding_cache is None and use_embedding_cache:
+            embedding_cache = EmbeddingCache()
+        self.embedding_cache = embedding_cache
+
+        if query_cache is None and use_query_cache:
+            query_cache = QueryEmbeddingCache()
+        self.query_cache = query_cache
+
+        self._embedding_semaphore = asyncio.Semaphore(max_concurrent_embeddings)
+        self._qdrant_semaphore = asyncio.Semaphore(max_concurrent_searches)
+        self._collection_ready = False
+        self._collection_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self._create_collection_if_not_exists()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Save the sparse vocabulary and close the Qdrant connection pool, the gateway's pool is shared and stays open"""
+        await self.save_sparse_encoder()
+        await self.client.close()
+
+    async def save_sparse_encoder(self):
+        """Persist the vocabulary of the sparse encoder, if the collection has one"""
+        if self.sparse_encoder is not None:
+            await asyncio.to_thread(self.sparse_encoder.save)
+
+    async def _create_collection_if_not_exists(self):
+        """
+        Create collection if it doesn't exist, and check that it was built with the same embedding model
+        like VectorDB does (only checked once per instance)
+        """
+        if self._collection_ready:
+            return
+
+        async with self._collection_lock:
+            if self._collection_ready:
+                return
+            collections = await self.client.get_collections()
+            collection_names = [col.name for col in collections.collections]
+
+            config = self.collection_config
+            metadata = {"embedding_model": self.embedding_model, "embedding_dimensions": self.vector_size}
+            if self.collection_name not in collection_names:
+                try:
+                    await self.client.create_collection(
+                        collection_name=self.collection_name,
+                        vectors_config=config.vectors_config(self.vector_size),
+                        sparse_vectors_config=config.sparse_vectors_config(),
+                        quantization_config=config.quantization_config(),
+                        hnsw_config=config.hnsw_config(),
+                        on_disk_payload=config.on_disk_payload,
+                        metadata=metadata
+                    )
+                except Exception as e:
+                    # Another process created it in the meantime, anything else is a real error
+                    if "already exists" not in str(e):
+                        raise
+
+            info = await self.client.get_collection(self.collection_name)
+            check_embedding_model(self.collection_name, info.config.metadata or {}, self.embedding_model)
+            self.collection_config = match_collection_layout(config, info.config.params)
+            # Collections created before the metadata was recorded get it added
+            missing_metadata = {k: v for k, v in metadata.items() if k not in (info.config.metadata or {})}
+            if missing_metadata:
+                await self.client.update_collection(collection_name=self.collection_name, metadata=missing_metadata)
+
+            payload_schema = info.payload_schema or {}
+            for field_name, field_schema in self.collection_config.payload_indexes.items():
+                if field_name not in payload_schema:
+                    await self.client.create_payload_index(collection_name=self.collection_name,
+                                                           field_name=field_name,
+                                                           field_schema=PayloadSchemaType(field_schema))
+            if self.collection_config.sparse:
+                self.sparse_encoder = BM25Encoder.for_collection(self.collection_name)
+            self._collection_ready = True
+
+    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, serving cached ones from the embedding cache and batching the rest"""
+        vectors = [None] * len(texts)
+        if self.embedding_cache is not None:
+            vectors = await asyncio.to_thread(
+                self.embedding_cache.get_many, self.embedding_model, self.vector_size, texts
+            )
+
+        missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing_texts:
+            embedded_vectors = await self._embed_with_api(missing_texts)
+            embedded = dict(zip(missing_texts, embedded_vectors))
+            if self.embedding_cache is not None:
+                await asyncio.to_thread(
+                    self.embedding_cache.put_many, self.embedding_model, self.vector_size,
+                    missing_texts, embedded_vectors
+                )
+            vectors = [vector if vector is not None else embedded[text] for text, vector in zip(texts, vectors)]
+
+        return vectors
+
+    async def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed search queries, serving repeated ones from the in-memory query cache"""
+        if self.query_cache is None:
+            return await self.embed_texts(queries)
+
+        vectors = self.query_cache.get_many(self.embedding_model, self.vector_size, queries)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Queries that normalize to the same key are embedded once
+            originals = {}
+            for i in missing:
+                originals.setdefault(self.query_cache.normalize(queries[i]), queries[i])
+            embedded = await self.embed_texts(list(originals.values()))
+            self.query_cache.put_many(self.embedding_model, self.vector_size, list(originals.values()), embedded)
+            embedded_by_key = dict(zip(originals, embedded))
+            for i in missing:
+                vectors[i] = embedded_by_key[self.query_cache.normalize(queries[i])]
+
+        return vectors
+
+    async def _embed_with_api(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with the embedder, bounding the number of embedding calls in flight"""
+        async with self._embedding_semaphore:
+            return await self.embedder.aembed(texts)
+
+    async def add_document(self, document: str, metadata: Dict[str, Any] = None):
+        """Add a document to the vector database"""
+        point_ids = await self.add_documents([{"text": document, "metadata": metadata}])
+        return point_ids[0]
+
+    async def add_documents(self, documents: List[Dict[str, Any]], upsert_batch_size: int = UPSERT_BATCH_SIZE) -> List[str]:
+        """
+        Add many documents with batched embedding calls and concurrent upserts.
+        The sparse vocabulary is saved on close() or by save_sparse_encoder(), not after every call.
+        """
+        if not documents:
+            return []
+
+        await self._create_collection_if_not_exists()
+        vectors = await self.embed_texts([doc["text"] for doc in documents])
+
+        texts = [doc["text"] for doc in documents]
+        sparse_vectors = None
+        if self.sparse_encoder is not None:
+            sparse_vectors = await asyncio.to_thread(self.sparse_encoder.encode_documents, texts)
+
+        # Same ids, payloads and named vectors as VectorDB, so re-ingesting through either overwrites the same points
+        points = build_points(self.collection_config, VectorDB.document_ids(documents), vectors,
+                              VectorDB.document_payloads(documents), sparse_vectors)
+
+        async def upsert_batch(batch):
+            async with self._qdrant_semaphore:
+                await self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=batch,
+                    wait=True
+                )
+
+        await asyncio.gather(*(
+            upsert_batch(points[start:start + upsert_batch_size])
+            for start in range(0, len(points), upsert_batch_size)
+        ))
+
+        return [point.id for point in points]
+
+    async def search(self, query: str, limit: int = 5, fields: Optional[List[str]] = None, ids_only: bool = False):
+        """Search for similar documents, fields and ids_only restrict the returned payload like VectorDB.search"""
+        await self._create_collection_if_not_exists()
+        query_vector = (await self.embed_queries([query]))[0]
+
+        # Dense search with the collection's vector names, two-stage on collections with a mini vector
+        requests = build_query_requests(self.collection_config, [query_vector], limit,
+                                        with_payload=False if ids_only else (list(fields) if fields is not None else True))
+        async with self._qdrant_semaphore:
+            responses = await self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+
+        results = []
+        for hit in responses[0].points:
+            if hit.payload is None:
+                results.append({"id": hit.id, "score": hit.score})
+                continue
+            results.append({
+                "id": hit.id,
+                "score": hit.score,
+                "text": hit.payload.get("text", ""),
+                "metadata": {k: v for k, v in hit.payload.items() if k != "text"}
+            })
+
+        return results
+
+    async def iter_documents(self, batch_size: int = 256, with_payload: Union[bool, List[str]] = True,
+                             with_vectors: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Lazily iterate over every document of the collection, one scroll page at a time"""
+        offset = None
+        while True:
+            async with self._qdrant_semaphore:
+                points, offset = await self.client.scroll(
+                    collection_name=self.collection_name,
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=with_payload,
+                    with_vectors=dense_vector_selector(self.collection_config, with_vectors)
+                )
+
+            for point in points:
+                payload = point.payload or {}
+                document = {
+                    "id": point.id,
+                    "text": payload.get("text", ""),
+                    "metadata": {k: v for k, v in payload.items() if k != "text"}
+                }
+                if with_vectors:
+                    # Collections with named vectors return a dict of vectors, only the dense one is exposed
+                    vector = point.vector
+                    if isinstance(vector, dict):
+                        vector = vector.get(self.collection_config.dense_vector_name)
+                    document["vector"] = vector
+                yield document
+
+            if offset is None:
+                break
+
+    async def get_all_documents(self):
+        """
+        Get all the documents from the vector db as a list.
+        Prefer iter_documents for large collections, this materializes every payload in memory.
+        """
+        try:
+            return [document async for document in self.iter_documents()]
+        except Exception as e:
+            print(f"Error retrieving documents: {e}")
+            return []
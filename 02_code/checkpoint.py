@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Dict, Any, Iterable, Set
+
+DEFAULT_CHECKPOINT_DIR = os.getenv("UPLOAD_CHECKPOINT_DIR", ".cache/checkpoints")
+
+
+@dataclass
+class FailedItem:
+    """A chunk whose upload failed, with the reason of the last failure"""
+    point_id: str
+    file_path: str
+    chunk_index: int
+    error: str
+    failed_at: float
+
+
+class UploadCheckpoint:
+    """
+    Append-only JSON lines log of an upload: the ids of the chunks stored so far and the chunks that
+    failed with their error. Every record is flushed and synced to disk before the call returns, so the
+    log survives a crash or Ctrl-C and the next run can skip what was already stored.
+
+    Records are {"event": "completed", "ids": [...]} or {"event": "failed", "id", "file_path",
+    "chunk_index", "error", "time"}. A chunk completed after failing is no longer failed. A truncated
+    last line (the process was killed while writing it) is ignored and cut off before appending.
+
+    Only the batch upload of data_uploading.py (--checkpoint/--resume/--retry-failed) writes it. The
+    streaming IngestionPipeline resumes per file instead: the manifest only records a file once all its
+    chunks are stored, so the next run picks up interrupted files again and the embedding cache keeps
+    their already embedded chunks from being embedded twice.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.completed: Set[str] = set()
+        self.failed: Dict[str, FailedItem] = {}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            self._load()
+        self._file = open(path, "a", encoding="utf-8")
+
+    @classmethod
+    def for_collection(cls, collection_name: str, directory: str = DEFAULT_CHECKPOINT_DIR) -> "UploadCheckpoint":
+        return cls(os.path.join(directory, f"{collection_name}.jsonl"))
+
+    def _load(self):
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            # Cut a truncated last line off, otherwise the next record would be appended to it
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+
+        for line in data[:end].decode("utf-8", errors="replace").splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("event") == "completed":
+                self.completed.update(record["ids"])
+                for point_id in record["ids"]:
+                    self.failed.pop(point_id, None)
+            elif record.get("event") == "failed":
+                self.failed[record["id"]] = FailedItem(record["id"], record.get("file_path", ""),
+                                                       record.get("chunk_index", 0), record.get("error", ""),
+                                                       record.get("time", 0.0))
+
+    def _append(self, records: List[Dict[str, Any]]):
+        self._file.write("".join(json.dumps(record) + "\n" for record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record_completed(self, point_ids: Iterable[str]):
+        point_ids = list(point_ids)
+        if not point_ids:
+            return
+        with self._lock:
+            self._append([{"event": "completed", "ids": point_ids}])
+            self.completed.update(point_ids)
+            for point_id in point_ids:
+                self.failed.pop(point_id, None)
+
+    def record_failed(self, documents: List[Dict], point_ids: List[str], error: Exception):
+        """Record the chunks of a failed batch with the error, e.g. 'RateLimitError: ...'"""
+        now = time.time()
+        reason = f"{type(error).__name__}: {error}"
+        items = [
+            FailedItem(point_id, doc["metadata"].get("file_path", ""), doc["metadata"].get("chunk_index", 0), reason, now)
+            for doc, point_id in zip(documents, point_ids)
+        ]
+        with self._lock:
+            self._append([{"event": "failed", "id": item.point_id, "file_path": item.file_path,
+                           "chunk_index": item.chunk_index, "error": item.error, "time": item.failed_at}
+                          for item in items])
+            for item in items:
+                self.failed[item.point_id] = item
+
+    def clear(self):
+        """Start a new log, forgetting the previous run"""
+        with self._lock:
+            self._file.close()
+            self._file = open(self.path, "w", encoding="utf-8")
+            self.completed.clear()
+            self.failed.clear()
+
+    def print_failures(self, limit: int = 10):
+        """Print the failed chunks grouped by error"""
+        by_error: Dict[str, List[FailedItem]] = {}
+        for item in self.failed.values():
+            by_error.setdefault(item.error, []).append(item)
+        for error, items in sorted(by_error.items(), key=lambda entry: -len(entry[1])):
+            files = sorted({os.path.basename(item.file_path) for item in items})
+            print(f"  {len(items)} chunks from {files[:limit]}{' ...' if len(files) > limit else ''}: {error}")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,208 @@
+import re
+from typing import List, Dict, Any, Tuple
+
+from token_utils import DEFAULT_ENCODING, get_encoding
+
+# Chunk sizes in tokens of the embedding model's encoding. text-embedding-3-* accept 8191 tokens,
+# but retrieval works best with chunks of a few hundred tokens
+DEFAULT_TARGET_TOKENS = 350
+DEFAULT_MAX_TOKENS = 500
+DEFAULT_OVERLAP_TOKENS = 50
+
+# A chunk that reached this share of the target is closed at the next paragraph break
+PARAGRAPH_SNAP_RATIO = 0.75
+
+# Boundaries a chunk may end on: paragraph breaks, line breaks and the whitespace after a sentence
+_BOUNDARY_PATTERN = re.compile(r"\n[ \t]*\n\s*|\n|(?<=[.!?])[ \t]+")
+
+# Tokens of the line breaks between the elements of a chunk and of the "- " marker of list items
+SEPARATOR_TOKENS = 1
+LIST_MARKER_TOKENS = 1
+
+PARAGRAPH_BREAK = 2
+SENTENCE_BREAK = 1
+
+# (text including its trailing whitespace, token count, strength of the boundary that follows it)
+Segment = Tuple[str, int, int]
+
+
+def split_segments(text: str, max_tokens: int = DEFAULT_MAX_TOKENS,
+                   encoding_name: str = DEFAULT_ENCODING) -> List[Segment]:
+    """
+    Split text into sentences and lines, each with its token count and the strength of the break after it.
+    Segments longer than max_tokens are cut into pieces of max_tokens tokens.
+    """
+    encoding = get_encoding(encoding_name)
+    segments = []
+    position = 0
+
+    def add(segment_text: str, level: int):
+        tokens = encoding.encode(segment_text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            segments.append((segment_text, len(tokens), level))
+            return
+        for start in range(0, len(tokens), max_tokens):
+            piece = tokens[start:start + max_tokens]
+            segments.append((encoding.decode(piece), len(piece), level if start + max_tokens >= len(tokens) else 0))
+
+    for match in _BOUNDARY_PATTERN.finditer(text):
+        if match.end() > position:
+            add(text[position:match.end()], PARAGRAPH_BREAK if match.group().count("\n") > 1 else SENTENCE_BREAK)
+            position = match.end()
+    if position < len(text):
+        add(text[position:], PARAGRAPH_BREAK)
+
+    return segments
+
+
+def chunk_text(text: str, target_tokens: int = DEFAULT_TARGET_TOKENS, max_tokens: int = DEFAULT_MAX_TOKENS,
+               overlap_tokens: int = DEFAULT_OVERLAP_TOKENS, encoding_name: str = DEFAULT_ENCODING) -> List[str]:
+    """
+    Split text into chunks of about target_tokens tokens and never more than max_tokens, in one pass.
+    Chunks end on a sentence or line boundary, preferably on a paragraph break, and start with the
+    last whole sentences of the previous chunk, up to overlap_tokens tokens.
+    """
+    if not text.strip():
+        return []
+
+    chunks = []
+    current: List[Segment] = []
+    current_tokens = 0
+    # Number of segments at the start of current that were carried over from the previous chunk
+    carried_count = 0
+
+    def flush():
+        nonlocal current, current_tokens, carried_count
+        chunk = "".join(segment[0] for segment in current).strip()
+        if chunk:
+            chunks.append(chunk)
+
+        # Carry the trailing sentences that fit into the overlap over to the next chunk
+        carried = []
+        carried_tokens = 0
+        for segment in reversed(current):
+            if carried_tokens + segment[1] > overlap_tokens or len(carried) + 1 >= len(current):
+                break
+            carried.append(segment)
+            carried_tokens += segment[1]
+        current = carried[::-1]
+        current_tokens = carried_tokens
+        carried_count = len(current)
+
+    for segment in split_segments(text, max_tokens, encoding_name):
+        _, n_tokens, level = segment
+        if current and current_tokens + n_tokens > max_tokens:
+            if len(current) > carried_count:
+                flush()
+            # Drop the overlap if the segment wouldn't fit next to it
+            if current_tokens + n_tokens > max_tokens:
+                current, current_tokens, carried_count = [], 0, 0
+
+        current.append(segment)
+        current_tokens += n_tokens
+
+        if current_tokens >= target_tokens or (level == PARAGRAPH_BREAK and
+                                               current_tokens >= target_tokens * PARAGRAPH_SNAP_RATIO):
+            flush()
+
+    # The rest is a last chunk, unless it is only the overlap of the previous one
+    if len(current) > carried_count:
+        chunk = "".join(segment[0] for segment in current).strip()
+        if chunk:
+            chunks.append(chunk)
+
+    return chunks
+
+
+def _join_parts(parts: List[Tuple[str, str]]) -> str:
+    """Join element texts, consecutive list items on their own lines and other elements as paragraphs"""
+    text = ""
+    previous_type = None
+    for element_type, element_text in parts:
+        if element_type == "ListItem":
+            element_text = f"- {element_text}"
+        if text:
+            text += "\n" if element_type == previous_type == "ListItem" else "\n\n"
+        text += element_text
+        previous_type = element_type
+    return text
+
+
+def chunk_elements(elements: List[Dict[str, Any]], target_tokens: int = DEFAULT_TARGET_TOKENS,
+                   max_tokens: int = DEFAULT_MAX_TOKENS, encoding_name: str = DEFAULT_ENCODING) -> List[Dict[str, Any]]:
+    """
+    Group parsed markdown elements into section scoped chunks.
+    A heading (Title element) closes the current chunk and starts a new section, the elements of a
+    section are packed into chunks of about target_tokens tokens without splitting an element, so code
+    blocks, tables and list items stay whole. Only elements longer than max_tokens are split, with chunk_text.
+    Headings directly followed by another heading stay together with the first body element.
+
+    Args:
+        elements: Dictionaries with the 'type' (unstructured category), 'text' and, for titles,
+            'depth' (0 for a top level heading) of each element, in document order
+
+    Returns:
+        List of {'text', 'heading_path'} dictionaries, heading_path lists the enclosing headings
+    """
+    encoding = get_encoding(encoding_name)
+    chunks = []
+    headings: List[Tuple[int, str]] = []
+    parts: List[Tuple[str, str]] = []
+    part_tokens = 0
+    has_body = False
+
+    def heading_path() -> List[str]:
+        return [title for _, title in headings]
+
+    def flush():
+        nonlocal parts, part_tokens, has_body
+        if parts and has_body:
+            chunks.append({"text": _join_parts(parts), "heading_path": heading_path()})
+        parts, part_tokens, has_body = [], 0, False
+
+    def add_body(element_type: str, text: str, n_tokens: int):
+        nonlocal parts, part_tokens, has_body
+        if part_tokens + SEPARATOR_TOKENS + n_tokens > max_tokens:
+            if has_body:
+                flush()
+            else:
+                # Pending headings don't fit next to the element, they are kept in heading_path only
+                parts, part_tokens = [], 0
+        part_tokens += n_tokens + (SEPARATOR_TOKENS if parts else 0)
+        parts.append((element_type, text))
+        has_body = True
+        if part_tokens >= target_tokens:
+            flush()
+
+    for element in elements:
+        text = (element.get("text") or "").strip()
+        if not text:
+            continue
+        element_type = element.get("type") or "NarrativeText"
+        n_tokens = len(encoding.encode(text, disallowed_special=()))
+        if element_type == "ListItem":
+            n_tokens += LIST_MARKER_TOKENS
+
+        if element_type == "Title":
+            if has_body:
+                flush()
+            depth = element.get("depth") or 0
+            while headings and headings[-1][0] >= depth:
+                headings.pop()
+            headings.append((depth, text))
+            part_tokens += n_tokens + (SEPARATOR_TOKENS if parts else 0)
+            parts.append((element_type, text))
+        elif n_tokens > max_tokens - SEPARATOR_TOKENS:
+            marker_tokens = LIST_MARKER_TOKENS if element_type == "ListItem" else 0
+            piece_budget = max_tokens - SEPARATOR_TOKENS - marker_tokens
+            for piece in chunk_text(text, min(target_tokens, piece_budget), piece_budget, 0, encoding_name):
+                add_body(element_type, piece, len(encoding.encode(piece, disallowed_special=())) + marker_tokens)
+        else:
+            add_body(element_type, text, n_tokens)
+
+    if parts and not has_body and not chunks:
+        # A document made of headings only is still indexed
+        has_body = True
+    flush()
+
+    return chunks
@@ -0,0 +1,102 @@
+import sys
+import time
+from typing import List, Dict, Any, Callable
+
+import numpy as np
+
+from chunking import chunk_text, chunk_elements, DEFAULT_MAX_TOKENS
+from data_uploading import process_markdown_files, resolve_data_folder
+from token_utils import count_tokens
+
+
+def chunk_text_by_characters(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """The previous character based chunker of data_uploading.py, kept as the benchmark baseline"""
+    if len(text) <= chunk_size:
+        return [text]
+
+    chunks = []
+    start = 0
+
+    while start < len(text):
+        end = start + chunk_size
+        if end >= len(text):
+            chunks.append(text[start:])
+            break
+
+        chunk = text[start:end]
+
+        last_sentence = chunk.rfind('.')
+        last_newline = chunk.rfind('\n')
+
+        break_point = max(last_sentence, last_newline)
+        if break_point > start + chunk_size // 2:
+            chunk = text[start:break_point + 1]
+            end = break_point + 1
+
+        chunks.append(chunk)
+        start = end - overlap
+
+    return chunks
+
+
+def benchmark_chunker(name: str, chunker: Callable[[Dict], List[str]], documents: List[Dict],
+                      max_tokens: int = DEFAULT_MAX_TOKENS, repeat: int = 3) -> Dict[str, Any]:
+    """
+    Measure the throughput of a chunker (best of repeat runs) and the distribution of the
+    number of chunks per document and of the chunk sizes in tokens.
+
+    Args:
+        chunker: Function returning the chunk texts of a parsed document
+    """
+    texts = [document["text"] for document in documents]
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunked = [chunker(document) for document in documents]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    chunk_tokens = np.asarray([count_tokens(chunk) for chunks in chunked for chunk in chunks])
+    chunks_per_document = np.asarray([len(chunks) for chunks in chunked])
+    document_tokens = sum(count_tokens(text) for text in texts)
+    megabytes = sum(len(text.encode("utf-8")) for text in texts) / 1e6
+
+    return {
+        "chunker": name,
+        "seconds": best,
+        "mb_per_second": megabytes / best if best > 0 else float("inf"),
+        "chunks": int(chunk_tokens.size),
+        "chunks_per_document_mean": float(chunks_per_document.mean()),
+        "chunks_per_document_max": int(chunks_per_document.max()),
+        "tokens_p5": float(np.percentile(chunk_tokens, 5)),
+        "tokens_p50": float(np.percentile(chunk_tokens, 50)),
+        "tokens_p95": float(np.percentile(chunk_tokens, 95)),
+        "tokens_max": int(chunk_tokens.max()),
+        "over_max_tokens": float((chunk_tokens > max_tokens).mean()),
+        # Tokens embedded per token of source text, overlap makes it larger than 1
+        "token_overhead": float(chunk_tokens.sum() / document_tokens) if document_tokens else 0.0
+    }
+
+
+if __name__ == "__main__":
+    data_folder = sys.argv[1] if len(sys.argv) > 1 else resolve_data_folder()
+    if data_folder is None:
+        sys.exit(1)
+
+    documents = [document for document in process_markdown_files(data_folder) if document["text"].strip()]
+    print(f"Benchmarking on {len(documents)} documents of {data_folder}\n")
+
+    rows = [
+        benchmark_chunker("characters (1000/200)", lambda document: chunk_text_by_characters(document["text"]),
+                          documents),
+        benchmark_chunker("tokens", lambda document: chunk_text(document["text"]), documents),
+        benchmark_chunker("sections", lambda document: [chunk["text"] for chunk in chunk_elements(document["elements"])],
+                          documents)
+    ]
+    print(f"{'Chunker':<22} {'MB/s':>7} {'Chunks':>7} {'Per doc':>8} {'Max/doc':>8} {'p5':>6} {'p50':>6} "
+          f"{'p95':>6} {'Max':>6} {f'>{DEFAULT_MAX_TOKENS}':>6} {'Overhead':>9}")
+    for row in rows:
+        print(f"{row['chunker']:<22} {row['mb_per_second']:>7.2f} {row['chunks']:>7} "
+              f"{row['chunks_per_document_mean']:>8.2f} {row['chunks_per_document_max']:>8} "
+              f"{row['tokens_p5']:>6.0f} {row['tokens_p50']:>6.0f} {row['tokens_p95']:>6.0f} {row['tokens_max']:>6} "
+              f"{row['over_max_tokens']:>6.1%} {row['token_overhead']:>9.2f}")
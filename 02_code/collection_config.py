@@ -0,0 +1,212 @@
+from dataclasses import dataclass, field, replace
+from typing import Optional, Dict, Any, List, Union
+
+from qdrant_client.models import (
+    BinaryQuantization, BinaryQuantizationConfig, CompressionRatio, Distance, HnswConfigDiff,
+    ProductQuantization, ProductQuantizationConfig, QuantizationSearchParams, ScalarQuantization,
+    ScalarQuantizationConfig, ScalarType, SearchParams, VectorParams, SparseVectorParams, Modifier
+)
+
+QUANTIZATION_TYPES = (None, "scalar", "binary", "product")
+
+# The dense vector is the collection's default (unnamed) vector, the BM25 sparse vector is named
+DENSE_VECTOR_NAME = ""
+SPARSE_VECTOR_NAME = "bm25"
+
+# Two-stage (Matryoshka) collections store the dense vector twice, under these names
+FULL_VECTOR_NAME = "full"
+MINI_VECTOR_NAME = "mini"
+
+# Payload fields written by data_uploading.py that searches can be restricted on
+DEFAULT_PAYLOAD_INDEXES = {
+    "file_name": "keyword",
+    "file_path": "keyword",
+    "folder": "keyword",
+    "version": "keyword",
+    "chunk_index": "integer"
+}
+
+# Qdrant's default HNSW parameters
+DEFAULT_HNSW_M = 16
+DEFAULT_HNSW_EF_CONSTRUCT = 100
+
+
+@dataclass
+class CollectionConfig:
+    """
+    Storage and index settings of a Qdrant collection.
+
+    Args:
+        quantization: None, "scalar" (int8), "binary" (1 bit per dimension) or "product"
+        product_compression: Compression ratio of product quantization (x4, x8, x16, x32, x64)
+        quantization_always_ram: Keep the quantized vectors in RAM even if the originals are on disk
+        on_disk_vectors: Store the original float32 vectors on disk (memory-mapped) instead of RAM
+        on_disk_payload: Store payloads on disk instead of RAM
+        hnsw_m: Number of edges per node of the HNSW graph
+        hnsw_ef_construct: Size of the candidate list while building the HNSW graph
+        payload_indexes: Payload fields to index, mapped to their schema ('keyword', 'integer', 'float', ...)
+        sparse: Add a BM25 sparse vector next to the dense one, for sparse and hybrid search
+        mini_dimensions: Also store the first mini_dimensions dimensions of each embedding (renormalized)
+            as a small in-RAM vector. Dense searches then find mini_oversampling * limit candidates with
+            the small vector and rescore them with the full one, which has no HNSW graph of its own.
+            Only meaningful for Matryoshka embeddings such as text-embedding-3-*
+        mini_oversampling: Number of first-stage candidates per requested result
+    """
+    quantization: Optional[str] = None
+    product_compression: str = "x16"
+    quantization_always_ram: bool = True
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+    hnsw_m: Optional[int] = None
+    hnsw_ef_construct: Optional[int] = None
+    payload_indexes: Dict[str, str] = field(default_factory=lambda: dict(DEFAULT_PAYLOAD_INDEXES))
+    sparse: bool = False
+    mini_dimensions: Optional[int] = None
+    mini_oversampling: float = 8.0
+
+    def __post_init__(self):
+        if self.quantization not in QUANTIZATION_TYPES:
+            raise ValueError(f"Unknown quantization {self.quantization!r}, expected one of {QUANTIZATION_TYPES}")
+        if self.mini_dimensions is not None and self.mini_dimensions <= 0:
+            raise ValueError(f"mini_dimensions must be positive, got {self.mini_dimensions}")
+
+    @property
+    def dense_vector_name(self) -> str:
+        return FULL_VECTOR_NAME if self.mini_dimensions else DENSE_VECTOR_NAME
+
+    def vectors_config(self, vector_size: int) -> Union[VectorParams, Dict[str, VectorParams]]:
+        if not self.mini_dimensions:
+            return VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=self.on_disk_vectors or None)
+        if self.mini_dimensions >= vector_size:
+            raise ValueError(f"mini_dimensions ({self.mini_dimensions}) must be smaller than the vector size ({vector_size})")
+
+        # The full vector is only used to rescore first-stage candidates, so it gets no HNSW graph (m=0)
+        return {
+            FULL_VECTOR_NAME: VectorParams(size=vector_size, distance=Distance.COSINE,
+                                           on_disk=self.on_disk_vectors or None, hnsw_config=HnswConfigDiff(m=0)),
+            MINI_VECTOR_NAME: VectorParams(size=self.mini_dimensions, distance=Distance.COSINE)
+        }
+
+    def sparse_vectors_config(self) -> Optional[Dict[str, SparseVectorParams]]:
+        if not self.sparse:
+            return None
+        # Qdrant computes the IDF part of BM25 from the collection statistics at query time
+        return {SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)}
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return ScalarQuantization(scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8, quantile=0.99, always_ram=self.quantization_always_ram
+            ))
+        if self.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=self.quantization_always_ram))
+        if self.quantization == "product":
+            return ProductQuantization(product=ProductQuantizationConfig(
+                compression=CompressionRatio(self.product_compression), always_ram=self.quantization_always_ram
+            ))
+        return None
+
+    def hnsw_config(self) -> Optional[HnswConfigDiff]:
+        if self.hnsw_m is None and self.hnsw_ef_construct is None:
+            return None
+        return HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def estimate_memory(self, vector_size: int, num_points: int = 1_000_000,
+                        avg_payload_bytes: int = 2048) -> Dict[str, float]:
+        """
+        Estimate RAM and disk use of the collection, following the sizing rules of the Qdrant docs
+        (computed from the configuration, not measured on a collection):
+        float32 originals take 4 bytes per dimension, int8 scalar quantization 1 byte, binary 1 bit,
+        product quantization 4 bytes / compression ratio, and the HNSW graph about 2 * m links of
+        4 bytes per point on its base layer.
+
+        Returns:
+            Dictionary with 'estimated_ram_bytes' and 'estimated_disk_bytes'
+        """
+        original_bytes = num_points * vector_size * 4
+        # The mini vectors of two-stage collections stay in RAM and carry the only dense HNSW graph
+        mini_bytes = num_points * self.mini_dimensions * 4 if self.mini_dimensions else 0
+        if self.quantization == "scalar":
+            quantized_bytes = num_points * vector_size
+        elif self.quantization == "binary":
+            quantized_bytes = num_points * vector_size / 8
+        elif self.quantization == "product":
+            quantized_bytes = original_bytes / int(self.product_compression[1:])
+        else:
+            quantized_bytes = 0
+        hnsw_bytes = num_points * 2 * (self.hnsw_m or DEFAULT_HNSW_M) * 4 * 1.1
+        payload_bytes = num_points * avg_payload_bytes
+
+        ram = hnsw_bytes + mini_bytes
+        disk = original_bytes + quantized_bytes + hnsw_bytes + payload_bytes + mini_bytes
+        ram += 0 if self.on_disk_vectors else original_bytes
+        ram += quantized_bytes if (self.quantization_always_ram or not self.on_disk_vectors) else 0
+        ram += 0 if self.on_disk_payload else payload_bytes
+
+        return {"estimated_ram_bytes": ram, "estimated_disk_bytes": disk}
+
+
+def match_collection_layout(config: CollectionConfig, params) -> CollectionConfig:
+    """
+    Return config with the vector layout of an existing collection (its CollectionParams): whether it
+    has the full/mini pair and the sparse vector. A collection created elsewhere, e.g. with
+    mini_dimensions, is then written and searched with the vector names it really has.
+    """
+    vectors = params.vectors if isinstance(params.vectors, dict) else {}
+    mini = vectors.get(MINI_VECTOR_NAME) if FULL_VECTOR_NAME in vectors else None
+    sparse = bool(params.sparse_vectors) and SPARSE_VECTOR_NAME in params.sparse_vectors
+    mini_dimensions = mini.size if mini is not None else None
+    if mini_dimensions == config.mini_dimensions and sparse == config.sparse:
+        return config
+    return replace(config, mini_dimensions=mini_dimensions, sparse=sparse)
+
+
+def build_search_params(hnsw_ef: Optional[int] = None, rescore: Optional[bool] = None,
+                        oversampling: Optional[float] = None) -> Optional[SearchParams]:
+    """
+    Build Qdrant search parameters.
+    rescore re-ranks the candidates found with the quantized vectors using the original vectors, and
+    oversampling fetches oversampling * limit candidates before rescoring.
+    """
+    if hnsw_ef is None and rescore is None and oversampling is None:
+        return None
+
+    quantization = None
+    if rescore is not None or oversampling is not None:
+        quantization = QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+
+    return SearchParams(hnsw_ef=hnsw_ef, quantization=quantization)
+
+
+REPORT_CONFIGS = {
+    "float32 in RAM": CollectionConfig(),
+    "float32 on disk": CollectionConfig(on_disk_vectors=True, on_disk_payload=True),
+    "scalar int8, originals on disk": CollectionConfig(quantization="scalar", on_disk_vectors=True, on_disk_payload=True),
+    "product x16, originals on disk": CollectionConfig(quantization="product", on_disk_vectors=True, on_disk_payload=True),
+    "binary, originals on disk": CollectionConfig(quantization="binary", on_disk_vectors=True, on_disk_payload=True),
+    "binary, m=8, originals on disk": CollectionConfig(quantization="binary", on_disk_vectors=True,
+                                                       on_disk_payload=True, hnsw_m=8),
+    "256-d mini + full on disk": CollectionConfig(mini_dimensions=256, on_disk_vectors=True, on_disk_payload=True),
+}
+
+
+def memory_report(vector_size: int = 1536, num_points: int = 1_000_000, avg_payload_bytes: int = 2048,
+                  configs: Dict[str, CollectionConfig] = None) -> List[Dict[str, Any]]:
+    """Estimate the RAM and disk use per num_points points under each configuration, nothing is measured"""
+    configs = configs or REPORT_CONFIGS
+    rows = []
+    for name, config in configs.items():
+        estimate = config.estimate_memory(vector_size, num_points, avg_payload_bytes)
+        rows.append({"config": name, **estimate})
+    return rows
+
+
+if __name__ == "__main__":
+    print("Estimated memory per 1M points of 1536-dim text-embedding-3-small vectors (2 KB payload):")
+    print(f"{'Configuration':<36} {'Est. RAM (GB)':>14} {'Est. disk (GB)':>15}")
+    for row in memory_report():
+        print(f"{row['config']:<36} {row['estimated_ram_bytes'] / 1e9:>14.2f} "
+              f"{row['estimated_disk_bytes'] / 1e9:>15.2f}")
+    print("\nThese are estimates from the Qdrant sizing rules, measure a loaded collection before sizing a server.")
+    print("\nQuantized collections trade recall for memory, search them with rescore=True and "
+          "oversampling (e.g. 2.0 for scalar, 3.0 for binary) to recover most of it.")
@@ -1,44 +1,146 @@
 import os
 import glob
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
-from unstructured.partition.md import partition_md
-from vectordb import VectorDB
-from typing import List, Dict
+from chunking import chunk_text, chunk_elements
+from embedders import paced_embedder
+from markdown_parser import parse_markdown_elements
+from typing import List, Dict, Optional, Iterator, Tuple, TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from checkpoint import UploadCheckpoint
+    from vectordb import VectorDB
 
-def process_markdown_files(folder_path: str) -> List[Dict]:
+# (file_path, document or None, error message or None)
+ParseResult = Tuple[str, Optional[Dict], Optional[str]]
+
+# Number of files parsed per task sent to a worker process
+PARSE_CHUNK_SIZE = 8
+
+# "markdown-it" parses .md files with the fast CommonMark parser, "unstructured" with partition_md.
+# Files of other formats always go through unstructured
+PARSERS = ("markdown-it", "unstructured")
+DEFAULT_PARSER = "markdown-it"
+
+# Recorded in the ingestion manifest, bump it when the chunkers change so that every file is re-chunked
+CHUNKER_VERSION = "3"
+
+
+def _partition_with_unstructured(file_path: str) -> List[Dict]:
+    # unstructured takes seconds to import, so it is only loaded once a file needs it
+    if file_path.endswith(".md"):
+        from unstructured.partition.md import partition_md as partition
+    else:
+        from unstructured.partition.auto import partition
+
+    structure = []
+    for element in partition(filename=file_path):
+        if hasattr(element, 'text') and element.text.strip():
+            structure.append({
+                "type": getattr(element, "category", None),
+                "text": element.text.strip(),
+                "depth": getattr(element.metadata, "category_depth", None)
+            })
+    return structure
+
+
+def _parse_markdown_file(file_path: str, parser: str = DEFAULT_PARSER) -> Optional[Dict]:
     """
-    Process markdown files from given folder using unstructured library
+    Parse one markdown file into a document, None if it has no text.
+    Besides the joined text, the document keeps its elements (type, text and heading depth)
+    for the structure preserving chunker.
     """
-    documents = []
-    md_files = glob.glob(os.path.join(folder_path, "**/*.md"), recursive=True)
-
-    for file_path in md_files:
+    if parser == "markdown-it" and file_path.endswith(".md"):
+        with open(file_path, "r", encoding="utf-8") as f:
+            structure = parse_markdown_elements(f.read())
+    else:
+        structure = _partition_with_unstructured(file_path)
+
+    text_content = [element["text"] for element in structure if element["text"].strip()]
+    if not text_content:
+        return None
+
+    metadata = {
+        "file_path": file_path,
+        "file_name": os.path.basename(file_path),
+        "folder": os.path.dirname(file_path),
+        "version": extract_version_from_path(file_path)
+    }
+
+    return {
+        "text": "\n".join(text_content),
+        "metadata": metadata,
+        "elements": structure
+    }
+
+
+def _parse_markdown_files(file_paths: List[str], parser: str = DEFAULT_PARSER) -> List[ParseResult]:
+    """Parse a chunk of files in a worker process, a failing file doesn't affect the others"""
+    results = []
+    for file_path in file_paths:
         try:
-            elements = partition_md(filename=file_path)
+            results.append((file_path, _parse_markdown_file(file_path, parser), None))
+        except Exception as e:
+            results.append((file_path, None, f"{type(e).__name__}: {e}"))
+    return results
 
-            text_content = []
-            for element in elements:
-                if hasattr(element, 'text') and element.text.strip():
-                    text_content.append(element.text.strip())
 
-            if text_content:
-                full_text = "\n".join(text_content)
+def iter_markdown_documents(md_files: List[str], workers: Optional[int] = None,
+                            chunk_size: int = PARSE_CHUNK_SIZE, parser: str = DEFAULT_PARSER) -> Iterator[ParseResult]:
+    """
+    Parse markdown files, in a pool of worker processes when workers > 1.
+    Files are submitted in chunks of chunk_size, with at most two chunks per worker in flight,
+    and results are yielded in completion order.
 
-                metadata = {
-                    "file_path": file_path,
-                    "file_name": os.path.basename(file_path),
-                    "folder": os.path.dirname(file_path),
-                    "version": extract_version_from_path(file_path)
-                }
+    Yields:
+        (file_path, document or None, error message or None) per file
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(md_files) <= 1:
+        for file_path in md_files:
+            yield from _parse_markdown_files([file_path], parser)
+        return
+
+    chunks = [md_files[start:start + chunk_size] for start in range(0, len(md_files), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        next_chunk = 0
+        while pending or next_chunk < len(chunks):
+            while next_chunk < len(chunks) and len(pending) < 2 * workers:
+                pending[executor.submit(_parse_markdown_files, chunks[next_chunk], parser)] = chunks[next_chunk]
+                next_chunk += 1
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = pending.pop(future)
+                try:
+                    yield from future.result()
+                except Exception as e:
+                    # The worker died (e.g. out of memory), every file of its chunk is reported as failed
+                    for file_path in chunk:
+                        yield file_path, None, f"{type(e).__name__}: {e}"
+
+
+def process_markdown_files(folder_path: str, workers: Optional[int] = None,
+                           chunk_size: int = PARSE_CHUNK_SIZE, parser: str = DEFAULT_PARSER) -> List[Dict]:
+    """
+    Process markdown files from given folder, with markdown-it or the unstructured library.
+    Files are parsed in parallel by worker processes (all cores by default, 1 parses in-process).
+    Files that fail to parse are reported and skipped.
+    """
+    documents = []
+    failures = []
+    md_files = sorted(glob.glob(os.path.join(folder_path, "**/*.md"), recursive=True))
 
-                documents.append({
-                    "text": full_text,
-                    "metadata": metadata
-                })
+    for file_path, document, error in iter_markdown_documents(md_files, workers, chunk_size, parser):
+        if error is not None:
+            print(f"Error processing {file_path}: {error}")
+            failures.append((file_path, error))
+        elif document is not None:
+            documents.append(document)
 
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
+    if failures:
+        print(f"{len(failures)} of {len(md_files)} files failed to parse")
 
     return documents
 
@@ -52,99 +154,211 @@ def extract_version_from_path(file_path: str) -> str:
     return "unknown"
 
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+def chunk_document(document: Dict, enable_chunking: bool = True) -> List[Dict]:
     """
-    Split text into overlapping chunks for better retrieval
+    Split a parsed document into chunk documents carrying its metadata and their position.
+    Documents with parsed elements are chunked by section, with the headings above each chunk
+    in its heading_path metadata, other documents by token count.
     """
-    if len(text) <= chunk_size:
-        return [text]
-
-    chunks = []
-    start = 0
-
-    while start < len(text):
-        end = start + chunk_size
-        if end >= len(text):
-            chunks.append(text[start:])
-            break
-
-        chunk = text[start:end]
-
-        last_sentence = chunk.rfind('.')
-        last_newline = chunk.rfind('\n')
-
-        break_point = max(last_sentence, last_newline)
-        if break_point > start + chunk_size // 2:
-            chunk = text[start:break_point + 1]
-            end = break_point + 1
-
-        chunks.append(chunk)
-        start = end - overlap
-
-    return chunks
-
-
-def upload_documents_to_qdrant(documents: List[Dict], vector_db: VectorDB, enable_chunking: bool = True):
+    if not enable_chunking:
+        return [{"text": document["text"], "metadata": document["metadata"]}]
+
+    if document.get("elements"):
+        chunks = chunk_elements(document["elements"])
+    else:
+        chunks = [{"text": chunk} for chunk in chunk_text(document["text"])]
+
+    chunk_documents = []
+    for i, chunk in enumerate(chunks):
+        chunk_metadata = document["metadata"].copy()
+        chunk_metadata["chunk_index"] = i
+        chunk_metadata["total_chunks"] = len(chunks)
+        if "heading_path" in chunk:
+            chunk_metadata["heading_path"] = chunk["heading_path"]
+        chunk_documents.append({"text": chunk["text"], "metadata": chunk_metadata})
+    return chunk_documents
+
+
+def upload_documents_to_qdrant(documents: List[Dict], vector_db: "VectorDB", enable_chunking: bool = True,
+                               batch_size: int = 1000, incremental: bool = True,
+                               checkpoint: "UploadCheckpoint" = None, resume: bool = False,
+                               retry_failed: bool = False):
     """
-    Upload processed documents to Qdrant vector database
+    Upload processed documents to Qdrant vector database.
+    Chunks are collected and sent to the vector db in batches, so that embeddings and upserts
+    are done with a few bulk requests instead of one round trip per chunk.
+
+    Point ids are derived from (file_path, chunk_index, content hash), so with incremental=True
+    chunks already in the collection are skipped, and points of the uploaded files whose chunks
+    no longer exist are deleted. Re-running the upload on an unchanged corpus embeds nothing.
+    OpenAI embedding requests are paced to the default budgets of embedding_scheduler.py.
+
+    Args:
+        batch_size: Number of chunks embedded and stored per batch
+        checkpoint: Log of the stored and failed chunks. It is written once per batch of batch_size chunks,
+            so an interrupted upload redoes at most the batch that was in progress when it is resumed
+        resume: Continue the run recorded in the checkpoint, skipping the chunks it completed,
+            otherwise the checkpoint is cleared first
+        retry_failed: Only upload the chunks the checkpoint recorded as failed
+
+    Returns:
+        Number of chunks uploaded
     """
     uploaded_count = 0
 
+    chunk_documents = []
     for doc in documents:
+        chunk_documents.extend(chunk_document(doc, enable_chunking))
+    chunk_ids = vector_db.document_ids(chunk_documents)
+
+    stale_ids = []
+    uploaded_files = {doc["metadata"].get("file_path", "") for doc in chunk_documents}
+    if incremental:
+        existing = vector_db.existing_point_files()
+
+        chunk_id_set = set(chunk_ids)
+        stale_ids = [point_id for point_id, file_paths in existing.items()
+                     if point_id not in chunk_id_set and not uploaded_files.isdisjoint(file_paths)]
+
+        new_chunks = [(doc, point_id) for doc, point_id in zip(chunk_documents, chunk_ids) if point_id not in existing]
+        print(f"{len(chunk_documents) - len(new_chunks)} chunks unchanged, {len(new_chunks)} new or changed, "
+              f"{len(stale_ids)} stale")
+        chunk_documents, chunk_ids = [doc for doc, _ in new_chunks], [point_id for _, point_id in new_chunks]
+
+    if checkpoint is not None:
+        if retry_failed:
+            selected = [i for i, point_id in enumerate(chunk_ids) if point_id in checkpoint.failed]
+            print(f"Retrying {len(selected)} of {len(checkpoint.failed)} failed chunks")
+        elif resume:
+            selected = [i for i, point_id in enumerate(chunk_ids) if point_id not in checkpoint.completed]
+            print(f"Resuming: {len(chunk_ids) - len(selected)} chunks already uploaded, {len(selected)} left")
+        else:
+            checkpoint.clear()
+            selected = range(len(chunk_ids))
+        chunk_documents = [chunk_documents[i] for i in selected]
+        chunk_ids = [chunk_ids[i] for i in selected]
+
+    # Paced like the ingestion pipeline, without slowing down queries of the vector db meanwhile
+    embedder = paced_embedder(vector_db.embedder)
+    scheduler = getattr(embedder, "scheduler", None)
+
+    failed = False
+    try:
+        for start in range(0, len(chunk_documents), batch_size):
+            batch = chunk_documents[start:start + batch_size]
+            batch_ids = chunk_ids[start:start + batch_size]
+            try:
+                vector_db.add_documents(batch, save_sparse=False, embedder=embedder)
+                uploaded_count += len(batch)
+            except Exception as e:
+                failed = True
+                file_names = sorted({doc["metadata"].get("file_name", "unknown") for doc in batch})
+                print(f"Error uploading batch of {len(batch)} chunks from {file_names}: {e}")
+                if checkpoint is not None:
+                    checkpoint.record_failed(batch, batch_ids, e)
+                continue
+            if checkpoint is not None:
+                checkpoint.record_completed(batch_ids)
+    except KeyboardInterrupt:
+        if checkpoint is not None:
+            print(f"Interrupted after {uploaded_count} chunks, run again with --resume to continue")
+        raise
+    finally:
+        # The sparse vocabulary is saved once, also when the upload was interrupted
+        vector_db.save_sparse_encoder()
+
+    if scheduler is not None:
+        scheduler.print_report()
+
+    if checkpoint is not None and checkpoint.failed:
+        failed = True
+        print(f"{len(checkpoint.failed)} chunks failed, run again with --retry-failed to retry them:")
+        checkpoint.print_failures()
+
+    # Old versions of changed chunks are only removed once their replacements are stored. Points
+    # shared with files that were not uploaded only lose the sources of the uploaded files
+    if stale_ids and not failed:
         try:
-            text = doc["text"]
-            metadata = doc["metadata"]
-
-            if enable_chunking:
-                chunks = chunk_text(text)
-                for i, chunk in enumerate(chunks):
-                    chunk_metadata = metadata.copy()
-                    chunk_metadata["chunk_index"] = i
-                    chunk_metadata["total_chunks"] = len(chunks)
-
-                    vector_db.add_document(chunk, chunk_metadata)
-                    uploaded_count += 1
-            else:
-                vector_db.add_document(text, metadata)
-                uploaded_count += 1
-
+            unreferenced = vector_db.release_files(stale_ids, uploaded_files)
+            vector_db.delete_documents(unreferenced)
+            print(f"Deleted {len(unreferenced)} stale chunks, {len(stale_ids) - len(unreferenced)} still shared "
+                  f"with other files")
         except Exception as e:
-            print(f"Error uploading document {metadata.get('file_name', 'unknown')}: {e}")
+            print(f"Error deleting stale chunks: {e}")
 
     return uploaded_count
 
 
+def resolve_data_folder(data_folder: str = "data/docs/qdrant/v1.2.x") -> Optional[str]:
+    """Return data_folder, or the first available documentation version if it doesn't exist"""
+    if os.path.exists(data_folder):
+        return data_folder
+
+    available_versions = []
+    base_path = os.path.dirname(data_folder)
+    if os.path.exists(base_path):
+        available_versions = sorted(d for d in os.listdir(base_path)
+                                    if os.path.isdir(os.path.join(base_path, d)))
+
+    if available_versions:
+        print(f"{os.path.basename(data_folder)} not found. Available versions: {available_versions}")
+        data_folder = os.path.join(base_path, available_versions[0])
+        print(f"Using {data_folder} instead")
+        return data_folder
+
+    print(f"No Qdrant documentation found in {base_path}/")
+    return None
+
+
 def main():
     """
-    Main function to process and upload Qdrant documentation
+    Main function to process and upload Qdrant documentation.
+    The files are streamed through the ingestion pipeline, see ingestion_pipeline.py for its settings.
+    With --checkpoint, --resume or --retry-failed they are uploaded in batches instead, with every stored
+    and failed chunk logged to a checkpoint so that an interrupted upload can be continued. The pipeline
+    doesn't use the checkpoint: it resumes per file through its manifest.
     """
-    data_folder = "data/docs/qdrant/v1.2.x"
-
-    if not os.path.exists(data_folder):
-        available_versions = []
-        base_path = "data/docs/qdrant"
-        if os.path.exists(base_path):
-            available_versions = [d for d in os.listdir(base_path)
-                                if os.path.isdir(os.path.join(base_path, d))]
-
-        if available_versions:
-            print(f"v1.2.x not found. Available versions: {available_versions}")
-            data_folder = f"data/docs/qdrant/{available_versions[0]}"
-            print(f"Using {data_folder} instead")
-        else:
-            print("No Qdrant documentation found in data/docs/qdrant/")
-            return
+    import argparse
+    from checkpoint import UploadCheckpoint
+    from ingestion_pipeline import IngestionPipeline
+    from vectordb import VectorDB
+
+    parser = argparse.ArgumentParser(
+        description="Process and upload the Qdrant documentation",
+        epilog="Without the checkpoint options the files are streamed through the ingestion pipeline, which "
+               "keeps no chunk level checkpoint: an interrupted run is continued by running it again, the "
+               "manifest skips the files that were completely stored")
+    parser.add_argument("folder", nargs="?", default=None)
+    parser.add_argument("--collection", default="documents")
+    parser.add_argument("--checkpoint", action="store_true", help="Upload in batches (not through the pipeline) and log the stored and failed chunks after every batch")
+    parser.add_argument("--resume", action="store_true", help="Continue the last checkpointed upload")
+    parser.add_argument("--retry-failed", action="store_true", help="Only upload the chunks that failed last time")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="Chunks per batch, also the granularity of the checkpoint")
+    args = parser.parse_args()
+
+    data_folder = args.folder or resolve_data_folder()
+    if data_folder is None:
+        return
 
     print(f"Processing markdown files from: {data_folder}")
+    vector_db = VectorDB(collection_name=args.collection)
 
-    documents = process_markdown_files(data_folder)
-    print(f"Processed {len(documents)} documents")
-
-    vector_db = VectorDB()
+    if not (args.checkpoint or args.resume or args.retry_failed):
+        summary = IngestionPipeline(vector_db).run(data_folder)
+        print(f"Uploaded {summary['upsert']} document chunks to Qdrant")
+        return
 
-    uploaded_count = upload_documents_to_qdrant(documents, vector_db, enable_chunking=True)
-    print(f"Uploaded {uploaded_count} document chunks to Qdrant")
+    checkpoint = UploadCheckpoint.for_collection(args.collection)
+    try:
+        documents = process_markdown_files(data_folder)
+        uploaded_count = upload_documents_to_qdrant(documents, vector_db, batch_size=args.batch_size,
+                                                    checkpoint=checkpoint, resume=args.resume,
+                                                    retry_failed=args.retry_failed)
+        print(f"Uploaded {uploaded_count} document chunks to Qdrant")
+    finally:
+        checkpoint.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+import numpy as np
+
+DEFAULT_DEDUP_DIR = os.getenv("DEDUP_INDEX_DIR", ".cache/dedup")
+
+# MinHash signature length and LSH banding: 16 bands of 8 rows find pairs above a Jaccard
+# similarity of about (1/16)^(1/8) = 0.7 with high probability
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16
+SHINGLE_WORDS = 3
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.9
+
+# Mersenne prime of the universal hash functions (a * x + b) mod p, the products fit in 64 bits
+_PRIME = (1 << 31) - 1
+
+# Metadata fields kept for each source of a point in its 'sources' payload
+SOURCE_FIELDS = ("file_path", "file_name", "folder", "version", "chunk_index")
+
+# Fields search filters on: a point with several sources holds the values of all of them as an array,
+# which Qdrant matches if any element matches, so filtering on any source finds the point
+SHARED_FIELDS = ("file_path", "file_name", "folder", "version")
+
+
+def sources_payload(sources: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Payload fields of a point standing for the given sources (metadata dictionaries, first source first):
+    the fields of the first source at the top level (as for any point) and every source in 'sources'.
+    With several sources the SHARED_FIELDS hold the distinct values of all sources instead.
+    """
+    payload = {
+        **sources[0],
+        "sources": [{field: source.get(field) for field in SOURCE_FIELDS} for source in sources]
+    }
+    if len(sources) > 1:
+        for field in SHARED_FIELDS:
+            values = list(dict.fromkeys(source[field] for source in sources if source.get(field) is not None))
+            if values:
+                payload[field] = values
+    return payload
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def normalized_hash(text: str) -> str:
+    """Hash of the text with case and whitespace differences removed"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class MinHasher:
+    """MinHash signatures of the word shingles of a text, with LSH band keys for candidate lookup"""
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, bands: int = LSH_BANDS,
+                 shingle_words: int = SHINGLE_WORDS, seed: int = 1):
+        if num_permutations % bands:
+            raise ValueError("num_permutations must be a multiple of bands")
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, num_permutations, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_permutations, dtype=np.uint64)
+        self.bands = bands
+        self.shingle_words = shingle_words
+
+    def signature(self, text: str) -> np.ndarray:
+        words = normalize_text(text).split()
+        n = self.shingle_words
+        shingles = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64,
+                             count=len(shingles))
+        values = (hashes[:, None] * self._a[None, :] + self._b[None, :]) % _PRIME
+        return values.min(axis=0).astype(np.uint32)
+
+    def band_keys(self, signature: np.ndarray) -> List[str]:
+        rows = len(signature) // self.bands
+        return [
+            f"{band}:{hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).hexdigest()}"
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def similarity(a: np.ndarray, b: np.ndarray) -> float:
+        """Estimated Jaccard similarity of the shingle sets"""
+        return float(np.mean(a == b))
+
+
+class DedupIndex:
+    """
+    Persistent index of the chunks stored in a collection, used to suppress duplicates before embedding.
+    Exact duplicates (after case and whitespace normalization) are found by hash, near duplicates with
+    MinHash LSH and a similarity threshold (None disables them). Near duplicates are only merged within
+    a version, so a search in one version never returns the slightly different text of another.
+
+    It also records the sources (file_path, chunk_index) that every point stands for, so that a point
+    shared by several files is only deleted once none of them references it anymore.
+    """
+    def __init__(self, path: str, near_duplicate_threshold: Optional[float] = DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+                 minhasher: MinHasher = None):
+        self.path = path
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.minhasher = minhasher or MinHasher()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                point_id TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                signature BLOB,
+                pending INTEGER NOT NULL DEFAULT 0,
+                version TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_content_hash ON chunks(content_hash);
+            CREATE TABLE IF NOT EXISTS bands (
+                band_key TEXT NOT NULL,
+                point_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_bands_band_key ON bands(band_key);
+            CREATE INDEX IF NOT EXISTS idx_bands_point_id ON bands(point_id);
+            CREATE TABLE IF NOT EXISTS sources (
+                file_path TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                point_id TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                PRIMARY KEY (file_path, chunk_index)
+            );
+            CREATE INDEX IF NOT EXISTS idx_sources_point_id ON sources(point_id);
+        """)
+        columns = {name for _, name, *_ in self._conn.execute("PRAGMA table_info(chunks)")}
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN version TEXT")
+        # Points still pending were never confirmed as stored, e.g. the run was interrupted
+        self._conn.execute("DELETE FROM bands WHERE point_id IN (SELECT point_id FROM chunks WHERE pending = 1)")
+        self._conn.execute("DELETE FROM chunks WHERE pending = 1")
+        self._conn.commit()
+
+    @classmethod
+    def for_collection(cls, collection_name: str, directory: str = DEFAULT_DEDUP_DIR,
+                       near_duplicate_threshold: Optional[float] = DEFAULT_NEAR_DUPLICATE_THRESHOLD) -> "DedupIndex":
+        return cls(os.path.join(directory, f"{collection_name}.sqlite"), near_duplicate_threshold)
+
+    def fingerprint(self, text: str) -> Tuple[str, Optional[np.ndarray]]:
+        """Return the normalized hash and (if near duplicates are enabled) the MinHash signature of a text"""
+        signature = self.minhasher.signature(text) if self.near_duplicate_threshold is not None else None
+        return normalized_hash(text), signature
+
+    def find(self, content_hash: str, signature: Optional[np.ndarray], exclude_file: str = None,
+             version: str = None) -> Optional[str]:
+        """
+        Return the id of a stored or pending point that duplicates the text, or None.
+        Near duplicates must have been added with the same version. Stored near duplicates whose only
+        sources are exclude_file are ignored: they are usually the previous version of the chunk being
+        re-ingested, which must be replaced rather than reused.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT point_id FROM chunks WHERE content_hash = ? LIMIT 1",
+                                     (content_hash,)).fetchone()
+            if row is not None:
+                return row[0]
+            if signature is None:
+                return None
+
+            keys = self.minhasher.band_keys(signature)
+            candidates = self._conn.execute(
+                f"SELECT DISTINCT c.point_id, c.signature, c.pending FROM bands b "
+                f"JOIN chunks c ON c.point_id = b.point_id WHERE b.band_key IN ({','.join('?' * len(keys))}) "
+                f"AND c.version IS ?", (*keys, version)
+            ).fetchall()
+
+            best, best_similarity = None, self.near_duplicate_threshold
+            for point_id, blob, pending in candidates:
+                similarity = MinHasher.similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+                if similarity >= best_similarity and (pending or self._has_other_source(point_id, exclude_file)):
+                    best, best_similarity = point_id, similarity
+            return best
+
+    def _has_other_source(self, point_id: str, file_path: Optional[str]) -> bool:
+        if file_path is None:
+            return True
+        row = self._conn.execute("SELECT 1 FROM sources WHERE point_id = ? AND file_path != ? LIMIT 1",
+                                 (point_id, file_path)).fetchone()
+        return row is not None
+
+    def add(self, point_id: str, content_hash: str, signature: Optional[np.ndarray], pending: bool = False,
+            version: str = None):
+        """
+        Register a point of the given version as the canonical copy of its text.
+        A pending point is about to be stored: it is already offered as a duplicate, but forgotten when
+        the index is reopened unless confirm() was called once it is stored.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunks (point_id, content_hash, signature, pending, version) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (point_id, content_hash, signature.tobytes() if signature is not None else None, int(pending), version)
+            )
+            self._conn.execute("DELETE FROM bands WHERE point_id = ?", (point_id,))
+            if signature is not None:
+                self._conn.executemany("INSERT INTO bands (band_key, point_id) VALUES (?, ?)",
+                                       [(key, point_id) for key in self.minhasher.band_keys(signature)])
+            self._conn.commit()
+
+    def confirm(self, point_ids: Iterable[str]):
+        """Mark pending points as stored"""
+        with self._lock:
+            self._conn.executemany("UPDATE chunks SET pending = 0 WHERE point_id = ?",
+                                   [(point_id,) for point_id in point_ids])
+            self._conn.commit()
+
+    def remove(self, point_ids: Iterable[str]):
+        """Forget points (e.g. deleted ones), they are no longer offered as duplicates"""
+        point_ids = [(point_id,) for point_id in point_ids]
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE point_id = ?", point_ids)
+            self._conn.executemany("DELETE FROM bands WHERE point_id = ?", point_ids)
+            self._conn.commit()
+
+    def replace_sources(self, file_path: str, sources: List[Tuple[int, str, Dict[str, Any]]]):
+        """
+        Set the sources of a file to (chunk_index, point_id, metadata) tuples.
+        Rows of chunks that still exist keep their position, so the first source of a point stays first.
+        """
+        with self._lock:
+            indexes = [chunk_index for chunk_index, _, _ in sources]
+            self._conn.execute(
+                f"DELETE FROM sources WHERE file_path = ? AND chunk_index NOT IN ({','.join('?' * len(indexes))})",
+                (file_path, *indexes)
+            )
+            self._conn.executemany(
+                "INSERT INTO sources (file_path, chunk_index, point_id, metadata) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (file_path, chunk_index) DO UPDATE SET point_id = excluded.point_id, "
+                "metadata = excluded.metadata",
+                [(file_path, chunk_index, point_id, json.dumps(metadata)) for chunk_index, point_id, metadata in sources]
+            )
+            self._conn.commit()
+
+    def remove_file(self, file_path: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sources WHERE file_path = ?", (file_path,))
+            self._conn.commit()
+
+    def source_counts(self, point_ids: Iterable[str]) -> Dict[str, int]:
+        """Return the number of sources of each point (0 for unreferenced points)"""
+        point_ids = list(point_ids)
+        counts = dict.fromkeys(point_ids, 0)
+        with self._lock:
+            for start in range(0, len(point_ids), 500):
+                chunk = point_ids[start:start + 500]
+                counts.update(self._conn.execute(
+                    f"SELECT point_id, COUNT(*) FROM sources WHERE point_id IN ({','.join('?' * len(chunk))}) "
+                    f"GROUP BY point_id", chunk
+                ).fetchall())
+        return counts
+
+    def sources(self, point_id: str) -> List[Dict[str, Any]]:
+        """Return the metadata of the sources of a point, oldest first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT metadata FROM sources WHERE point_id = ? ORDER BY rowid",
+                                      (point_id,)).fetchall()
+        return [json.loads(metadata) for (metadata,) in rows]
+
+    def source_payload(self, point_id: str) -> Optional[Dict[str, Any]]:
+        """Payload fields describing where a point comes from (see sources_payload), None if it has no source"""
+        sources = self.sources(point_id)
+        if not sources:
+            return None
+        return sources_payload(sources)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,217 @@
+import asyncio
+import os
+from typing import List, Tuple, Optional
+
+import numpy as np
+
+from embedding_scheduler import EmbeddingScheduler, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from llm_gateway import LLMGateway, get_gateway
+from token_utils import get_encoding, batch_by_token_budget
+
+# OpenAI embeddings endpoint limits (per request and per input)
+MAX_EMBEDDING_BATCH_SIZE = 2048
+MAX_EMBEDDING_BATCH_TOKENS = 300000
+MAX_EMBEDDING_INPUT_TOKENS = 8191
+
+# Default number of texts per forward pass of the local models
+LOCAL_BATCH_SIZE = 64
+
+
+def plan_embedding_batches(texts: List[str]) -> List[Tuple[List[int], List[str], int]]:
+    """
+    Split texts into embeddings requests that respect the per-request input count and token limits.
+    Texts longer than the per-input limit are truncated.
+
+    Returns:
+        List of (indexes into texts, inputs of the request, tokens of the request) tuples
+    """
+    encoding = get_encoding()
+    inputs = []
+    token_counts = []
+    for text in texts:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) > MAX_EMBEDDING_INPUT_TOKENS:
+            tokens = tokens[:MAX_EMBEDDING_INPUT_TOKENS]
+            text = encoding.decode(tokens)
+        inputs.append(text)
+        token_counts.append(len(tokens))
+
+    return [
+        (batch, [inputs[i] for i in batch], sum(token_counts[i] for i in batch))
+        for batch in batch_by_token_budget(token_counts, MAX_EMBEDDING_BATCH_SIZE, MAX_EMBEDDING_BATCH_TOKENS)
+    ]
+
+
+class Embedder:
+    """
+    Turns texts into vectors for VectorDB.
+    model_name and dimensions identify the vector space: they key the embedding caches and are
+    recorded on the collection, so vectors of different models never get mixed.
+    """
+    model_name: str
+    dimensions: int
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed the texts, in the order of the input"""
+        raise NotImplementedError
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Embed the texts without blocking the event loop"""
+        return await asyncio.to_thread(self.embed, texts)
+
+
+class OpenAIEmbedder(Embedder):
+    """
+    Embedder calling the OpenAI embeddings API through the shared LLM gateway.
+    With a scheduler, the requests are paced to its requests and tokens per minute budgets.
+    """
+    def __init__(self, model_name: str = "text-embedding-3-small", dimensions: int = 1536,
+                 gateway: LLMGateway = None, openai_api_key: str = None, scheduler: EmbeddingScheduler = None):
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.gateway = gateway or get_gateway(openai_api_key)
+        self.scheduler = scheduler
+
+    def _request_kwargs(self):
+        # Only text-embedding-3 models accept a reduced number of dimensions
+        return {"dimensions": self.dimensions} if self.model_name.startswith("text-embedding-3") else {}
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with the OpenAI API in as few requests as the API limits allow"""
+        vectors = [None] * len(texts)
+        for batch, inputs, tokens in plan_embedding_batches(texts):
+            response = self.gateway.embed(model=self.model_name, input=inputs, scheduler=self.scheduler,
+                                          tokens=tokens, **self._request_kwargs())
+            for item in response.data:
+                vectors[batch[item.index]] = item.embedding
+
+        return vectors
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with the OpenAI API, sending the batches concurrently"""
+        vectors = [None] * len(texts)
+
+        async def embed_batch(batch: List[int], inputs: List[str], tokens: int):
+            response = await self.gateway.aembed(model=self.model_name, input=inputs, scheduler=self.scheduler,
+                                                 tokens=tokens, **self._request_kwargs())
+            for item in response.data:
+                vectors[batch[item.index]] = item.embedding
+
+        await asyncio.gather(*(embed_batch(batch, inputs, tokens)
+                               for batch, inputs, tokens in plan_embedding_batches(texts)))
+        return vectors
+
+
+def paced_embedder(embedder: Embedder, requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+                   tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE, max_concurrency: int = 16) -> Embedder:
+    """
+    Return an embedder for a bulk load whose requests are paced by its own EmbeddingScheduler.
+    The given embedder is not changed, so the queries embedded with it are never held back by the load.
+    Embedders that are already paced or don't call the API are returned as they are.
+    """
+    if not isinstance(embedder, OpenAIEmbedder) or embedder.scheduler is not None:
+        return embedder
+    scheduler = EmbeddingScheduler(requests_per_minute, tokens_per_minute, max_concurrency=max_concurrency,
+                                   name=embedder.model_name)
+    return OpenAIEmbedder(embedder.model_name, embedder.dimensions, gateway=embedder.gateway, scheduler=scheduler)
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """
+    Local CPU embedder running a sentence-transformers model, e.g. a downloaded all-MiniLM-L6-v2 directory.
+    Needs the optional sentence-transformers package.
+
+    Args:
+        model_path: Local directory (or hub name) of the model
+        model_name: Name recorded on the collection, defaults to the model directory name
+        batch_size: Number of texts per forward pass
+        num_threads: Number of CPU threads used by torch (None keeps torch's default)
+    """
+    def __init__(self, model_path: str, model_name: str = None, batch_size: int = LOCAL_BATCH_SIZE,
+                 num_threads: Optional[int] = None, normalize: bool = True):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("SentenceTransformerEmbedder needs the sentence-transformers package: "
+                              "pip install sentence-transformers") from e
+
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        self.model = SentenceTransformer(model_path, device="cpu")
+        self.model_name = model_name or f"local:{_model_dir_name(model_path)}"
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+        self.normalize = normalize
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        vectors = self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=self.normalize,
+                                    convert_to_numpy=True, show_progress_bar=False)
+        return vectors.astype(np.float32).tolist()
+
+
+class OnnxEmbedder(Embedder):
+    """
+    Local CPU embedder running an ONNX export of a transformer encoder with ONNX Runtime.
+    The model directory must contain model.onnx and the tokenizer.json of the model, the token
+    embeddings are mean pooled over the attention mask. Needs the optional onnxruntime and tokenizers packages.
+
+    Args:
+        model_path: Directory with model.onnx and tokenizer.json
+        model_name: Name recorded on the collection, defaults to the model directory name
+        batch_size: Number of texts per forward pass
+        num_threads: Number of intra-op threads of ONNX Runtime (None uses all cores)
+        max_length: Inputs are truncated to this many tokens
+    """
+    def __init__(self, model_path: str, model_name: str = None, batch_size: int = LOCAL_BATCH_SIZE,
+                 num_threads: Optional[int] = None, max_length: int = 512, normalize: bool = True):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("OnnxEmbedder needs the onnxruntime and tokenizers packages: "
+                              "pip install onnxruntime tokenizers") from e
+
+        options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(os.path.join(model_path, "model.onnx"), options,
+                                                    providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        self.model_name = model_name or f"local:{_model_dir_name(model_path)}"
+        self.batch_size = batch_size
+        self.normalize = normalize
+
+        # The hidden size is often a dynamic axis of the export, so it is detected with a probe input
+        output_size = self.session.get_outputs()[0].shape[-1]
+        self.dimensions = output_size if isinstance(output_size, int) else len(self.embed(["dimension probe"])[0])
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            input_ids = np.asarray([encoding.ids for encoding in encodings], dtype=np.int64)
+            attention_mask = np.asarray([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+            token_embeddings = self.session.run(None, inputs)[0]
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if self.normalize:
+                pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            vectors.extend(pooled.astype(np.float32).tolist())
+
+        return vectors
+
+
+def _model_dir_name(model_path: str) -> str:
+    return os.path.basename(os.path.normpath(model_path))
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import List, Optional, Dict
+
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+
+# Access times of hits are kept in memory and written in one transaction once this many are pending
+# or this many seconds passed, so lookups don't commit. LRU order only needs to be roughly right
+ACCESS_FLUSH_SIZE = 1000
+ACCESS_FLUSH_INTERVAL = 60.0
+
+
+class EmbeddingCache:
+    """
+    Persistent, content addressed embedding cache stored in SQLite.
+    Entries are keyed by (model, dimensions, sha256(text)) and the vectors are stored as float32 blobs.
+    When the total size of the vectors exceeds max_bytes, the least recently used entries are evicted.
+    The total size is kept in the database by triggers, in the same transaction as the writes, so several
+    processes sharing the cache file evict against the same, current size.
+    Lookups don't write: the access times of hits are written in batches, at the latest by the next
+    put_many(), flush() or close().
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending_access: Dict[tuple, float] = {}
+        self._last_flush = time.monotonic()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, dimensions, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+
+        # Caches created before the size was stored get it computed once, under the write lock
+        self._conn.executescript("""
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS cache_size (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                bytes INTEGER NOT NULL
+            );
+            INSERT INTO cache_size (id, bytes)
+            SELECT 0, (SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings)
+            WHERE NOT EXISTS (SELECT 1 FROM cache_size);
+            CREATE TRIGGER IF NOT EXISTS embeddings_size_insert AFTER INSERT ON embeddings BEGIN
+                UPDATE cache_size SET bytes = bytes + LENGTH(NEW.vector);
+            END;
+            CREATE TRIGGER IF NOT EXISTS embeddings_size_update AFTER UPDATE OF vector ON embeddings BEGIN
+                UPDATE cache_size SET bytes = bytes + LENGTH(NEW.vector) - LENGTH(OLD.vector);
+            END;
+            CREATE TRIGGER IF NOT EXISTS embeddings_size_delete AFTER DELETE ON embeddings BEGIN
+                UPDATE cache_size SET bytes = bytes - LENGTH(OLD.vector);
+            END;
+            COMMIT;
+        """)
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, dimensions: int, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up the embeddings of the texts, returning None for the ones that are not cached"""
+        hashes = [self.text_hash(text) for text in texts]
+        found = {}
+
+        with self._lock:
+            unique_hashes = list(dict.fromkeys(hashes))
+            # Stay below SQLite's limit on the number of query parameters
+            for start in range(0, len(unique_hashes), 500):
+                chunk = unique_hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND dimensions = ? "
+                    f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                    [model, dimensions, *chunk]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                for text_hash in found:
+                    self._pending_access[(model, dimensions, text_hash)] = now
+                if (len(self._pending_access) >= ACCESS_FLUSH_SIZE or
+                        time.monotonic() - self._last_flush >= ACCESS_FLUSH_INTERVAL):
+                    self._flush_access()
+                    self._conn.commit()
+
+            results = [found.get(text_hash) for text_hash in hashes]
+            hit_count = sum(1 for vector in results if vector is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+
+        return results
+
+    def put_many(self, model: str, dimensions: int, texts: List[str], vectors: List[List[float]]):
+        """Store the embeddings of the texts and evict old entries if the cache got too big"""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            rows.append((model, dimensions, self.text_hash(text), array("f", vector).tobytes(), now))
+
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete wouldn't fire the size trigger
+            self._conn.executemany(
+                "INSERT INTO embeddings (model, dimensions, text_hash, vector, last_access) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (model, dimensions, text_hash) DO UPDATE SET vector = excluded.vector, "
+                "last_access = excluded.last_access",
+                rows
+            )
+            self._flush_access()
+            self._evict()
+            self._conn.commit()
+
+    def _flush_access(self):
+        """Write the pending access times, the caller commits"""
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = MAX(last_access, ?) "
+                "WHERE model = ? AND dimensions = ? AND text_hash = ?",
+                [(accessed, *key) for key, accessed in self._pending_access.items()]
+            )
+            self._pending_access = {}
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        """Write the pending access times"""
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+
+    def _size_bytes(self) -> int:
+        return self._conn.execute("SELECT bytes FROM cache_size").fetchone()[0]
+
+    def _evict(self):
+        """
+        Delete least recently used entries until the cache fits into max_bytes. Called after a write
+        of the same transaction, so the size read here includes the writes of every other process
+        """
+        size_bytes = self._size_bytes()
+        if size_bytes <= self.max_bytes:
+            return
+
+        cursor = self._conn.execute(
+            "SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_access ASC"
+        )
+        to_delete = []
+        for rowid, size in cursor:
+            if size_bytes <= self.max_bytes:
+                break
+            to_delete.append((rowid,))
+            size_bytes -= size
+        cursor.close()
+
+        self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", to_delete)
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the current size of the cache"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            size_bytes = self._size_bytes()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+            "entries": entries,
+            "size_bytes": size_bytes,
+            "max_bytes": self.max_bytes
+        }
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,260 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+
+from metrics import MetricsRegistry, get_metrics
+
+# Defaults of the embedding budgets, set them to the limits of the organization's usage tier
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+
+# Share of the budgets actually used, the rest absorbs the clock skew between client and server
+SAFETY_MARGIN = 0.95
+
+# The buckets hold this many seconds worth of budget: the API enforces its per minute limits over
+# shorter periods, so a whole minute of requests can't be sent in one burst
+BURST_SECONDS = 1.0
+
+# Pause of every request after a 429 without Retry-After
+DEFAULT_RATE_LIMIT_PAUSE = 1.0
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously at rate_per_minute, holding at most burst_seconds worth of units.
+    take() blocks until the amount is available, an amount larger than the capacity is let through
+    once the bucket is full and leaves it in debt, so an oversized request still gets sent.
+    """
+    def __init__(self, rate_per_minute: float, burst_seconds: float = BURST_SECONDS):
+        self.rate_per_minute = rate_per_minute
+        self.burst_seconds = burst_seconds
+        self.capacity = rate_per_minute * burst_seconds / 60
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate_per_minute / 60)
+        self._updated = now
+
+    def take(self, amount: float) -> float:
+        """Take amount units, waiting for them if needed. Returns the seconds waited"""
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                self._refill()
+                needed = min(amount, self.capacity)
+                if self._level >= needed:
+                    self._level -= amount
+                    return time.monotonic() - start
+                self._condition.wait((needed - self._level) * 60 / self.rate_per_minute)
+
+    def adjust(self, amount: float):
+        """Give back (positive) or take (negative) units, e.g. when the estimate of a request was off"""
+        with self._condition:
+            self._refill()
+            self._level = min(self.capacity, self._level + amount)
+            self._condition.notify_all()
+
+    def limit(self, remaining: float):
+        """Lower the level to what the server reports as remaining"""
+        with self._condition:
+            self._refill()
+            self._level = min(self._level, remaining)
+
+    def set_rate(self, rate_per_minute: float):
+        with self._condition:
+            self._refill()
+            self.rate_per_minute = rate_per_minute
+            self.capacity = rate_per_minute * self.burst_seconds / 60
+            self._level = min(self._level, self.capacity)
+            self._condition.notify_all()
+
+
+@dataclass
+class _Ticket:
+    """Budget taken by a request in flight"""
+    tokens: int
+
+
+class EmbeddingScheduler:
+    """
+    Paces the embedding requests of a model to its requests and tokens per minute budgets.
+
+    Every request takes one unit of the requests bucket and its (estimated) tokens from the tokens
+    bucket before it is sent, so a bulk load runs at the budget instead of bursting into 429s.
+    The number of requests in flight follows AIMD: it grows by one per round of successful requests
+    and is halved by a 429, which also pauses every request for the Retry-After time. The
+    x-ratelimit-* response headers correct the buckets: the limits lower the rates when the server
+    grants less than configured, and the remaining counts drain the buckets when other clients
+    share the budget.
+
+    Args:
+        requests_per_minute: Requests budget of the model
+        tokens_per_minute: Tokens budget of the model
+        max_concurrency: Upper bound of the requests in flight
+        min_concurrency: Lower bound the concurrency is never decreased below
+    """
+    def __init__(self, requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE, max_concurrency: int = 16,
+                 min_concurrency: int = 1, initial_concurrency: int = None, name: str = "embeddings",
+                 metrics: MetricsRegistry = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.name = name
+        self.metrics = metrics or get_metrics()
+
+        self.requests = TokenBucket(requests_per_minute * SAFETY_MARGIN)
+        self.tokens = TokenBucket(tokens_per_minute * SAFETY_MARGIN)
+
+        self.concurrency = float(initial_concurrency or max(self.min_concurrency, self.max_concurrency // 2))
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+
+        self._start = None
+        self._completed_requests = 0
+        self._completed_tokens = 0
+        self._rate_limited = 0
+        self._throttled_seconds = 0.0
+        self._server_limits: Dict[str, float] = {}
+
+    def acquire(self, tokens: int) -> _Ticket:
+        """Wait for a concurrency slot and the budget of a request of tokens tokens"""
+        start = time.monotonic()
+        with self._condition:
+            if self._start is None:
+                self._start = start
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._condition.wait(pause)
+                elif self._in_flight >= int(self.concurrency):
+                    self._condition.wait()
+                else:
+                    break
+            self._in_flight += 1
+
+        try:
+            self.requests.take(1)
+            self.tokens.take(tokens)
+        except BaseException:
+            self._finish()
+            raise
+        waited = time.monotonic() - start
+        with self._condition:
+            self._throttled_seconds += waited
+        self.metrics.inc("embedding_scheduler_wait_seconds_total", waited, scheduler=self.name)
+        return _Ticket(tokens)
+
+    def release(self, ticket: _Ticket, headers=None, rate_limited: bool = False, failed: bool = False,
+                used_tokens: int = None, retry_after: float = None):
+        """
+        Report the outcome of a request.
+
+        Args:
+            headers: Response headers, their x-ratelimit-* values update the buckets
+            rate_limited: The request got a 429
+            failed: The request failed otherwise, it doesn't change the concurrency
+            used_tokens: Tokens the server counted, corrects the estimate taken at acquire()
+            retry_after: Seconds the server asked to wait after a 429
+        """
+        if headers is not None:
+            self._apply_headers(headers)
+
+        if rate_limited:
+            # The request is sent again, its budget was consumed for nothing
+            with self._condition:
+                self._rate_limited += 1
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                pause = retry_after if retry_after is not None else DEFAULT_RATE_LIMIT_PAUSE
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self.metrics.inc("embedding_scheduler_rate_limited_total", scheduler=self.name)
+        elif not failed:
+            if used_tokens is not None and used_tokens != ticket.tokens:
+                self.tokens.adjust(ticket.tokens - used_tokens)
+            with self._condition:
+                self._completed_requests += 1
+                self._completed_tokens += used_tokens if used_tokens is not None else ticket.tokens
+                # Additive increase: one more request in flight per round of successes
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / max(1.0, self.concurrency))
+        self._finish()
+
+    def _finish(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _apply_headers(self, headers):
+        for kind, bucket, configured in (("requests", self.requests, self.requests_per_minute),
+                                         ("tokens", self.tokens, self.tokens_per_minute)):
+            limit = _header_number(headers, f"x-ratelimit-limit-{kind}")
+            if limit is not None:
+                with self._condition:
+                    self._server_limits[kind] = limit
+                rate = min(configured, limit) * SAFETY_MARGIN
+                if rate != bucket.rate_per_minute:
+                    bucket.set_rate(rate)
+            remaining = _header_number(headers, f"x-ratelimit-remaining-{kind}")
+            if remaining is not None:
+                bucket.limit(remaining)
+
+    def reset_report(self):
+        """Start measuring the throughput anew, e.g. at the start of a run"""
+        with self._condition:
+            self._start = None
+            self._completed_requests = 0
+            self._completed_tokens = 0
+            self._rate_limited = 0
+            self._throttled_seconds = 0.0
+
+    def report(self) -> Dict[str, Any]:
+        """Achieved against allowed throughput since the first request"""
+        with self._condition:
+            elapsed = time.monotonic() - self._start if self._start is not None else 0.0
+            minutes = elapsed / 60
+            return {
+                "seconds": elapsed,
+                "requests": self._completed_requests,
+                "tokens": self._completed_tokens,
+                "requests_per_minute": self._completed_requests / minutes if minutes > 0 else 0.0,
+                "tokens_per_minute": self._completed_tokens / minutes if minutes > 0 else 0.0,
+                "allowed_requests_per_minute": min(self.requests_per_minute,
+                                                   self._server_limits.get("requests", self.requests_per_minute)),
+                "allowed_tokens_per_minute": min(self.tokens_per_minute,
+                                                 self._server_limits.get("tokens", self.tokens_per_minute)),
+                "rate_limited": self._rate_limited,
+                "concurrency": int(self.concurrency),
+                "throttled_seconds": self._throttled_seconds
+            }
+
+    def print_report(self):
+        report = self.report()
+        if not report["requests"] and not report["rate_limited"]:
+            return
+        print(f"Embedding throughput: {report['requests_per_minute']:.0f} of "
+              f"{report['allowed_requests_per_minute']:.0f} requests/min "
+              f"({_share(report['requests_per_minute'], report['allowed_requests_per_minute'])}), "
+              f"{report['tokens_per_minute']:.0f} of {report['allowed_tokens_per_minute']:.0f} tokens/min "
+              f"({_share(report['tokens_per_minute'], report['allowed_tokens_per_minute'])}), "
+              f"{report['rate_limited']} rate limited, concurrency {report['concurrency']}, "
+              f"{report['throttled_seconds']:.1f}s waited for budget")
+
+
+def _header_number(headers, name: str) -> Optional[float]:
+    value = headers.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _share(achieved: float, allowed: float) -> str:
+    return f"{achieved / allowed:.0%}" if allowed else "n/a"
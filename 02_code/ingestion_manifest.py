@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+DEFAULT_MANIFEST_DIR = os.getenv("INGESTION_MANIFEST_DIR", ".cache/manifests")
+
+# Files are hashed in blocks of this size
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class FileState:
+    """Size, modification time and (once computed) content hash of a file on disk"""
+    path: str
+    size: int
+    mtime_ns: int
+    content_hash: Optional[str] = None
+
+    @classmethod
+    def from_path(cls, path: str) -> "FileState":
+        stat = os.stat(path)
+        return cls(path, stat.st_size, stat.st_mtime_ns)
+
+
+@dataclass
+class ManifestEntry:
+    """What was ingested for a file: its state at the time, the chunker version and the resulting point ids"""
+    path: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+    chunker_version: str
+    point_ids: List[str]
+    ingested_at: float
+
+
+@dataclass
+class IngestionPlan:
+    """Difference between the files of a folder and what the manifest recorded for it"""
+    new: List[FileState] = field(default_factory=list)
+    modified: List[FileState] = field(default_factory=list)
+    unchanged: List[FileState] = field(default_factory=list)
+    removed: List[ManifestEntry] = field(default_factory=list)
+    # Unchanged files whose modification time changed (e.g. after a checkout), their entries are refreshed
+    touched: List[FileState] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+
+    @property
+    def to_ingest(self) -> List[FileState]:
+        return self.new + self.modified
+
+    def print(self, verbose: bool = True):
+        removed_points = sum(len(entry.point_ids) for entry in self.removed)
+        print(f"Plan: {len(self.new)} new, {len(self.modified)} modified, {len(self.removed)} removed "
+              f"({removed_points} points to delete), {len(self.unchanged)} unchanged")
+        if verbose:
+            for label, paths in (("+", [state.path for state in self.new]),
+                                 ("~", [state.path for state in self.modified]),
+                                 ("-", [entry.path for entry in self.removed]),
+                                 ("!", self.failed)):
+                for path in paths:
+                    print(f"  {label} {path}")
+
+
+class IngestionManifest:
+    """
+    Persistent record of the ingested files of a collection, stored in SQLite.
+    For every file it keeps size, modification time, content hash, chunker version and the ids of its
+    points, so that re-runs only ingest new or modified files and can delete the points of removed ones.
+
+    A file counts as unchanged when its size and modification time match the manifest, or when its
+    content hash does, and it was chunked with the current chunker version.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                chunker_version TEXT NOT NULL,
+                point_ids TEXT NOT NULL,
+                ingested_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def for_collection(cls, collection_name: str, directory: str = DEFAULT_MANIFEST_DIR) -> "IngestionManifest":
+        return cls(os.path.join(directory, f"{collection_name}.sqlite"))
+
+    def entries(self, folder: Optional[str] = None) -> Dict[str, ManifestEntry]:
+        """Return the entries of the files below folder (all entries if folder is None), keyed by path"""
+        query = "SELECT path, size, mtime_ns, content_hash, chunker_version, point_ids, ingested_at FROM files"
+        parameters = ()
+        if folder is not None:
+            prefix = os.path.join(folder, "")
+            query += " WHERE substr(path, 1, ?) = ?"
+            parameters = (len(prefix), prefix)
+
+        with self._lock:
+            rows = self._conn.execute(query, parameters).fetchall()
+        return {
+            row[0]: ManifestEntry(row[0], row[1], row[2], row[3], row[4], json.loads(row[5]), row[6])
+            for row in rows
+        }
+
+    def plan(self, folder: str, file_paths: Iterable[str], chunker_version: str) -> IngestionPlan:
+        """Compare the files of folder with the manifest, hashing only files whose size or mtime changed"""
+        plan = IngestionPlan()
+        for _ in self.iter_plan(folder, file_paths, chunker_version, plan):
+            pass
+        return plan
+
+    def iter_plan(self, folder: str, file_paths: Iterable[str], chunker_version: str,
+                  plan: IngestionPlan) -> Iterator[Tuple[str, FileState]]:
+        """
+        Compare the files with the manifest one at a time, adding each to plan as it is classified, so a
+        caller can start ingesting a file before the next ones are read and hashed. plan.removed is only
+        set once file_paths is exhausted.
+
+        Yields:
+            ("new" | "modified" | "unchanged", state) per readable file
+        """
+        entries = self.entries(folder)
+
+        for path in file_paths:
+            try:
+                state = FileState.from_path(path)
+                entry = entries.pop(path, None)
+                if entry is None:
+                    state.content_hash = file_content_hash(path)
+                    plan.new.append(state)
+                    yield "new", state
+                    continue
+
+                if entry.chunker_version == chunker_version and (state.size, state.mtime_ns) == (entry.size,
+                                                                                                 entry.mtime_ns):
+                    state.content_hash = entry.content_hash
+                    plan.unchanged.append(state)
+                    yield "unchanged", state
+                    continue
+
+                state.content_hash = file_content_hash(path)
+                if entry.chunker_version == chunker_version and state.content_hash == entry.content_hash:
+                    plan.unchanged.append(state)
+                    plan.touched.append(state)
+                    yield "unchanged", state
+                else:
+                    plan.modified.append(state)
+                    yield "modified", state
+            except OSError as e:
+                print(f"Error reading {path}: {e}")
+                plan.failed.append(path)
+
+        # A file that can't be read is not treated as removed
+        for path in plan.failed:
+            entries.pop(path, None)
+        plan.removed = sorted(entries.values(), key=lambda entry: entry.path)
+
+    def record(self, state: FileState, chunker_version: str, point_ids: List[str]):
+        """Record that the file was ingested into the given points"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, content_hash, chunker_version, point_ids, "
+                "ingested_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (state.path, state.size, state.mtime_ns, state.content_hash, chunker_version,
+                 json.dumps(point_ids), time.time())
+            )
+            self._conn.commit()
+
+    def touch(self, states: List[FileState]):
+        """Store the new size and modification time of files whose content didn't change"""
+        with self._lock:
+            self._conn.executemany("UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?",
+                                   [(state.size, state.mtime_ns, state.path) for state in states])
+            self._conn.commit()
+
+    def remove(self, paths: List[str]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM files")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,684 @@
+import argparse
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Callable, Iterator, Optional, Set, Tuple
+
+from data_uploading import (CHUNKER_VERSION, DEFAULT_PARSER, PARSE_CHUNK_SIZE, PARSERS, _parse_markdown_files,
+                            chunk_document, resolve_data_folder)
+from ingestion_manifest import IngestionManifest, IngestionPlan, FileState, ManifestEntry
+from dedup import DedupIndex, DEFAULT_NEAR_DUPLICATE_THRESHOLD
+from embedders import paced_embedder
+from embedding_scheduler import EmbeddingScheduler, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from metrics import get_metrics
+from vectordb import VectorDB
+
+# Marks the end of a stage's input, each worker of the stage receives one
+_END = object()
+
+STAGES = ("discover", "parse", "chunk", "dedup", "embed", "upsert")
+
+
+@dataclass
+class PipelineConfig:
+    """
+    Concurrency and buffering settings of the ingestion pipeline.
+
+    Args:
+        parse_workers: Number of processes parsing markdown files
+        chunk_workers: Number of threads splitting documents into chunks
+        embed_workers: Number of threads sending embedding requests (each request is one batch), the
+            upper bound of the requests in flight the embedding scheduler adapts
+        requests_per_minute: Requests budget of the embedding model, used to pace OpenAI embedding requests
+        tokens_per_minute: Tokens budget of the embedding model
+        upsert_workers: Number of threads writing batches to the vector db
+        embed_batch_size: Number of chunks per embedding request and upsert
+        queue_size: Capacity of each queue between two stages, in items (batches of files, documents or
+            batches of chunks). A full queue blocks its producer, which bounds the memory used by the pipeline
+        parser: "markdown-it" (fast CommonMark parser) or "unstructured"
+        enable_chunking: Split documents into chunks, otherwise each file is one point
+        incremental: Only ingest new and modified files, and skip their chunks that are already stored
+        dedup: Don't embed chunks that duplicate a stored chunk, they become extra sources of its point
+        near_duplicate_threshold: Estimated Jaccard similarity of the word shingles above which a chunk
+            is a near duplicate, None only suppresses exact (case and whitespace insensitive) duplicates
+        report_interval: Seconds between two progress lines, 0 disables them
+    """
+    parse_workers: int = max(1, (os.cpu_count() or 2) - 1)
+    chunk_workers: int = 1
+    embed_workers: int = 8
+    upsert_workers: int = 2
+    requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE
+    tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE
+    embed_batch_size: int = 256
+    queue_size: int = 16
+    parser: str = DEFAULT_PARSER
+    enable_chunking: bool = True
+    incremental: bool = True
+    dedup: bool = True
+    near_duplicate_threshold: Optional[float] = DEFAULT_NEAR_DUPLICATE_THRESHOLD
+    report_interval: float = 5.0
+
+
+class _Stage:
+    """
+    Pool of worker threads taking items from an input queue.
+    process(item, emit) may emit any number of items to the output queue, finish(emit) is called by
+    each worker once the input is exhausted. The last worker to finish passes one end marker to
+    every worker of the next stage.
+    """
+    def __init__(self, name: str, workers: int, input_queue: queue.Queue, output_queue: Optional[queue.Queue],
+                 process: Callable[[Any, Callable[[Any], None]], None],
+                 finish: Callable[[Callable[[Any], None]], None] = None):
+        self.name = name
+        self.workers = max(1, workers)
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.process = process
+        self.finish = finish
+        self.downstream_workers = 0
+        self._running = self.workers
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"ingest-{name}-{i}", daemon=True) for i in range(self.workers)
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _emit(self, item):
+        self.output_queue.put(item)
+
+    def _run(self):
+        while True:
+            item = self.input_queue.get()
+            if item is _END:
+                break
+            try:
+                self.process(item, self._emit)
+            except Exception as e:
+                # A worker must survive, otherwise the stages before it would block on a full queue
+                print(f"Error in {self.name} stage: {type(e).__name__}: {e}")
+                get_metrics().inc("stage_errors_total", stage=f"ingest_{self.name}")
+
+        if self.finish is not None:
+            self.finish(self._emit)
+
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last and self.output_queue is not None:
+            for _ in range(self.downstream_workers):
+                self.output_queue.put(_END)
+
+
+def iter_markdown_files(folder_path: str) -> Iterator[str]:
+    """
+    Yield the markdown files below folder_path while the directories are walked, sorted within each
+    directory. Hidden files and directories are skipped, like glob's ** does.
+    """
+    for directory, dirnames, filenames in os.walk(folder_path):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+        for name in sorted(filenames):
+            if name.endswith(".md") and not name.startswith("."):
+                yield os.path.join(directory, name)
+
+
+@dataclass
+class _FileProgress:
+    """Points of a file that still have to be stored before the file counts as ingested"""
+    state: Optional[FileState]
+    old_ids: Set[str]
+    point_ids: List[str] = field(default_factory=list)
+    # (chunk_index, point_id, metadata) of every chunk, for the dedup index
+    sources: List[Tuple[int, str, Dict[str, Any]]] = field(default_factory=list)
+    # Existing points the file references as duplicates
+    references: List[str] = field(default_factory=list)
+    pending: int = 0
+
+
+class IngestionPipeline:
+    """
+    Streaming ingestion of a folder of markdown files:
+
+        discover -> parse -> chunk -> dedup -> embed (batches) -> upsert (batches)
+
+    The stages run concurrently and are connected by bounded queues, so a slow stage blocks the ones
+    before it instead of letting work pile up in memory: memory use depends on the queue sizes and
+    batch size, not on the size of the corpus. Parsing runs in worker processes, embedding and upserts
+    in threads, so the network bound stages keep working while files are being parsed.
+
+    Throughput is counted in the ingest_items_total{stage} counter of the metrics registry and
+    printed every report_interval seconds.
+
+    The files are compared with the collection's IngestionManifest while the folder is walked: new and
+    modified files are handed to the parsers as they are found, PARSE_CHUNK_SIZE files per task of a
+    parse worker, so parsing starts before the whole tree is read and hashed. The points of removed files
+    are deleted once the walk and the stages are done. Once every chunk of a
+    file is stored, the points of its previous version that are gone are deleted and the file is
+    recorded in the manifest, so a file whose batch failed is simply retried by the next run.
+    Without a manifest (use_manifest=False), every file is parsed and the ids of the points already
+    in the collection are loaded to skip unchanged chunks.
+
+    With dedup, a chunk that duplicates a stored (or pending) chunk is not embedded: the file references
+    the existing point instead, and the point lists every chunk it stands for in its 'sources' payload.
+    Its top level fields are those of its first source, except that file_path, file_name, folder and
+    version hold the values of all sources, so filters on any of them match. Near duplicates are only
+    merged within a version. The DedupIndex counts these references, a point is only deleted once no
+    file references it anymore.
+
+    OpenAI embedding requests go through an EmbeddingScheduler (unless the embedder already has one),
+    which paces them to the requests and tokens per minute budgets and adapts their concurrency to
+    the rate limits, its achieved throughput is printed at the end of the run. The pipeline embeds
+    with its own paced copy of the embedder, queries of the vector db are not paced.
+    """
+    def __init__(self, vector_db: VectorDB, config: PipelineConfig = None, manifest: IngestionManifest = None,
+                 use_manifest: bool = True, dedup_index: DedupIndex = None):
+        self.vector_db = vector_db
+        self.config = config or PipelineConfig()
+        if manifest is None and use_manifest:
+            manifest = IngestionManifest.for_collection(vector_db.collection_name)
+        self.manifest = manifest
+        if dedup_index is None and self.config.dedup:
+            dedup_index = DedupIndex.for_collection(vector_db.collection_name,
+                                                    near_duplicate_threshold=self.config.near_duplicate_threshold)
+        self.dedup_index = dedup_index
+        # The pipeline embeds with its own paced copy of the embedder, the one of the vector db stays
+        # unpaced for queries
+        self.embedder = paced_embedder(vector_db.embedder, self.config.requests_per_minute,
+                                       self.config.tokens_per_minute, max_concurrency=self.config.embed_workers)
+        self.scheduler: Optional[EmbeddingScheduler] = getattr(self.embedder, "scheduler", None)
+        self.metrics = get_metrics()
+        self._lock = threading.Lock()
+        self._buffer: List[Dict] = []
+        self._reset()
+
+    @property
+    def chunker_version(self) -> str:
+        # The parser decides the elements the chunks are built from, so it is part of the version
+        return f"{CHUNKER_VERSION}-{self.config.parser}" if self.config.enable_chunking else "unchunked"
+
+    def _reset(self):
+        self.failed_files: List[str] = []
+        self.failed_batches = 0
+        self.skipped_chunks = 0
+        self.deleted_chunks = 0
+        self.duplicate_chunks = 0
+        self.completed_files = 0
+        self._old_ids: Dict[str, List[str]] = {}
+        self._states: Dict[str, FileState] = {}
+        self._files: Dict[str, _FileProgress] = {}
+        # Points sent to be stored, mapped to the files that reference them as a duplicate meanwhile
+        self._pending_points: Dict[str, List[str]] = {}
+        # Number of files in progress referencing each existing point, which must not be deleted meanwhile
+        self._references: Dict[str, int] = {}
+        # Shared points whose sources changed, their payload is updated at the end of the run
+        self._touched: Set[str] = set()
+
+    def _count(self, stage: str, items: int = 1):
+        self.metrics.inc("ingest_items_total", items, stage=stage)
+
+    def _counts(self) -> Dict[str, float]:
+        return {stage: self.metrics.counter_value("ingest_items_total", stage=stage) for stage in STAGES}
+
+    def plan(self, folder_path: str) -> IngestionPlan:
+        """Find the markdown files of the folder and compare them with the manifest"""
+        plan = IngestionPlan()
+        for _ in self._iter_plan(folder_path, plan):
+            pass
+        return plan
+
+    def _iter_plan(self, folder_path: str, plan: IngestionPlan) -> Iterator[Tuple[str, FileState]]:
+        """Walk the folder and classify its markdown files one at a time, see IngestionManifest.iter_plan"""
+        file_paths = iter_markdown_files(folder_path)
+        if self.manifest is not None:
+            yield from self.manifest.iter_plan(folder_path, file_paths, self.chunker_version, plan)
+            return
+
+        for path in file_paths:
+            try:
+                state = FileState.from_path(path)
+            except OSError as e:
+                print(f"Error reading {path}: {e}")
+                plan.failed.append(path)
+                continue
+            plan.new.append(state)
+            yield "new", state
+
+    def _discover(self, folder_path: str, plan: IngestionPlan, entries: Dict[str, ManifestEntry], emit):
+        """
+        Walk the folder and emit the files to ingest in batches of PARSE_CHUNK_SIZE as they are found,
+        so the parsers start while the rest of the tree is still being read and hashed
+        """
+        batch = []
+        for category, state in self._iter_plan(folder_path, plan):
+            if category == "unchanged" and self.config.incremental:
+                continue
+            self._count("discover")
+            # Set before the file is emitted, the dedup stage reads them once the file gets there
+            self._states[state.path] = state
+            if state.path in entries:
+                self._old_ids[state.path] = entries[state.path].point_ids
+            batch.append(state.path)
+            if len(batch) >= PARSE_CHUNK_SIZE:
+                emit(batch)
+                batch = []
+        if batch:
+            emit(batch)
+
+    def _parse(self, executor: ProcessPoolExecutor):
+        def process(file_paths: List[str], emit):
+            try:
+                results = executor.submit(_parse_markdown_files, file_paths, self.config.parser).result()
+            except Exception as e:
+                # The worker process died, the pool can't be used anymore either
+                results = [(file_path, None, f"{type(e).__name__}: {e}") for file_path in file_paths]
+
+            for path, document, error in results:
+                self._count("parse")
+                if error is not None:
+                    print(f"Error processing {path}: {error}")
+                    with self._lock:
+                        self.failed_files.append(path)
+                else:
+                    # Files without text are passed on too, their previous points have to be deleted
+                    emit((path, document))
+        return process
+
+    def _chunk(self, item, emit):
+        file_path, document = item
+        chunk_documents = chunk_document(document, self.config.enable_chunking) if document is not None else []
+        self._count("chunk", len(chunk_documents))
+        emit((file_path, chunk_documents, self.vector_db.document_ids(chunk_documents)))
+
+    def _dedup(self, item, emit):
+        """
+        Decide which chunks of a file have to be embedded: chunks already stored are skipped (incremental
+        runs) and duplicates are replaced by a reference to their point. Runs in a single thread, so a
+        chunk can be a duplicate of one registered just before it.
+        """
+        file_path, chunk_documents, chunk_ids = item
+        old_ids = set(self._old_ids.get(file_path, ()))
+        new_documents = []
+        # Registered upfront since the points it waits for may be stored meanwhile, the extra pending
+        # point keeps it from completing before all its chunks are handled
+        progress = _FileProgress(self._states.get(file_path), old_ids, pending=1)
+        with self._lock:
+            self._files[file_path] = progress
+
+        for doc, point_id in zip(chunk_documents, chunk_ids):
+            if self.config.incremental and point_id in old_ids:
+                self.skipped_chunks += 1
+            elif self.dedup_index is not None:
+                content_hash, signature = self.dedup_index.fingerprint(doc["text"])
+                version = doc["metadata"].get("version")
+                with self._lock:
+                    duplicate = self.dedup_index.find(content_hash, signature, exclude_file=file_path, version=version)
+                    if duplicate is not None and duplicate != point_id:
+                        point_id = duplicate
+                        self.duplicate_chunks += 1
+                        self._references[point_id] = self._references.get(point_id, 0) + 1
+                        progress.references.append(point_id)
+                        self._touched.add(point_id)
+                        if point_id in self._pending_points:
+                            self._pending_points[point_id].append(file_path)
+                            progress.pending += 1
+                    else:
+                        if duplicate is None:
+                            self.dedup_index.add(point_id, content_hash, signature, pending=True, version=version)
+                        self._pending_points.setdefault(point_id, [])
+                        new_documents.append(doc)
+            else:
+                new_documents.append(doc)
+
+            progress.point_ids.append(point_id)
+            progress.sources.append((doc["metadata"].get("chunk_index", 0), point_id, doc["metadata"]))
+
+        self._count("dedup", len(chunk_documents))
+        with self._lock:
+            progress.pending += len(new_documents) - 1
+            complete = progress.pending == 0
+        if complete:
+            self._complete_file(file_path)
+
+        for doc in new_documents:
+            self._buffer.append(doc)
+            if len(self._buffer) >= self.config.embed_batch_size:
+                emit(self._buffer)
+                self._buffer = []
+
+    def _flush_batch(self, emit):
+        if self._buffer:
+            emit(self._buffer)
+            self._buffer = []
+
+    def _embed(self, batch: List[Dict], emit):
+        try:
+            with self.metrics.stage("document_embedding", items=len(batch)):
+                vectors = self.vector_db.embed_texts([doc["text"] for doc in batch], embedder=self.embedder)
+        except Exception as e:
+            self._batch_failed("embedding", batch, e)
+            return
+        self._count("embed", len(batch))
+        emit((batch, vectors))
+
+    def _upsert(self, item, emit):
+        batch, vectors = item
+        try:
+            point_ids = self.vector_db.upsert_embedded(batch, vectors, save_sparse=False)
+        except Exception as e:
+            self._batch_failed("uploading", batch, e)
+            return
+        self._count("upsert", len(batch))
+        if self.dedup_index is not None:
+            self.dedup_index.confirm(point_ids)
+
+        completed = []
+        with self._lock:
+            for doc, point_id in zip(batch, point_ids):
+                # The file of the chunk and the files that reference the point as a duplicate
+                waiting_files = [doc["metadata"].get("file_path", "")] + self._pending_points.pop(point_id, [])
+                for file_path in waiting_files:
+                    progress = self._files[file_path]
+                    progress.pending -= 1
+                    if progress.pending == 0:
+                        completed.append(file_path)
+        for file_path in completed:
+            self._complete_file(file_path)
+
+    def _complete_file(self, file_path: str):
+        """Every point of the file is stored: release the points of its previous version and record it"""
+        with self._lock:
+            progress = self._files.pop(file_path)
+
+        # Old versions of changed chunks are only removed once their replacements are stored
+        stale_ids = progress.old_ids - set(progress.point_ids)
+        if self.dedup_index is not None:
+            self.dedup_index.replace_sources(file_path, progress.sources)
+            stale_ids = self._release(stale_ids)
+            with self._lock:
+                for point_id in progress.references:
+                    self._references[point_id] -= 1
+                    if self._references[point_id] == 0:
+                        del self._references[point_id]
+            shared = [point_id for point_id, count in self.dedup_index.source_counts(progress.point_ids).items()
+                      if count > 1]
+            with self._lock:
+                self._touched.update(shared)
+        elif stale_ids:
+            # Without the dedup index the points themselves tell which other files still share them
+            stale_ids = set(self.vector_db.release_files(sorted(stale_ids), [file_path]))
+
+        try:
+            self.vector_db.delete_documents(sorted(stale_ids))
+        except Exception as e:
+            print(f"Error deleting stale chunks of {file_path}: {e}")
+            return
+
+        if self.manifest is not None and progress.state is not None:
+            self.manifest.record(progress.state, self.chunker_version, progress.point_ids)
+        with self._lock:
+            self.deleted_chunks += len(stale_ids)
+            self.completed_files += 1
+
+    def _release(self, point_ids: Set[str]) -> Set[str]:
+        """
+        Return the points no file references anymore, and forget them in the dedup index.
+        Points still referenced by another file only get their sources updated.
+        """
+        if not point_ids:
+            return set()
+        counts = self.dedup_index.source_counts(point_ids)
+        with self._lock:
+            unreferenced = {point_id for point_id, count in counts.items()
+                            if count == 0 and point_id not in self._references and point_id not in self._pending_points}
+            self._touched.update(set(point_ids) - unreferenced)
+            self.dedup_index.remove(unreferenced)
+        return unreferenced
+
+    def _update_shared_payloads(self):
+        """Write the sources of the shared points whose sources changed during the run"""
+        with self._lock:
+            touched = self._touched - set(self._pending_points)
+            self._touched = set()
+        for point_id in sorted(touched):
+            payload = self.dedup_index.source_payload(point_id)
+            if payload is None:
+                continue
+            try:
+                self.vector_db.set_payload([point_id], payload)
+            except Exception as e:
+                print(f"Error updating the sources of point {point_id}: {e}")
+
+    def _batch_failed(self, action: str, batch: List[Dict], error: Exception):
+        file_names = sorted({doc["metadata"].get("file_name", "unknown") for doc in batch})
+        print(f"Error {action} batch of {len(batch)} chunks from {file_names}: {error}")
+        with self._lock:
+            self.failed_batches += 1
+
+    def _delete_removed(self, removed: List[ManifestEntry]) -> int:
+        """Delete the points of files that no longer exist, and forget the files"""
+        deleted = 0
+        for entry in removed:
+            point_ids = entry.point_ids
+            if self.dedup_index is not None:
+                self.dedup_index.remove_file(entry.path)
+                point_ids = sorted(self._release(set(point_ids)))
+            elif point_ids:
+                point_ids = self.vector_db.release_files(point_ids, [entry.path])
+            try:
+                self.vector_db.delete_documents(point_ids)
+            except Exception as e:
+                print(f"Error deleting the points of removed file {entry.path}: {e}")
+                continue
+            self.manifest.remove([entry.path])
+            deleted += len(point_ids)
+        return deleted
+
+    def _report(self, stages: Dict[str, _Stage], stop: threading.Event, start: float, counts_before: Dict[str, float]):
+        previous = {stage: 0.0 for stage in STAGES}
+        previous_time = start
+        while not stop.wait(self.config.report_interval):
+            now = time.perf_counter()
+            counts = {stage: value - counts_before[stage] for stage, value in self._counts().items()}
+            rates = {stage: (counts[stage] - previous[stage]) / (now - previous_time) for stage in STAGES}
+            queues = " ".join(f"{name}={stage.input_queue.qsize()}" for name, stage in stages.items())
+            embedding = ""
+            if self.scheduler is not None:
+                report = self.scheduler.report()
+                embedding = (f" | {report['tokens_per_minute']:.0f} of {report['allowed_tokens_per_minute']:.0f} "
+                             f"tokens/min, concurrency {report['concurrency']}, {report['rate_limited']} rate limited")
+            print(f"[{now - start:7.1f}s] files {counts['discover']:.0f} found, {counts['parse']:.0f} parsed "
+                  f"({rates['parse']:.1f}/s) | chunks {counts['chunk']:.0f} ({rates['chunk']:.1f}/s), "
+                  f"{counts['dedup']:.0f} deduplicated, "
+                  f"{counts['embed']:.0f} embedded ({rates['embed']:.1f}/s), "
+                  f"{counts['upsert']:.0f} upserted ({rates['upsert']:.1f}/s){embedding} | queued {queues}")
+            previous, previous_time = counts, now
+
+    @staticmethod
+    def _plan_summary(plan: IngestionPlan) -> Dict[str, Any]:
+        return {"new_files": len(plan.new), "modified_files": len(plan.modified),
+                "removed_files": len(plan.removed), "unchanged_files": len(plan.unchanged)}
+
+    def run(self, folder_path: str, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Ingest the new and modified markdown files below folder_path and delete the points of removed ones.
+        With incremental=False every file is ingested again, with dry_run=True the planned changes
+        are only printed.
+
+        Returns:
+            Dictionary with the planned changes, the number of files, chunks and points handled by
+            each stage, failures and the duration of the run
+        """
+        self._reset()
+        config = self.config
+        start = time.perf_counter()
+        counts_before = self._counts()
+        if self.scheduler is not None:
+            self.scheduler.reset_report()
+
+        if dry_run:
+            plan = self.plan(folder_path)
+            plan.print(verbose=True)
+            return self._plan_summary(plan)
+
+        # The plan is filled in while the folder is walked, the stages start on the first files meanwhile
+        plan = IngestionPlan()
+        entries = self.manifest.entries(folder_path) if self.manifest is not None else {}
+        if not entries:
+            # Nothing recorded yet: fall back to the points already in the collection
+            for point_id, file_paths in self.vector_db.existing_point_files().items():
+                for file_path in file_paths:
+                    self._old_ids.setdefault(file_path, []).append(point_id)
+
+        parse_queue = queue.Queue(maxsize=config.queue_size)
+        chunk_queue = queue.Queue(maxsize=config.queue_size)
+        dedup_queue = queue.Queue(maxsize=config.queue_size)
+        embed_queue = queue.Queue(maxsize=config.queue_size)
+        upsert_queue = queue.Queue(maxsize=config.queue_size)
+
+        with ProcessPoolExecutor(max_workers=config.parse_workers) as executor:
+            stages = {
+                "parse": _Stage("parse", config.parse_workers, parse_queue, chunk_queue, self._parse(executor)),
+                "chunk": _Stage("chunk", config.chunk_workers, chunk_queue, dedup_queue, self._chunk),
+                # Single worker: duplicates are looked up among the chunks registered before
+                "dedup": _Stage("dedup", 1, dedup_queue, embed_queue, self._dedup, finish=self._flush_batch),
+                "embed": _Stage("embed", config.embed_workers, embed_queue, upsert_queue, self._embed),
+                "upsert": _Stage("upsert", config.upsert_workers, upsert_queue, None, self._upsert)
+            }
+            stages["parse"].downstream_workers = stages["chunk"].workers
+            stages["chunk"].downstream_workers = stages["dedup"].workers
+            stages["dedup"].downstream_workers = stages["embed"].workers
+            stages["embed"].downstream_workers = stages["upsert"].workers
+
+            for stage in stages.values():
+                stage.start()
+
+            stop_reporting = threading.Event()
+            reporter = None
+            if config.report_interval > 0:
+                reporter = threading.Thread(target=self._report, args=(stages, stop_reporting, start, counts_before),
+                                            name="ingest-report", daemon=True)
+                reporter.start()
+
+            # Files are handed to the parsers as they are found and the queue drains
+            try:
+                self._discover(folder_path, plan, entries, parse_queue.put)
+            finally:
+                for _ in range(stages["parse"].workers):
+                    parse_queue.put(_END)
+            plan.print(verbose=False)
+
+            for stage in stages.values():
+                stage.join()
+            stop_reporting.set()
+            if reporter is not None:
+                reporter.join()
+
+        # Once per run: the upsert workers only update the vocabulary in memory
+        self.vector_db.save_sparse_encoder()
+
+        removed_deleted = 0
+        if self.manifest is not None:
+            removed_deleted = self._delete_removed(plan.removed)
+            self.manifest.touch(plan.touched)
+        if self.dedup_index is not None:
+            with self._lock:
+                # Points of failed batches were never stored
+                failed_points = list(self._pending_points)
+                self._pending_points = {}
+            self.dedup_index.remove(failed_points)
+            self._update_shared_payloads()
+
+        counts = self._counts()
+        seconds = time.perf_counter() - start
+        summary = self._plan_summary(plan)
+        summary.update({stage: int(counts[stage] - counts_before[stage]) for stage in STAGES})
+        summary.update({
+            "completed_files": self.completed_files,
+            "failed_files": len(self.failed_files) + len(plan.failed),
+            "incomplete_files": len(self._files),
+            "failed_batches": self.failed_batches,
+            "skipped_chunks": self.skipped_chunks,
+            "duplicate_chunks": self.duplicate_chunks,
+            "embedding_throughput": self.scheduler.report() if self.scheduler is not None else None,
+            "deleted_chunks": self.deleted_chunks + removed_deleted,
+            "seconds": seconds
+        })
+
+        print(f"Ingested {summary['completed_files']} of {summary['discover']} files in {seconds:.1f}s: "
+              f"{summary['chunk']} chunks, {summary['skipped_chunks']} unchanged, "
+              f"{summary['duplicate_chunks']} duplicates, {summary['upsert']} upserted "
+              f"({summary['upsert'] / seconds if seconds > 0 else 0:.1f}/s), {summary['deleted_chunks']} deleted, "
+              f"{summary['failed_files']} files and {summary['failed_batches']} batches failed")
+        if self.scheduler is not None:
+            self.scheduler.print_report()
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream markdown files into the vector database")
+    parser.add_argument("folder", nargs="?", default=None,
+                        help="Folder with markdown files (default: the Qdrant documentation in data/docs/qdrant)")
+    parser.add_argument("--collection", default="documents")
+    defaults = PipelineConfig()
+    parser.add_argument("--parse-workers", type=int, default=defaults.parse_workers)
+    parser.add_argument("--chunk-workers", type=int, default=defaults.chunk_workers)
+    parser.add_argument("--embed-workers", type=int, default=defaults.embed_workers)
+    parser.add_argument("--upsert-workers", type=int, default=defaults.upsert_workers)
+    parser.add_argument("--requests-per-minute", type=int, default=defaults.requests_per_minute,
+                        help="Requests budget of the embedding model")
+    parser.add_argument("--tokens-per-minute", type=int, default=defaults.tokens_per_minute,
+                        help="Tokens budget of the embedding model")
+    parser.add_argument("--embed-batch-size", type=int, default=defaults.embed_batch_size)
+    parser.add_argument("--queue-size", type=int, default=defaults.queue_size)
+    parser.add_argument("--parser", choices=PARSERS, default=defaults.parser)
+    parser.add_argument("--no-chunking", action="store_true")
+    parser.add_argument("--full", action="store_true", help="Re-ingest unchanged files and chunks")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the new, modified and removed files")
+    parser.add_argument("--no-manifest", action="store_true", help="Don't use or update the ingestion manifest")
+    parser.add_argument("--no-dedup", action="store_true", help="Embed duplicate chunks separately")
+    parser.add_argument("--near-duplicate-threshold", default=defaults.near_duplicate_threshold,
+                        type=lambda value: None if value.lower() == "none" or float(value) <= 0 else float(value),
+                        help="MinHash similarity above which chunks are near duplicates ('none': exact duplicates only)")
+    parser.add_argument("--report-interval", type=float, default=defaults.report_interval)
+    parser.add_argument("--metrics", default=None, help="Write the metrics to <prefix>.json and <prefix>.prom")
+    args = parser.parse_args()
+
+    folder = args.folder or resolve_data_folder()
+    if folder is None:
+        return
+
+    config = PipelineConfig(
+        parse_workers=args.parse_workers,
+        chunk_workers=args.chunk_workers,
+        embed_workers=args.embed_workers,
+        upsert_workers=args.upsert_workers,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        embed_batch_size=args.embed_batch_size,
+        queue_size=args.queue_size,
+        parser=args.parser,
+        enable_chunking=not args.no_chunking,
+        incremental=not args.full,
+        dedup=not args.no_dedup,
+        near_duplicate_threshold=args.near_duplicate_threshold,
+        report_interval=args.report_interval
+    )
+    print(f"Processing markdown files from: {folder}")
+    pipeline = IngestionPipeline(VectorDB(collection_name=args.collection), config, use_manifest=not args.no_manifest)
+    pipeline.run(folder, dry_run=args.dry_run)
+
+    if args.metrics:
+        get_metrics().dump(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
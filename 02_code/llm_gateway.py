@@ -0,0 +1,309 @@
+import asyncio
+import datetime
+import email.utils
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+
+from metrics import MetricsRegistry, get_metrics
+
+if TYPE_CHECKING:
+    from embedding_scheduler import EmbeddingScheduler
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Status codes worth retrying: conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class LLMGateway:
+    """
+    Shared access point to the OpenAI API for every script.
+    It holds one persistent (HTTP/2 when available) connection pool for the sync and one for the async client,
+    bounds the number of concurrent calls per model, retries rate limits and transient errors with
+    jittered exponential backoff that honours Retry-After, and records latency and token counts per call
+    in the metrics registry (llm_request_latency_seconds, llm_requests_total, llm_tokens_total, ...).
+
+    Use get_gateway() instead of creating instances, so that all callers share the connection pools.
+    """
+    def __init__(self, api_key: str = None, max_connections: int = 64, default_concurrency: int = 16,
+                 model_concurrency: Dict[str, int] = None, max_retries: int = 6, base_delay: float = 0.5,
+                 max_delay: float = 60.0, timeout: float = 120.0, metrics: MetricsRegistry = None):
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OpenAI API key must be provided either as parameter or OPENAI_API_KEY environment variable")
+
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.default_concurrency = default_concurrency
+        self.model_concurrency = model_concurrency or {}
+
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                              keepalive_expiry=60)
+        http_timeout = httpx.Timeout(timeout, connect=10.0)
+
+        # Retries are done by the gateway, so the SDK's own retry loop is disabled
+        self.client = OpenAI(
+            api_key=api_key,
+            max_retries=0,
+            http_client=httpx.Client(http2=HTTP2_AVAILABLE, limits=limits, timeout=http_timeout)
+        )
+        self._api_key = api_key
+        self._limits = limits
+        self._http_timeout = http_timeout
+        # Async clients and semaphores are bound to the event loop they were created in
+        self._async_clients = weakref.WeakKeyDictionary()
+
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        self.metrics = metrics or get_metrics()
+        self._call_kinds = set()
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """AsyncOpenAI client of the running event loop, with its own persistent connection pool"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_clients:
+                self._async_clients[loop] = AsyncOpenAI(
+                    api_key=self._api_key,
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=self._limits,
+                                                  timeout=self._http_timeout)
+                )
+            return self._async_clients[loop]
+
+    def chat(self, model: str, messages: List[Dict[str, Any]], **kwargs):
+        """Create a chat completion"""
+        return self._call("chat", model, lambda: self.client.chat.completions.create(
+            model=model, messages=messages, **kwargs
+        ))
+
+    def embed(self, model: str, input: Any, scheduler: "EmbeddingScheduler" = None, tokens: int = 0, **kwargs):
+        """
+        Create embeddings.
+        With a scheduler the request waits for its budget of tokens (the token count of the input)
+        and reports rate limits and the rate limit headers of the response to it.
+        """
+        if scheduler is None:
+            return self._call("embeddings", model, lambda: self.client.embeddings.create(
+                model=model, input=input, **kwargs
+            ))
+        return self._call("embeddings", model, lambda: self.client.embeddings.with_raw_response.create(
+            model=model, input=input, **kwargs
+        ), scheduler=scheduler, tokens=tokens)
+
+    async def achat(self, model: str, messages: List[Dict[str, Any]], **kwargs):
+        """Create a chat completion with the async client"""
+        return await self._acall("chat", model, lambda: self.async_client.chat.completions.create(
+            model=model, messages=messages, **kwargs
+        ))
+
+    async def aembed(self, model: str, input: Any, scheduler: "EmbeddingScheduler" = None, tokens: int = 0,
+                     **kwargs):
+        """Create embeddings with the async client, see embed() for the scheduler"""
+        if scheduler is None:
+            return await self._acall("embeddings", model, lambda: self.async_client.embeddings.create(
+                model=model, input=input, **kwargs
+            ))
+        return await self._acall("embeddings", model, lambda: self.async_client.embeddings.with_raw_response.create(
+            model=model, input=input, **kwargs
+        ), scheduler=scheduler, tokens=tokens)
+
+    def _call(self, kind: str, model: str, request, scheduler: "EmbeddingScheduler" = None, tokens: int = 0):
+        with self._lock:
+            self._call_kinds.add((kind, model))
+        semaphore = self._semaphore_for(model)
+        for attempt in range(self.max_retries + 1):
+            # The concurrency slot is only held during the request itself, not while waiting for
+            # budget or backing off, so a rate limited call doesn't block the slots of other callers
+            ticket = scheduler.acquire(tokens) if scheduler is not None else None
+            try:
+                with semaphore:
+                    start = time.perf_counter()
+                    response = request()
+            except Exception as e:
+                if scheduler is not None:
+                    _release_failed(scheduler, ticket, e)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self.metrics.inc("llm_errors_total", kind=kind, model=model)
+                    raise
+                self.metrics.inc("llm_retries_total", kind=kind, model=model)
+                time.sleep(delay)
+                continue
+            if scheduler is not None:
+                response = _release_succeeded(scheduler, ticket, response)
+            self._record_success(kind, model, response, time.perf_counter() - start)
+            return response
+
+    async def _acall(self, kind: str, model: str, request, scheduler: "EmbeddingScheduler" = None,
+                     tokens: int = 0):
+        with self._lock:
+            self._call_kinds.add((kind, model))
+        semaphore = self._async_semaphore_for(model)
+        for attempt in range(self.max_retries + 1):
+            # The scheduler blocks while waiting for budget, so it waits in a thread. As in _call the
+            # slot is only held during the request
+            ticket = await asyncio.to_thread(scheduler.acquire, tokens) if scheduler is not None else None
+            try:
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await request()
+            except Exception as e:
+                if scheduler is not None:
+                    _release_failed(scheduler, ticket, e)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self.metrics.inc("llm_errors_total", kind=kind, model=model)
+                    raise
+                self.metrics.inc("llm_retries_total", kind=kind, model=model)
+                await asyncio.sleep(delay)
+                continue
+            if scheduler is not None:
+                response = _release_succeeded(scheduler, ticket, response)
+            self._record_success(kind, model, response, time.perf_counter() - start)
+            return response
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Return how long to wait before retrying the failed call, or None if it shouldn't be retried"""
+        if attempt >= self.max_retries:
+            return None
+
+        if isinstance(error, openai.APIStatusError):
+            if error.status_code not in RETRYABLE_STATUS_CODES:
+                return None
+            retry_after = parse_retry_after(error.response.headers)
+            if retry_after is not None:
+                return min(retry_after, self.max_delay)
+        elif not isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return None
+
+        # Full jitter exponential backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _semaphore_for(self, model: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if model not in self._semaphores:
+                limit = self.model_concurrency.get(model, self.default_concurrency)
+                self._semaphores[model] = threading.BoundedSemaphore(limit)
+            return self._semaphores[model]
+
+    def _async_semaphore_for(self, model: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphores = self._async_semaphores.setdefault(loop, {})
+            if model not in semaphores:
+                limit = self.model_concurrency.get(model, self.default_concurrency)
+                semaphores[model] = asyncio.Semaphore(limit)
+            return semaphores[model]
+
+    def _record_success(self, kind: str, model: str, response, latency: float):
+        self.metrics.observe("llm_request_latency_seconds", latency, kind=kind, model=model)
+        self.metrics.inc("llm_requests_total", kind=kind, model=model)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.metrics.inc("llm_tokens_total", getattr(usage, "prompt_tokens", 0) or 0,
+                             kind=kind, model=model, type="prompt")
+            self.metrics.inc("llm_tokens_total", getattr(usage, "completion_tokens", 0) or 0,
+                             kind=kind, model=model, type="completion")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return the call statistics per 'kind:model'"""
+        with self._lock:
+            call_kinds = sorted(self._call_kinds)
+        stats = {}
+        for kind, model in call_kinds:
+            latency = self.metrics.histogram_summary("llm_request_latency_seconds", kind=kind, model=model) or {}
+            stats[f"{kind}:{model}"] = {
+                "calls": self.metrics.counter_value("llm_requests_total", kind=kind, model=model),
+                "errors": self.metrics.counter_value("llm_errors_total", kind=kind, model=model),
+                "retries": self.metrics.counter_value("llm_retries_total", kind=kind, model=model),
+                "prompt_tokens": self.metrics.counter_value("llm_tokens_total", kind=kind, model=model, type="prompt"),
+                "completion_tokens": self.metrics.counter_value("llm_tokens_total", kind=kind, model=model,
+                                                                type="completion"),
+                "avg_latency": latency.get("mean"),
+                "p50_latency": latency.get("p50"),
+                "p95_latency": latency.get("p95"),
+                "p99_latency": latency.get("p99")
+            }
+        return stats
+
+    def print_stats(self):
+        for key, summary in self.stats().items():
+            print(f"{key}: {summary['calls']} calls, {summary['errors']} errors, {summary['retries']} retries, "
+                  f"{summary['prompt_tokens']} prompt / {summary['completion_tokens']} completion tokens, "
+                  f"p50 {summary['p50_latency'] or 0:.3f}s, p95 {summary['p95_latency'] or 0:.3f}s")
+
+
+def _release_failed(scheduler: "EmbeddingScheduler", ticket, error: Exception):
+    if isinstance(error, openai.APIStatusError):
+        rate_limited = error.status_code == 429
+        scheduler.release(ticket, error.response.headers, rate_limited=rate_limited, failed=not rate_limited,
+                          retry_after=parse_retry_after(error.response.headers))
+    else:
+        scheduler.release(ticket, failed=True)
+
+
+def _release_succeeded(scheduler: "EmbeddingScheduler", ticket, raw_response):
+    """Report the headers and token usage of a raw response to the scheduler and return the parsed response"""
+    response = raw_response.parse()
+    usage = getattr(response, "usage", None)
+    scheduler.release(ticket, raw_response.headers, used_tokens=getattr(usage, "prompt_tokens", None))
+    return response
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Parse the retry-after-ms / Retry-After headers into seconds"""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+_gateways: Dict[Optional[str], LLMGateway] = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(api_key: str = None) -> LLMGateway:
+    """Return the process wide gateway for the API key (OPENAI_API_KEY by default)"""
+    with _gateways_lock:
+        if api_key not in _gateways:
+            _gateways[api_key] = LLMGateway(api_key=api_key)
+        return _gateways[api_key]
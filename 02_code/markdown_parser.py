@@ -0,0 +1,72 @@
+import re
+from typing import List, Dict, Any
+
+from markdown_it import MarkdownIt
+
+# YAML front matter at the start of a file (title, weight, ... of the Qdrant docs)
+_FRONT_MATTER_PATTERN = re.compile(r"\A---[ \t]*\n.*?\n---[ \t]*(?:\n|\Z)", re.DOTALL)
+
+_markdown = MarkdownIt("commonmark").enable("table")
+
+
+def _inline_text(token) -> str:
+    """Plain text of an inline token: link and emphasis markup is dropped, image alt texts are kept"""
+    parts = []
+    for child in token.children or []:
+        if child.type in ("text", "code_inline", "html_inline"):
+            parts.append(child.content)
+        elif child.type == "softbreak":
+            parts.append(" ")
+        elif child.type == "hardbreak":
+            parts.append("\n")
+        elif child.type == "image":
+            parts.append(_inline_text(child))
+    return "".join(parts).strip()
+
+
+def parse_markdown_elements(text: str) -> List[Dict[str, Any]]:
+    """
+    Parse CommonMark (with tables) into the element shape produced from unstructured's partition_md:
+    dictionaries with the 'type' (Title, NarrativeText, ListItem, CodeSnippet, Table), the 'text' and,
+    for titles, the heading 'depth' (0 for '#'). Front matter and raw HTML blocks are skipped.
+    """
+    text = _FRONT_MATTER_PATTERN.sub("", text, count=1)
+    tokens = _markdown.parse(text)
+
+    elements = []
+    list_depth = 0
+    table_rows: List[List[str]] = []
+    heading_depth = None
+
+    for i, token in enumerate(tokens):
+        if token.type in ("bullet_list_open", "ordered_list_open"):
+            list_depth += 1
+        elif token.type in ("bullet_list_close", "ordered_list_close"):
+            list_depth -= 1
+        elif token.type == "heading_open":
+            heading_depth = int(token.tag[1:]) - 1
+        elif token.type == "heading_close":
+            heading_depth = None
+        elif token.type in ("fence", "code_block"):
+            elements.append({"type": "CodeSnippet", "text": token.content.rstrip("\n"), "depth": None})
+        elif token.type == "table_open":
+            table_rows = []
+        elif token.type == "tr_open":
+            table_rows.append([])
+        elif token.type == "inline" and table_rows and tokens[i - 1].type in ("th_open", "td_open"):
+            table_rows[-1].append(_inline_text(token))
+        elif token.type == "table_close":
+            elements.append({"type": "Table", "text": "\n".join(" ".join(row) for row in table_rows), "depth": None})
+            table_rows = []
+        elif token.type == "inline":
+            content = _inline_text(token)
+            if not content:
+                continue
+            if heading_depth is not None:
+                elements.append({"type": "Title", "text": content, "depth": heading_depth})
+            elif list_depth > 0:
+                elements.append({"type": "ListItem", "text": content, "depth": None})
+            else:
+                elements.append({"type": "NarrativeText", "text": content, "depth": None})
+
+    return elements
@@ -0,0 +1,104 @@
+import time
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+from vector_backends import truncate_vectors
+from vectordb import VectorDB
+
+
+def load_collection_vectors(vector_db: VectorDB, limit: Optional[int] = None) -> np.ndarray:
+    """Load the (full dimension) vectors of the collection into a normalized float32 matrix"""
+    vectors = []
+    for document in vector_db.iter_documents(batch_size=1024, with_payload=False, with_vectors=True):
+        vectors.append(document["vector"])
+        if limit is not None and len(vectors) >= limit:
+            break
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def benchmark_matryoshka(vectors: np.ndarray, dimensions: Sequence[int] = (64, 128, 256, 512),
+                         oversampling: Sequence[float] = (1, 2, 4, 8, 16), k: int = 10, num_queries: int = 200,
+                         queries: Optional[np.ndarray] = None, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Measure recall@k, latency and memory of two-stage search against exact full dimension search.
+    The first stage is an exact search over the truncated vectors returning oversampling * k candidates,
+    the second stage rescores them with the full vectors. Exact search isolates the loss caused by the
+    truncation itself, an HNSW index adds its own (tunable) approximation on top.
+
+    Args:
+        vectors: Normalized collection vectors, one row per point
+        queries: Query vectors, by default num_queries collection vectors are sampled
+            (the point itself is then part of its own ground truth, which slightly favours recall)
+
+    Returns:
+        One row per (dimensions, oversampling) setting, plus a 'full' baseline row
+    """
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+    k = min(k, len(vectors))
+    full_dimensions = vectors.shape[1]
+
+    start = time.perf_counter()
+    ground_truth = _top_k(queries @ vectors.T, k)
+    full_latency = (time.perf_counter() - start) / len(queries)
+
+    rows = [{
+        "dimensions": full_dimensions,
+        "oversampling": None,
+        "recall": 1.0,
+        "latency_ms": full_latency * 1000,
+        "first_stage_bytes": vectors.nbytes
+    }]
+
+    for dims in dimensions:
+        if dims >= full_dimensions:
+            continue
+        mini_vectors = truncate_vectors(vectors, dims)
+        mini_queries = truncate_vectors(queries, dims)
+
+        for factor in oversampling:
+            candidates_per_query = min(len(vectors), max(k, int(k * factor)))
+
+            start = time.perf_counter()
+            candidates = _top_k(mini_queries @ mini_vectors.T, candidates_per_query)
+            # Rescore the candidates with the full vectors
+            rescored = np.einsum("qd,qcd->qc", queries, vectors[candidates])
+            order = np.argsort(-rescored, axis=1)[:, :k]
+            results = np.take_along_axis(candidates, order, axis=1)
+            latency = (time.perf_counter() - start) / len(queries)
+
+            hits = sum(len(set(result) & set(truth)) for result, truth in zip(results.tolist(), ground_truth.tolist()))
+            rows.append({
+                "dimensions": dims,
+                "oversampling": factor,
+                "recall": hits / (len(queries) * k),
+                "latency_ms": latency * 1000,
+                "first_stage_bytes": mini_vectors.nbytes
+            })
+
+    return rows
+
+
+if __name__ == "__main__":
+    vector_db = VectorDB()
+    vectors = load_collection_vectors(vector_db)
+    print(f"Loaded {len(vectors)} vectors of {vectors.shape[1]} dimensions")
+
+    k = 10
+    print(f"{'Dims':>6} {'Oversampling':>13} {f'Recall@{k}':>10} {'Latency (ms)':>13} {'First stage (MB)':>17}")
+    for row in benchmark_matryoshka(vectors, k=k):
+        oversampling = "-" if row["oversampling"] is None else f"{row['oversampling']:g}x"
+        print(f"{row['dimensions']:>6} {oversampling:>13} {row['recall']:>10.3f} {row['latency_ms']:>13.3f} "
+              f"{row['first_stage_bytes'] / 1e6:>17.2f}")
+    print("\nUse CollectionConfig(mini_dimensions=..., mini_oversampling=...) with the smallest setting "
+          "whose recall is acceptable, and on_disk_vectors=True to move the full vectors out of RAM.")
@@ -0,0 +1,227 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple, Optional
+
+# Number of samples a histogram keeps for its percentiles
+RESERVOIR_SIZE = 4096
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Distribution of observed values.
+    Count, sum, min and max are exact, the percentiles come from a uniform reservoir sample
+    of at most RESERVOIR_SIZE values, so memory stays bounded on long runs.
+    """
+    def __init__(self, reservoir_size: int = RESERVOIR_SIZE):
+        self.reservoir_size = reservoir_size
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self._samples: List[float] = []
+        self._random = random.Random(0)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self._samples) < self.reservoir_size:
+            self._samples.append(value)
+        else:
+            index = self._random.randrange(self.count)
+            if index < self.reservoir_size:
+                self._samples[index] = value
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            **{f"p{int(q * 100)}": self.percentile(q) for q in QUANTILES}
+        }
+
+
+class MetricsRegistry:
+    """
+    Process wide counters and histograms, identified by a name and a set of labels.
+
+    Usage:
+        metrics = get_metrics()
+        with metrics.stage("vector_search"):
+            ...
+        metrics.inc("llm_tokens_total", 120, type="prompt", model="gpt-5")
+        metrics.write_prometheus("output/metrics.prom")
+    """
+    def __init__(self):
+        self._counters: Dict[Tuple[str, LabelSet], float] = {}
+        self._histograms: Dict[Tuple[str, LabelSet], Histogram] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, LabelSet]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increase a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Add a value to a histogram"""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of the block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def stage(self, stage_name: str, items: int = None):
+        """
+        Time a pipeline stage: its latency goes to the stage_latency_seconds histogram and
+        calls, errors and (optionally) processed items to the stage_*_total counters.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc("stage_errors_total", stage=stage_name)
+            raise
+        finally:
+            self.observe("stage_latency_seconds", time.perf_counter() - start, stage=stage_name)
+            self.inc("stage_calls_total", stage=stage_name)
+            if items is not None:
+                self.inc("stage_items_total", items, stage=stage_name)
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def histogram_summary(self, name: str, **labels) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            histogram = self._histograms.get(self._key(name, labels))
+            return histogram.summary() if histogram is not None else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return every counter and histogram summary as a JSON serializable dictionary"""
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram.summary()}
+                    for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0])
+                ]
+            }
+
+    def to_prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format (histograms as summaries)"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+
+            typed = set()
+            for (name, labels), value in counters:
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+            for (name, labels), histogram in histograms:
+                if name not in typed:
+                    lines.append(f"# TYPE {name} summary")
+                    typed.add(name)
+                for q in QUANTILES:
+                    value = histogram.percentile(q)
+                    if value is not None:
+                        lines.append(f"{name}{_format_labels(labels + (('quantile', str(q)),))} {value}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str):
+        _ensure_parent_directory(path)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def write_prometheus(self, path: str):
+        _ensure_parent_directory(path)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+
+    def dump(self, path_prefix: str):
+        """Write <path_prefix>.json and <path_prefix>.prom"""
+        self.write_json(f"{path_prefix}.json")
+        self.write_prometheus(f"{path_prefix}.prom")
+        print(f"Metrics written to: {path_prefix}.json, {path_prefix}.prom")
+
+    def print_summary(self):
+        """Print the latency percentiles of every histogram"""
+        snapshot = self.snapshot()
+        if not snapshot["histograms"]:
+            return
+        print(f"{'Metric':<60} {'count':>8} {'p50':>10} {'p95':>10} {'p99':>10}")
+        for histogram in snapshot["histograms"]:
+            name = histogram["name"] + _format_labels(tuple(histogram["labels"].items()))
+            print(f"{name:<60} {histogram['count']:>8} {histogram['p50']:>10.4f} {histogram['p95']:>10.4f} "
+                  f"{histogram['p99']:>10.4f}")
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _ensure_parent_directory(path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the process wide metrics registry"""
+    return _registry
@@ -0,0 +1,66 @@
+import glob
+import os
+import subprocess
+import sys
+import time
+from typing import List, Dict, Any
+
+from data_uploading import PARSERS, _parse_markdown_file, resolve_data_folder
+
+
+def measure_import_time(module: str, repeat: int = 3) -> float:
+    """Best wall clock time of importing a module in a fresh interpreter, minus the interpreter startup"""
+    def run(code: str) -> float:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return time.perf_counter() - start
+
+    baseline = min(run("pass") for _ in range(repeat))
+    return min(run(f"import {module}") for _ in range(repeat)) - baseline
+
+
+def benchmark_parser(parser: str, file_paths: List[str]) -> Dict[str, Any]:
+    """Parse every file in-process and measure the throughput, the first file includes any lazy import"""
+    start = time.perf_counter()
+    first_file_seconds = None
+    elements = 0
+    failures = 0
+    for file_path in file_paths:
+        try:
+            document = _parse_markdown_file(file_path, parser)
+            elements += len(document["elements"]) if document is not None else 0
+        except Exception as e:
+            failures += 1
+            if failures == 1:
+                print(f"{parser}: error parsing {file_path}: {type(e).__name__}: {e}")
+        if first_file_seconds is None:
+            first_file_seconds = time.perf_counter() - start
+    seconds = time.perf_counter() - start
+    steady_seconds = seconds - (first_file_seconds or 0)
+
+    return {
+        "parser": parser,
+        "seconds": seconds,
+        "first_file_seconds": first_file_seconds,
+        "files_per_second": (len(file_paths) - 1) / steady_seconds if steady_seconds > 0 else float("inf"),
+        "elements": elements,
+        "failures": failures
+    }
+
+
+if __name__ == "__main__":
+    data_folder = sys.argv[1] if len(sys.argv) > 1 else resolve_data_folder()
+    if data_folder is None:
+        sys.exit(1)
+    file_paths = sorted(glob.glob(os.path.join(data_folder, "**/*.md"), recursive=True))
+    print(f"Benchmarking on {len(file_paths)} files of {data_folder}\n")
+
+    print(f"{'Import':<30} {'Seconds':>8}")
+    for module in ("data_uploading", "markdown_parser", "unstructured.partition.md"):
+        print(f"{module:<30} {measure_import_time(module):>8.3f}")
+
+    print(f"\n{'Parser':<14} {'Total (s)':>10} {'First file (s)':>15} {'Files/s':>9} {'Elements':>9} {'Failed':>7}")
+    for parser in PARSERS:
+        row = benchmark_parser(parser, file_paths)
+        print(f"{row['parser']:<14} {row['seconds']:>10.2f} {row['first_file_seconds'] or 0:>15.3f} "
+              f"{row['files_per_second']:>9.1f} {row['elements']:>9} {row['failures']:>7}")
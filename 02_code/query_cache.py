@@ -0,0 +1,101 @@
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Dict, Tuple
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64 MB, about 10k text-embedding-3-small query vectors
+DEFAULT_TTL_SECONDS = 3600.0
+
+# Rough per-entry overhead of the key, the OrderedDict node and the array object
+ENTRY_OVERHEAD_BYTES = 200
+
+
+class QueryEmbeddingCache:
+    """
+    In-memory LRU cache of query embeddings with a time to live, meant for the search hot path.
+    Queries are normalized (whitespace collapsed, lower cased) before the lookup, so repeats that only
+    differ in spacing or case share an entry. Vectors are kept as float32 arrays, and the least recently
+    used entries are evicted once their total size exceeds max_bytes.
+    """
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self._entries: "OrderedDict[Tuple[str, int, str], Tuple[array, float]]" = OrderedDict()
+        self._size_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.split()).lower()
+
+    @staticmethod
+    def _entry_size(key: Tuple[str, int, str], vector: array) -> int:
+        return len(key[2]) + vector.itemsize * len(vector) + ENTRY_OVERHEAD_BYTES
+
+    def get_many(self, model: str, dimensions: int, queries: List[str]) -> List[Optional[List[float]]]:
+        """Look up the embeddings of the queries, returning None for the ones that are not cached or expired"""
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            for query in queries:
+                key = (model, dimensions, self.normalize(query))
+                entry = self._entries.get(key)
+                if entry is not None and self.ttl_seconds is not None and now - entry[1] > self.ttl_seconds:
+                    self._remove(key)
+                    self.expired += 1
+                    entry = None
+
+                if entry is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    results.append(entry[0].tolist())
+
+        return results
+
+    def put_many(self, model: str, dimensions: int, queries: List[str], vectors: List[List[float]]):
+        """Store the embeddings of the queries and evict the least recently used entries if needed"""
+        now = time.monotonic()
+        with self._lock:
+            for query, vector in zip(queries, vectors):
+                key = (model, dimensions, self.normalize(query))
+                if key in self._entries:
+                    self._remove(key)
+                stored = array("f", vector)
+                self._entries[key] = (stored, now)
+                self._size_bytes += self._entry_size(key, stored)
+
+            while self._size_bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evicted += 1
+
+    def _remove(self, key: Tuple[str, int, str]):
+        vector, _ = self._entries.pop(key)
+        self._size_bytes -= self._entry_size(key, vector)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the current size of the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "entries": len(self._entries),
+                "size_bytes": self._size_bytes,
+                "max_bytes": self.max_bytes
+            }
@@ -1,10 +1,12 @@
-import os
 import json
 from datetime import datetime
-from typing import List, Dict, Any, Callable, Optional, Tuple
+from itertools import islice
+from typing import List, Dict, Any, Callable, Optional, Tuple, Iterable
 from openai import OpenAI
 from dotenv import load_dotenv
 from tqdm import tqdm
+from llm_gateway import get_gateway
+from metrics import get_metrics
 from vectordb import VectorDB
 
 load_dotenv()
@@ -28,33 +30,31 @@ Query:"""
 def simulate_user_query_for_document(document: str, query_generator_prompt: str = DEFAULT_QUERY_GENERATOR_PROMPT, openai_client: OpenAI = None) -> str:
     """
     Simulate a user query for a given document.
-    It calls OpenAI API to get the user query.
+    It calls OpenAI API to get the user query, through the shared gateway unless a client is given.
     """
-    if openai_client is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OpenAI API key must be provided either as parameter or OPENAI_API_KEY environment variable")
-        openai_client = OpenAI(api_key=api_key)
-    
     prompt = query_generator_prompt.format(document=document)
+    messages = [{"role": "user", "content": prompt}]
     
-    response = openai_client.chat.completions.create(
-        model="gpt-5-mini",
-        messages=[{"role": "user", "content": prompt}]
-    )
+    if openai_client is None:
+        response = get_gateway().chat(model="gpt-5-mini", messages=messages)
+    else:
+        response = openai_client.chat.completions.create(model="gpt-5-mini", messages=messages)
     
     return response.choices[0].message.content.strip()
 
-def simulate_user_query_for_all_documents(documents: List[Dict[str, Any]], query_generator: Optional[Callable] = None, query_generator_prompt: str = DEFAULT_QUERY_GENERATOR_PROMPT, openai_client: OpenAI = None) -> List[Tuple[Dict[str, Any], str]]:
+def simulate_user_query_for_all_documents(documents: List[Dict[str, Any]], query_generator: Optional[Callable] = None, query_generator_prompt: str = DEFAULT_QUERY_GENERATOR_PROMPT, openai_client: OpenAI = None, show_progress: bool = True) -> List[Tuple[Dict[str, Any], str]]:
     """
     Simulate a user query for all documents
     Returns list of tuples (document_dict, generated_query)
+    
+    Args:
+        show_progress: Show a progress bar, callers with their own bar pass False
     """
     if query_generator is None:
         query_generator = simulate_user_query_for_document
     
     results = []
-    for document in tqdm(documents, desc="Generating queries"):
+    for document in tqdm(documents, desc="Generating queries", disable=not show_progress):
         try:
             query = query_generator(document["text"], query_generator_prompt, openai_client)
             results.append((document, query))
@@ -64,28 +64,54 @@ def simulate_user_query_for_all_documents(documents: List[Dict[str, Any]], query
     
     return results
 
-def evaluate_rag_level(vector_db: VectorDB, documents: Optional[List[Dict[str, Any]]] = None, query_generator: Optional[Callable] = None, query_generator_prompt: str = DEFAULT_QUERY_GENERATOR_PROMPT, top_k: int = 5, limit: Optional[int] = None, log_file: Optional[str] = None) -> Dict[str, float]:
+def evaluate_rag_level(vector_db: VectorDB, documents: Optional[Iterable[Dict[str, Any]]] = None, query_generator: Optional[Callable] = None, query_generator_prompt: str = DEFAULT_QUERY_GENERATOR_PROMPT, top_k: int = 5, limit: Optional[int] = None, log_file: Optional[str] = None, batch_size: int = 100, search_mode: str = "dense") -> Dict[str, float]:
     """
     It estimates the precision and recall of the RAG system. It generates the user query for each document and then checks if the retrieved documents contain the 
     document, that was used to generate the user query. Uses chunk_index from metadata for tracking.
+    Documents are processed in batches of batch_size, so the whole collection is streamed through
+    without materializing it in memory.
     
     Args:
+        documents: Optional list or iterator of documents, streamed from the vector db if not given
         limit: Optional limit on number of documents to process for evaluation
         log_file: Optional path to log file for debugging information
+        batch_size: Number of documents whose queries are generated and searched together
+        search_mode: Retrieval mode of the vector db, "dense", "sparse" or "hybrid"
     
     Returns:
         Dict with precision, recall, and f1_score metrics
     """
+    return _evaluate_search_modes(vector_db, documents, query_generator, query_generator_prompt, top_k, limit,
+                                  log_file, batch_size, (search_mode,))[search_mode]
+
+def compare_search_modes(vector_db: VectorDB, documents: Optional[Iterable[Dict[str, Any]]] = None, query_generator: Optional[Callable] = None, search_modes: Tuple[str, ...] = ("dense", "sparse", "hybrid"), query_generator_prompt: str = DEFAULT_QUERY_GENERATOR_PROMPT, top_k: int = 5, limit: Optional[int] = None, log_file: Optional[str] = None, batch_size: int = 100) -> Dict[str, Dict[str, float]]:
+    """
+    Evaluate every search mode in a single pass over the documents. The queries of each batch are
+    generated once and searched with every mode, so the modes are compared on exactly the same queries,
+    and they are dropped with the batch instead of being kept for the whole collection.
+    
+    Args:
+        search_modes: Search modes to compare
+        other arguments: as in evaluate_rag_level
+    
+    Returns:
+        Dict mapping each search mode to its metrics
+    """
+    return _evaluate_search_modes(vector_db, documents, query_generator, query_generator_prompt, top_k, limit,
+                                  log_file, batch_size, tuple(search_modes))
+
+def _evaluate_search_modes(vector_db: VectorDB, documents: Optional[Iterable[Dict[str, Any]]], query_generator: Optional[Callable], query_generator_prompt: str, top_k: int, limit: Optional[int], log_file: Optional[str], batch_size: int, search_modes: Tuple[str, ...]) -> Dict[str, Dict[str, float]]:
+    """Evaluate the search modes on the same generated queries, one batch of documents at a time"""
     if documents is None:
-        # Get all documents from vector database
-        documents = vector_db.get_all_documents()
+        # Stream all documents from vector database
+        documents = vector_db.iter_documents()
+    
+    total_documents = len(documents) if isinstance(documents, list) else None
     
     # Apply limit if specified
     if limit is not None and limit > 0:
-        documents = documents[:limit]
-    
-    if not documents:
-        return {"precision": 0.0, "recall": 0.0, "f1_score": 0.0, "total_queries": 0}
+        documents = islice(documents, limit)
+        total_documents = min(total_documents, limit) if total_documents is not None else limit
     
     # Initialize logging
     log_data = []
@@ -93,107 +119,132 @@ def evaluate_rag_level(vector_db: VectorDB, documents: Optional[List[Dict[str, A
         log_data.append({
             "timestamp": datetime.now().isoformat(),
             "evaluation_start": True,
-            "total_documents": len(documents),
+            "total_documents": total_documents,
             "top_k": top_k,
-            "limit": limit
+            "limit": limit,
+            "search_mode": search_modes[0] if len(search_modes) == 1 else list(search_modes)
         })
     
-    # Generate queries for all documents
-    document_queries = simulate_user_query_for_all_documents(documents, query_generator, query_generator_prompt, vector_db.openai_client)
-    
-    if not document_queries:
-        return {"precision": 0.0, "recall": 0.0, "f1_score": 0.0, "total_queries": 0}
+    total_queries = 0
+    relevant_retrieved = dict.fromkeys(search_modes, 0)  # Number of times the original document was retrieved
+    total_retrieved = dict.fromkeys(search_modes, 0)     # Total number of retrieved documents
     
-    total_queries = len(document_queries)
-    relevant_retrieved = 0  # Number of times the original document was retrieved
-    total_retrieved = 0     # Total number of retrieved documents
+    # Only the debug log reads the retrieved texts, the metrics just need the chunk identity
+    result_fields = None if log_file else ["chunk_index", "file_path"]
     
-    for query_idx, (original_document, query) in enumerate(tqdm(document_queries, desc="Evaluating queries")):
+    progress = tqdm(total=total_documents, desc="Evaluating queries")
+    documents = iter(documents)
+    while True:
+        document_batch = list(islice(documents, batch_size))
+        if not document_batch:
+            break
+        
         try:
-            # Search for documents using the generated query
-            search_results = vector_db.search(query, limit=top_k)
-            total_retrieved += 1
-            
-            # Get the original document's chunk_index from metadata
-            original_chunk_index = original_document.get("metadata", {}).get("chunk_index")
+            # Generate queries for the documents of the batch, the batch is counted by the outer bar only
+            document_queries = simulate_user_query_for_all_documents(document_batch, query_generator,
+                                                                     query_generator_prompt, show_progress=False)
+            if not document_queries:
+                continue
             
-            # Check if the original document is in the retrieved results using chunk_index
-            found_match = False
-            for result in search_results:
-                result_chunk_index = result.get("metadata", {}).get("chunk_index")
-                if result_chunk_index is not None and result_chunk_index == original_chunk_index:
-                    relevant_retrieved += 1
-                    found_match = True
-                    break
+            query_offset = total_queries
+            total_queries += len(document_queries)
             
-            # Log detailed information for debugging
-            if log_file:
-                log_entry = {
-                    "query_index": query_idx,
-                    "timestamp": datetime.now().isoformat(),
-                    "query": query,
-                    "ground_truth": {
-                        "chunk_index": original_chunk_index,
-                        "text": original_document.get("text", "")[:200] + "..." if len(original_document.get("text", "")) > 200 else original_document.get("text", ""),
-                        "metadata": original_document.get("metadata", {})
-                    },
-                    "retrieved_results": [
-                        {
-                            "chunk_index": result.get("metadata", {}).get("chunk_index"),
-                            "text": result.get("text", "")[:200] + "..." if len(result.get("text", "")) > 200 else result.get("text", ""),
-                            "metadata": result.get("metadata", {}),
-                            "score": result.get("score", 0.0) if "score" in result else None
-                        }
-                        for result in search_results
-                    ],
-                    "match_found": found_match,
-                    "num_retrieved": len(search_results)
-                }
-                log_data.append(log_entry)
+            for search_mode in search_modes:
+                # Search for all generated queries with batched embedding and Qdrant requests
+                try:
+                    all_search_results = vector_db.search_many([query for _, query in document_queries], limit=top_k,
+                                                               mode=search_mode, fields=result_fields)
+                except Exception as e:
+                    print(f"Error during search: {e}")
+                    if log_file:
+                        for query_idx, (_, query) in enumerate(document_queries, start=query_offset):
+                            log_data.append({
+                                "query_index": query_idx,
+                                "timestamp": datetime.now().isoformat(),
+                                "query": query,
+                                "search_mode": search_mode,
+                                "error": str(e)
+                            })
+                    continue
+                
+                for query_idx, ((original_document, query), search_results) in enumerate(
+                        zip(document_queries, all_search_results), start=query_offset):
+                    total_retrieved[search_mode] += 1
                     
-        except Exception as e:
-            print(f"Error during search: {e}")
-            if log_file:
-                log_data.append({
-                    "query_index": query_idx,
-                    "timestamp": datetime.now().isoformat(),
-                    "query": query,
-                    "error": str(e)
-                })
-            continue
+                    # Get the original document's chunk_index from metadata
+                    original_chunk_index = original_document.get("metadata", {}).get("chunk_index")
+                    
+                    # Check if the original document is in the retrieved results using chunk_index
+                    found_match = False
+                    for result in search_results:
+                        result_chunk_index = result.get("metadata", {}).get("chunk_index")
+                        if result_chunk_index is not None and result_chunk_index == original_chunk_index:
+                            relevant_retrieved[search_mode] += 1
+                            found_match = True
+                            break
+                    
+                    # Log detailed information for debugging
+                    if log_file:
+                        log_entry = {
+                            "query_index": query_idx,
+                            "timestamp": datetime.now().isoformat(),
+                            "query": query,
+                            "search_mode": search_mode,
+                            "ground_truth": {
+                                "chunk_index": original_chunk_index,
+                                "text": original_document.get("text", "")[:200] + "..." if len(original_document.get("text", "")) > 200 else original_document.get("text", ""),
+                                "metadata": original_document.get("metadata", {})
+                            },
+                            "retrieved_results": [
+                                {
+                                    "chunk_index": result.get("metadata", {}).get("chunk_index"),
+                                    "text": result.get("text", "")[:200] + "..." if len(result.get("text", "")) > 200 else result.get("text", ""),
+                                    "metadata": result.get("metadata", {}),
+                                    "score": result.get("score", 0.0) if "score" in result else None
+                                }
+                                for result in search_results
+                            ],
+                            "match_found": found_match,
+                            "num_retrieved": len(search_results)
+                        }
+                        log_data.append(log_entry)
+        finally:
+            # Failed batches count too, so the bar reaches its total
+            progress.update(len(document_batch))
+    progress.close()
+    
+    if total_queries == 0:
+        return {search_mode: {"precision": 0.0, "recall": 0.0, "f1_score": 0.0, "total_queries": 0}
+                for search_mode in search_modes}
     
     # Calculate metrics
-    precision = relevant_retrieved / total_queries if total_queries > 0 else 0.0
-    recall = relevant_retrieved / total_queries if total_queries > 0 else 0.0
-    f1_score = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0.0
+    results = {}
+    for search_mode in search_modes:
+        precision = relevant_retrieved[search_mode] / total_queries if total_queries > 0 else 0.0
+        recall = relevant_retrieved[search_mode] / total_queries if total_queries > 0 else 0.0
+        f1_score = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0.0
+        results[search_mode] = {
+            "precision": precision,
+            "recall": recall,
+            "f1_score": f1_score,
+            "total_queries": total_queries,
+            "relevant_retrieved": relevant_retrieved[search_mode],
+            "total_retrieved": total_retrieved[search_mode]
+        }
     
     # Write log file if specified
     if log_file:
         log_data.append({
             "timestamp": datetime.now().isoformat(),
             "evaluation_end": True,
-            "final_metrics": {
-                "precision": precision,
-                "recall": recall,
-                "f1_score": f1_score,
-                "total_queries": total_queries,
-                "relevant_retrieved": relevant_retrieved,
-                "total_retrieved": total_retrieved
-            }
+            "final_metrics": results[search_modes[0]] if len(search_modes) == 1 else results
         })
         
         with open(log_file, 'w') as f:
             json.dump(log_data, f, indent=2)
         print(f"Debug log written to: {log_file}")
     
-    return {
-        "precision": precision,
-        "recall": recall,
-        "f1_score": f1_score,
-        "total_queries": total_queries,
-        "relevant_retrieved": relevant_retrieved,
-        "total_retrieved": total_retrieved
-    }
+    return results
 
 if __name__ == "__main__":
     # Example usage
@@ -212,6 +263,14 @@ if __name__ == "__main__":
         print(f"Total queries: {results['total_queries']}")
         print(f"Relevant retrieved: {results['relevant_retrieved']}")
         print(f"Total retrieved: {results['total_retrieved']}")
+        if vector_db.embedding_cache is not None:
+            print(f"Embedding cache: {vector_db.embedding_cache.stats()}")
+        if vector_db.query_cache is not None:
+            print(f"Query cache: {vector_db.query_cache.stats()}")
+        
+        # Stage latencies, LLM calls and tokens of the run
+        get_metrics().print_summary()
+        get_metrics().dump("output/rag_level_evaluation_metrics")
         
     except Exception as e:
         print(f"Error during evaluation: {e}")
\ No newline at end of file
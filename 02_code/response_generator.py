@@ -1,7 +1,7 @@
 
-from openai import OpenAI
-import os
 from dotenv import load_dotenv
+from llm_gateway import get_gateway
+from metrics import get_metrics
 from vectordb import VectorDB
 
 # Load environment variables
@@ -28,27 +28,26 @@ def generate_response(query: str, documents: list[str]) -> str:
     Returns:
         Generated response string
     """
-    # Initialize OpenAI client
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OpenAI API key must be provided as OPENAI_API_KEY environment variable")
+    # Shared client with pooled connections and retries
+    gateway = get_gateway()
+    metrics = get_metrics()
     
-    client = OpenAI(api_key=api_key)
-    
-    # Format documents for the prompt
-    formatted_documents = "\n\n".join([f"Document {i+1}: {doc}" for i, doc in enumerate(documents)])
-    
-    # Create the user message
-    user_message = USER_PROMPT.format(query=query, documents=formatted_documents)
+    with metrics.stage("prompt_assembly"):
+        # Format documents for the prompt
+        formatted_documents = "\n\n".join([f"Document {i+1}: {doc}" for i, doc in enumerate(documents)])
+        
+        # Create the user message
+        user_message = USER_PROMPT.format(query=query, documents=formatted_documents)
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_message}
-            ]
-        )
+        with metrics.stage("generation"):
+            response = gateway.chat(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": user_message}
+                ]
+            )
         
         return response.choices[0].message.content
     
@@ -66,21 +65,24 @@ def full_response_pipeline(query: str, vector_db: VectorDB) -> str:
     Returns:
         Generated response string
     """
+    metrics = get_metrics()
     try:
-        # Retrieve relevant documents
-        search_results = vector_db.search(query, limit=3)
-        
-        # Extract document texts from search results
-        documents = [result["text"] for result in search_results]
-        
-        # If no documents found, return appropriate message
-        if not documents:
-            return "I couldn't find any relevant documents to answer your query."
-        
-        # Generate response using retrieved documents
-        response = generate_response(query, documents)
-        
-        return response
+        with metrics.stage("rag_pipeline"):
+            # Retrieve relevant documents
+            with metrics.stage("retrieval"):
+                search_results = vector_db.search(query, limit=3, fields=["text"])
+            
+            # Extract document texts from search results
+            documents = [result["text"] for result in search_results]
+            
+            # If no documents found, return appropriate message
+            if not documents:
+                return "I couldn't find any relevant documents to answer your query."
+            
+            # Generate response using retrieved documents
+            response = generate_response(query, documents)
+            
+            return response
     
     except Exception as e:
         return f"Error in response pipeline: {str(e)}"
@@ -88,4 +90,5 @@ def full_response_pipeline(query: str, vector_db: VectorDB) -> str:
 if __name__ == "__main__":
     vector_db = VectorDB()
     response = full_response_pipeline("Where is the default configuration file for qdrant?", vector_db)
-    print(response)
\ No newline at end of file
+    print(response)
+    get_metrics().print_summary()
\ No newline at end of file
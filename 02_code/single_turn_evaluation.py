@@ -1,8 +1,9 @@
 import json
 import os
 from typing import Dict, List, Any
-from openai import OpenAI
 from dotenv import load_dotenv
+from llm_gateway import get_gateway
+from metrics import get_metrics
 from response_generator import full_response_pipeline
 from vectordb import VectorDB
 
@@ -54,11 +55,7 @@ def evaluate_correctness(generated_response: str, ground_truth: str) -> Dict[str
     Returns:
         Dictionary with evaluation result and explanation
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OpenAI API key must be provided as OPENAI_API_KEY environment variable")
-    
-    client = OpenAI(api_key=api_key)
+    gateway = get_gateway()
     
     prompt = CORRECTNESS_JUDGE_PROMPT.format(
         ground_truth=ground_truth,
@@ -66,7 +63,7 @@ def evaluate_correctness(generated_response: str, ground_truth: str) -> Dict[str
     )
     
     try:
-        response = client.chat.completions.create(
+        response = gateway.chat(
             model="gpt-5",
             messages=[{"role": "user", "content": prompt}]
         )
@@ -120,11 +117,7 @@ def evaluate_relevance(generated_response: str, query: str) -> Dict[str, Any]:
     Returns:
         Dictionary with evaluation result and explanation
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OpenAI API key must be provided as OPENAI_API_KEY environment variable")
-    
-    client = OpenAI(api_key=api_key)
+    gateway = get_gateway()
     
     prompt = RELEVANCE_JUDGE_PROMPT.format(
         query=query,
@@ -132,7 +125,7 @@ def evaluate_relevance(generated_response: str, query: str) -> Dict[str, Any]:
     )
     
     try:
-        response = client.chat.completions.create(
+        response = gateway.chat(
             model="gpt-5",
             messages=[{"role": "user", "content": prompt}]
         )
@@ -315,4 +308,8 @@ if __name__ == "__main__":
     # Print summary
     print_evaluation_summary(results)
     
-    print(f"\nDetailed results saved to: {output_path}")
\ No newline at end of file
+    print(f"\nDetailed results saved to: {output_path}")
+    
+    # Stage latencies, LLM calls and tokens of the run
+    get_metrics().print_summary()
+    get_metrics().dump("output/single_turn_evaluation_metrics")
\ No newline at end of file
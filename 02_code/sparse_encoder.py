@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from typing import List, Dict, Set, Tuple
+
+DEFAULT_SPARSE_DIR = "sparse_vocab"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+STOP_WORDS = frozenset("""
+a an and are as at be but by for from has have how i if in into is it its of on or so that the their them
+then there these they this to was were what when where which who why will with you your
+""".split())
+
+
+class BM25Encoder:
+    """
+    Computes BM25 sparse vectors locally, for Qdrant sparse vectors with the IDF modifier.
+    Documents are encoded with the BM25 term-frequency part (k1 saturation and b length normalization),
+    the inverse document frequency is applied by Qdrant at search time from the collection statistics.
+    The token vocabulary and the corpus length statistics are persisted as JSON, so that queries map
+    to the same indices as the documents did at ingest time.
+
+    Documents encoded early use the average document length known at that time, which is close enough
+    once the corpus has a few hundred chunks. Each distinct text is counted in the statistics once, so
+    re-encoding unchanged chunks on a re-ingestion doesn't skew them; texts of removed or replaced
+    chunks stay counted.
+    """
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.doc_count = 0
+        self.total_length = 0
+        # Hashes of the texts counted in doc_count and total_length
+        self.counted: Set[str] = set()
+        self._lock = threading.Lock()
+        # Serializes save() calls, so an older state can't replace a newer one
+        self._save_lock = threading.Lock()
+        self._dirty = False
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.vocab = state["vocab"]
+            self.doc_count = state["doc_count"]
+            self.total_length = state["total_length"]
+            self.counted = set(state.get("counted", []))
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    def encode_documents(self, texts: List[str]) -> List[Tuple[List[int], List[float]]]:
+        """Encode documents into (indices, values) sparse vectors, adding new tokens to the vocabulary"""
+        tokenized = [self.tokenize(text) for text in texts]
+        hashes = [self.text_hash(text) for text in texts]
+
+        with self._lock:
+            for text_hash, tokens in zip(hashes, tokenized):
+                if text_hash in self.counted:
+                    continue
+                for token in tokens:
+                    if token not in self.vocab:
+                        self.vocab[token] = len(self.vocab)
+                self.counted.add(text_hash)
+                self.doc_count += 1
+                self.total_length += len(tokens)
+                self._dirty = True
+            avg_length = self.total_length / self.doc_count if self.doc_count else 1.0
+
+            vectors = []
+            for tokens in tokenized:
+                length_norm = self.k1 * (1 - self.b + self.b * len(tokens) / avg_length)
+                counts = Counter(tokens)
+                indices = [self.vocab[token] for token in counts]
+                values = [tf * (self.k1 + 1) / (tf + length_norm) for tf in counts.values()]
+                vectors.append((indices, values))
+
+        return vectors
+
+    def encode_query(self, text: str) -> Tuple[List[int], List[float]]:
+        """Encode a query, tokens that never occurred in a document are dropped"""
+        tokens = {token for token in self.tokenize(text) if token in self.vocab}
+        indices = [self.vocab[token] for token in tokens]
+        return indices, [1.0] * len(indices)
+
+    def save(self):
+        """
+        Persist the vocabulary and corpus statistics, if documents were encoded since the last save.
+        The state is copied under the lock and written to a temporary file that replaces the old one,
+        so concurrent encoders and savers never produce a partial file.
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty and os.path.exists(self.path):
+                    return
+                state = {"vocab": dict(self.vocab), "doc_count": self.doc_count, "total_length": self.total_length,
+                         "counted": sorted(self.counted), "k1": self.k1, "b": self.b}
+                self._dirty = False
+
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            try:
+                with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, suffix=".tmp",
+                                                 delete=False) as f:
+                    json.dump(state, f)
+                os.replace(f.name, self.path)
+            except BaseException:
+                with self._lock:
+                    self._dirty = True
+                if os.path.exists(f.name):
+                    os.remove(f.name)
+                raise
+
+    @classmethod
+    def for_collection(cls, collection_name: str, directory: str = DEFAULT_SPARSE_DIR) -> "BM25Encoder":
+        return cls(os.path.join(directory, f"{collection_name}_bm25.json"))
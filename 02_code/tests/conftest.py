@@ -0,0 +1,39 @@
+import hashlib
+import os
+import sys
+from typing import List
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedders import Embedder  # noqa: E402
+
+
+class StubEmbedder(Embedder):
+    """Deterministic embedder derived from the hash of the text, so the tests need no API key"""
+    def __init__(self, dimensions: int = 16):
+        self.model_name = "stub"
+        self.dimensions = dimensions
+        self.embedded_texts: List[str] = []
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self.embedded_texts.extend(texts)
+        return [
+            np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:self.dimensions], dtype=np.uint8)
+            .astype(float).tolist()
+            for text in texts
+        ]
+
+
+@pytest.fixture(autouse=True)
+def _work_dir(tmp_path, monkeypatch):
+    """Run every test in its own directory, the caches and indexes default to paths below it"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+
+
+@pytest.fixture
+def embedder() -> StubEmbedder:
+    return StubEmbedder()
@@ -0,0 +1,71 @@
+import asyncio
+import os
+
+import pytest
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Distance, VectorParams
+
+from async_vectordb import AsyncVectorDB
+from collection_config import CollectionConfig
+from conftest import StubEmbedder
+from vectordb import VectorDB, content_hash
+
+
+def documents(texts):
+    return [{"text": text, "metadata": {"file_path": "/docs/a.md", "file_name": "a.md", "chunk_index": i}}
+            for i, text in enumerate(texts)]
+
+
+def make_vector_db(embedder, client: AsyncQdrantClient = None, **kwargs) -> AsyncVectorDB:
+    return AsyncVectorDB(client=client or AsyncQdrantClient(":memory:"), embedder=embedder,
+                         use_embedding_cache=False, use_query_cache=False, **kwargs)
+
+
+def test_add_documents_uses_the_same_point_ids_as_vectordb(embedder):
+    docs = documents(["Qdrant stores vectors.", "Payload indexes speed up filters."])
+
+    async def add_twice():
+        async with make_vector_db(embedder) as vector_db:
+            first = await vector_db.add_documents(docs)
+            second = await vector_db.add_documents(docs)
+            return first, second, await vector_db.get_all_documents()
+
+    first, second, stored = asyncio.run(add_twice())
+
+    assert first == second == VectorDB.document_ids(docs)
+    assert len(stored) == 2
+    assert all(document["metadata"]["content_hash"] == content_hash(document["text"]) for document in stored)
+
+
+def test_existing_collection_gets_its_metadata_and_rejects_another_model(embedder):
+    async def open_collections():
+        client = AsyncQdrantClient(":memory:")
+        # Collection created before the embedding model was recorded
+        await client.create_collection("documents", vectors_config=VectorParams(size=16, distance=Distance.COSINE))
+        await make_vector_db(embedder, client=client).add_documents(documents(["Qdrant stores vectors."]))
+        metadata = (await client.get_collection("documents")).config.metadata
+
+        other = StubEmbedder()
+        other.model_name = "other"
+        with pytest.raises(ValueError, match="was built with stub"):
+            await make_vector_db(other, client=client).add_documents(documents(["Another text."]))
+        return metadata
+
+    assert asyncio.run(open_collections()) == {"embedding_model": "stub", "embedding_dimensions": 16}
+
+
+def test_sparse_vocabulary_is_saved_on_close_and_scroll_returns_the_dense_vector(embedder):
+    docs = documents(["Qdrant stores vectors.", "Payload indexes speed up filters."])
+
+    async def add_and_scroll():
+        async with make_vector_db(embedder, collection_config=CollectionConfig(sparse=True)) as vector_db:
+            await vector_db.add_documents(docs)
+            saved_before_close = os.path.exists(vector_db.sparse_encoder.path)
+            stored = [document async for document in vector_db.iter_documents(with_vectors=True)]
+        return saved_before_close, os.path.exists(vector_db.sparse_encoder.path), stored
+
+    saved_before_close, saved_on_close, stored = asyncio.run(add_and_scroll())
+
+    assert not saved_before_close
+    assert saved_on_close
+    assert [len(document["vector"]) for document in stored] == [16, 16]
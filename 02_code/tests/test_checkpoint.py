@@ -0,0 +1,43 @@
+from checkpoint import UploadCheckpoint
+
+
+def documents(*chunk_indexes):
+    return [{"text": f"chunk {i}", "metadata": {"file_path": "/docs/a.md", "chunk_index": i}} for i in chunk_indexes]
+
+
+def test_resume_after_truncated_last_line(tmp_path):
+    path = str(tmp_path / "upload.jsonl")
+    checkpoint = UploadCheckpoint(path)
+    checkpoint.record_completed(["p1", "p2"])
+    checkpoint.record_failed(documents(2), ["p3"], RuntimeError("rate limited"))
+    checkpoint.close()
+    # The process was killed while writing the next record
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"event": "completed", "ids": ["p')
+
+    checkpoint = UploadCheckpoint(path)
+    assert checkpoint.completed == {"p1", "p2"}
+    assert set(checkpoint.failed) == {"p3"}
+    assert checkpoint.failed["p3"].error == "RuntimeError: rate limited"
+    checkpoint.record_completed(["p3", "p4"])
+    checkpoint.close()
+
+    checkpoint = UploadCheckpoint(path)
+    assert checkpoint.completed == {"p1", "p2", "p3", "p4"}
+    assert checkpoint.failed == {}
+    checkpoint.close()
+    with open(path, encoding="utf-8") as f:
+        assert all(line.startswith('{"event"') for line in f)
+
+
+def test_clear_forgets_previous_run(tmp_path):
+    checkpoint = UploadCheckpoint.for_collection("docs", directory=str(tmp_path))
+    checkpoint.record_completed(["p1"])
+    checkpoint.clear()
+    checkpoint.record_failed(documents(0), ["p2"], ValueError("bad input"))
+    checkpoint.close()
+
+    checkpoint = UploadCheckpoint.for_collection("docs", directory=str(tmp_path))
+    assert checkpoint.completed == set()
+    assert list(checkpoint.failed) == ["p2"]
+    checkpoint.close()
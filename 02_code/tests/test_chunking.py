@@ -0,0 +1,48 @@
+import pytest
+
+from chunking import chunk_elements, chunk_text
+from token_utils import count_tokens
+
+SENTENCES = [f"Sentence {i} explains how the collection number {i} stores its vectors on disk." for i in range(300)]
+
+
+def long_text() -> str:
+    paragraphs = [" ".join(SENTENCES[i:i + 7]) for i in range(0, len(SENTENCES), 7)]
+    return "\n\n".join(paragraphs)
+
+
+@pytest.mark.parametrize("target_tokens, max_tokens, overlap_tokens", [(350, 500, 50), (60, 80, 20), (20, 25, 0)])
+def test_chunk_text_respects_max_tokens(target_tokens, max_tokens, overlap_tokens):
+    chunks = chunk_text(long_text(), target_tokens=target_tokens, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= max_tokens for chunk in chunks)
+    # Nothing is lost: every sentence ends up in a chunk
+    text = " ".join(chunks)
+    assert all(sentence in text for sentence in SENTENCES)
+
+
+def test_chunk_text_splits_a_sentence_longer_than_max_tokens():
+    sentence = " ".join(f"word{i}" for i in range(2000))
+
+    chunks = chunk_text(sentence, target_tokens=100, max_tokens=120, overlap_tokens=0)
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 120 for chunk in chunks)
+
+
+def test_chunk_elements_respects_max_tokens_and_keeps_sections():
+    elements = [
+        {"type": "Title", "text": "Storage", "depth": 0},
+        {"type": "NarrativeText", "text": long_text()},
+        {"type": "Title", "text": "Indexing", "depth": 1},
+        {"type": "ListItem", "text": "HNSW graphs are built per segment."},
+        {"type": "NarrativeText", "text": " ".join(SENTENCES[:20])},
+    ]
+
+    chunks = chunk_elements(elements, target_tokens=100, max_tokens=150)
+
+    assert all(count_tokens(chunk["text"]) <= 150 for chunk in chunks)
+    assert chunks[0]["heading_path"] == ["Storage"]
+    assert chunks[-1]["heading_path"] == ["Storage", "Indexing"]
+    assert any("HNSW graphs" in chunk["text"] for chunk in chunks)
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+from qdrant_client import QdrantClient
+
+from data_uploading import process_markdown_files, upload_documents_to_qdrant
+from dedup import DedupIndex
+from ingestion_pipeline import IngestionPipeline, PipelineConfig
+from vector_backends import LocalVectorBackend, QdrantBackend
+from vectordb import VectorDB
+
+SHARED_TEXT = "To clean the oven, mix baking soda with a little water and leave the paste overnight."
+
+
+def write_file(folder, relative_path: str, text: str):
+    path = os.path.join(folder, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def ingest(vector_db: VectorDB, folder) -> dict:
+    config = PipelineConfig(parse_workers=1, embed_workers=1, report_interval=0)
+    return IngestionPipeline(vector_db, config, dedup_index=DedupIndex.for_collection(vector_db.collection_name)).run(
+        str(folder))
+
+
+@pytest.fixture(params=["qdrant", "local"])
+def vector_db(request, embedder, tmp_path):
+    if request.param == "qdrant":
+        backend = QdrantBackend(client=QdrantClient(":memory:"))
+    else:
+        backend = LocalVectorBackend(path=str(tmp_path / "local"))
+    return VectorDB(backend=backend, embedder=embedder, use_embedding_cache=False, use_query_cache=False)
+
+
+def test_filtered_search_finds_merged_duplicate(vector_db, embedder, tmp_path):
+    docs = tmp_path / "docs"
+    for name in ("a.md", "b.md", "c.md"):
+        write_file(docs, f"v1.0.x/{name}", f"# Cleaning\n\n{SHARED_TEXT}\n")
+
+    summary = ingest(vector_db, docs)
+
+    assert summary["duplicate_chunks"] == 2
+    assert embedder.embedded_texts.count(SHARED_TEXT) <= 1
+    for name in ("a.md", "b.md", "c.md"):
+        results = vector_db.search("baking soda", limit=5, filter={"file_name": name})
+        assert len(results) == 1
+        assert "baking soda" in results[0]["text"]
+        assert sorted(results[0]["metadata"]["file_name"]) == ["a.md", "b.md", "c.md"]
+        assert len(results[0]["metadata"]["sources"]) == 3
+
+
+def test_near_duplicates_are_not_merged_across_versions(vector_db, tmp_path):
+    docs = tmp_path / "docs"
+    steps = " ".join(f"Step {i}: spread the paste over the inner wall number {i} of the oven." for i in range(10))
+    old_text = f"{SHARED_TEXT} {steps} Wipe it off in the morning with a damp cloth."
+    new_text = f"{SHARED_TEXT} {steps} Wipe it off in the morning with a damp sponge."
+    index = DedupIndex(str(tmp_path / "check.sqlite"))
+    # Similar enough to be merged if they were in the same version
+    assert index.find(*index.fingerprint(new_text)) is None
+    index.add("old", *index.fingerprint(old_text), version="v1.0.x")
+    assert index.find(*index.fingerprint(new_text), version="v1.0.x") == "old"
+    write_file(docs, "v1.0.x/oven.md", f"# Cleaning\n\n{old_text}\n")
+    write_file(docs, "v2.0.x/oven.md", f"# Cleaning\n\n{new_text}\n")
+
+    summary = ingest(vector_db, docs)
+
+    assert summary["duplicate_chunks"] == 0
+    results = vector_db.search("baking soda", limit=5, filter={"version": "v2.0.x"})
+    assert results
+    assert all("sponge" in result["text"] and "cloth" not in result["text"] for result in results)
+
+
+def test_upload_keeps_a_merged_point_another_file_still_shares(vector_db, tmp_path):
+    docs = tmp_path / "docs"
+    for name in ("a.md", "b.md"):
+        write_file(docs, f"v1.0.x/{name}", f"# Cleaning\n\n{SHARED_TEXT}\n")
+    ingest(vector_db, docs)
+    # a.md is the first source of the shared point and no longer contains the chunk
+    write_file(docs, "v1.0.x/a.md", "# Cooking\n\nBoil the pasta in salted water for ten minutes.\n")
+    edited = [doc for doc in process_markdown_files(str(docs), workers=1) if doc["metadata"]["file_name"] == "a.md"]
+
+    upload_documents_to_qdrant(edited, vector_db)
+
+    results = vector_db.search("baking soda", limit=5, filter={"file_name": "b.md"})
+    assert len(results) == 1
+    assert "baking soda" in results[0]["text"]
+    assert results[0]["metadata"]["file_name"] == "b.md"
+    assert [source["file_name"] for source in results[0]["metadata"]["sources"]] == ["b.md"]
+    assert all("baking soda" not in result["text"]
+               for result in vector_db.search("baking soda", limit=5, filter={"file_name": "a.md"}))
@@ -0,0 +1,54 @@
+import pytest
+
+from conftest import StubEmbedder
+from embedders import OpenAIEmbedder, paced_embedder
+from ingestion_pipeline import IngestionPipeline, PipelineConfig
+from llm_gateway import LLMGateway
+from vector_backends import LocalVectorBackend
+from vectordb import VectorDB
+
+
+def test_paced_embedder_leaves_the_original_unpaced():
+    embedder = OpenAIEmbedder(gateway=LLMGateway(api_key="test"))
+
+    paced = paced_embedder(embedder, requests_per_minute=60, tokens_per_minute=1000, max_concurrency=2)
+
+    assert embedder.scheduler is None
+    assert paced is not embedder
+    assert paced.scheduler.requests_per_minute == 60
+    assert paced.scheduler.max_concurrency == 2
+    assert (paced.model_name, paced.dimensions, paced.gateway) == (embedder.model_name, embedder.dimensions,
+                                                                   embedder.gateway)
+    assert paced_embedder(paced) is paced
+
+
+def test_local_embedders_are_not_paced(embedder):
+    assert paced_embedder(embedder) is embedder
+
+
+def test_pipeline_does_not_pace_queries(tmp_path):
+    embedder = OpenAIEmbedder(dimensions=8, gateway=LLMGateway(api_key="test"))
+    vector_db = VectorDB(backend=LocalVectorBackend(path=str(tmp_path / "local")), embedder=embedder,
+                         use_embedding_cache=False, use_query_cache=False)
+
+    pipeline = IngestionPipeline(vector_db, PipelineConfig(embed_workers=3, report_interval=0), use_manifest=False)
+
+    assert vector_db.embedder is embedder and embedder.scheduler is None
+    assert pipeline.scheduler is pipeline.embedder.scheduler
+    assert pipeline.scheduler.max_concurrency == 3
+
+
+def test_collection_records_the_embedder_and_rejects_another_model(embedder, tmp_path):
+    path = str(tmp_path / "local")
+    vector_db = VectorDB(backend=LocalVectorBackend(path=path), embedder=embedder, use_embedding_cache=False,
+                         use_query_cache=False)
+    vector_db.add_documents([{"text": "Qdrant stores vectors.", "metadata": {"file_path": "/docs/a.md"}}])
+
+    assert vector_db.backend.collection_metadata() == {"embedding_model": "stub", "embedding_dimensions": 16}
+    assert embedder.embedded_texts == ["Qdrant stores vectors."]
+
+    other = StubEmbedder()
+    other.model_name = "other"
+    with pytest.raises(ValueError, match="was built with stub"):
+        VectorDB(backend=LocalVectorBackend(path=path), embedder=other, use_embedding_cache=False,
+                 use_query_cache=False)
@@ -0,0 +1,27 @@
+from embedding_cache import EmbeddingCache
+
+
+def test_instances_sharing_a_file_evict_against_the_stored_size(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    # Each vector takes 16 bytes, so the cache holds three of them
+    first = EmbeddingCache(path, max_bytes=48)
+    second = EmbeddingCache(path, max_bytes=48)
+
+    first.put_many("stub", 4, ["a", "b"], [[1.0] * 4, [2.0] * 4])
+    second.put_many("stub", 4, ["c", "d"], [[3.0] * 4, [4.0] * 4])
+    first.put_many("stub", 4, ["a"], [[5.0] * 4])
+
+    assert first.stats()["size_bytes"] == second.stats()["size_bytes"] == 48
+    assert second.stats()["entries"] == 3
+    assert second.get_many("stub", 4, ["a", "b"]) == [[5.0] * 4, None]
+
+
+def test_size_is_computed_for_a_cache_created_without_it(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path)
+    cache.put_many("stub", 4, ["a", "b"], [[1.0] * 4, [2.0] * 4])
+    cache._conn.executescript("DROP TABLE cache_size; DROP TRIGGER embeddings_size_insert; "
+                              "DROP TRIGGER embeddings_size_update; DROP TRIGGER embeddings_size_delete;")
+    cache.close()
+
+    assert EmbeddingCache(path).stats()["size_bytes"] == 32
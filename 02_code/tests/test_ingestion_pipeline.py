@@ -0,0 +1,30 @@
+import os
+
+from ingestion_pipeline import iter_markdown_files
+from test_dedup import ingest, write_file
+from test_vectordb import make_vector_db
+
+
+def test_walk_skips_hidden_files_and_directories(tmp_path):
+    for relative_path in ["b.md", "a.md", "sub/c.md", ".hidden/d.md", ".e.md", "notes.txt"]:
+        write_file(tmp_path, relative_path, "# Title\n\nSome text.")
+
+    assert list(iter_markdown_files(str(tmp_path))) == [os.path.join(str(tmp_path), path)
+                                                        for path in ["a.md", "b.md", "sub/c.md"]]
+
+
+def test_streamed_run_ingests_every_file_and_deletes_removed_ones(embedder, tmp_path):
+    vector_db = make_vector_db(embedder)
+    folder = tmp_path / "docs"
+    # More files than one parse task takes, in nested folders
+    for i in range(20):
+        write_file(folder, f"v1.0.x/part{i % 3}/file{i}.md", f"# File {i}\n\nThe text of file number {i}.")
+
+    summary = ingest(vector_db, folder)
+    assert (summary["new_files"], summary["discover"], summary["completed_files"]) == (20, 20, 20)
+    assert len(list(vector_db.iter_documents())) == 20
+
+    os.remove(folder / "v1.0.x/part0/file0.md")
+    summary = ingest(vector_db, folder)
+    assert (summary["removed_files"], summary["unchanged_files"], summary["discover"]) == (1, 19, 0)
+    assert len(list(vector_db.iter_documents())) == 19
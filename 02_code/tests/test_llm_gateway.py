@@ -0,0 +1,56 @@
+import email.utils
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from llm_gateway import LLMGateway, parse_retry_after
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({}, None),
+    ({"retry-after": ""}, None),
+    ({"retry-after": "2"}, 2.0),
+    ({"retry-after": "0.5"}, 0.5),
+    ({"retry-after-ms": "150"}, 0.15),
+    ({"retry-after-ms": "150", "retry-after": "3"}, 0.15),
+    ({"retry-after-ms": "soon", "retry-after": "3"}, 3.0),
+    ({"retry-after": "soon"}, None),
+    ({"retry-after": "Mon, 99 Foo 2025"}, None),
+    ({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0.0),
+])
+def test_parse_retry_after(headers, expected):
+    assert parse_retry_after(httpx.Headers(headers)) == expected
+
+
+def test_parse_retry_after_http_date_in_the_future():
+    retry_at = email.utils.formatdate(time.time() + 30, usegmt=True)
+
+    delay = parse_retry_after(httpx.Headers({"Retry-After": retry_at}))
+
+    assert 25 <= delay <= 31
+
+
+def test_backoff_does_not_hold_the_concurrency_slot(monkeypatch):
+    gateway = LLMGateway(api_key="test", default_concurrency=1)
+    monkeypatch.setattr(gateway, "_retry_delay", lambda error, attempt: 1.0 if attempt == 0 else None)
+    failed_once = threading.Event()
+
+    def rate_limited_request():
+        if not failed_once.is_set():
+            failed_once.set()
+            raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+        return "retried"
+
+    results = {}
+    retrying = threading.Thread(target=lambda: results.update(first=gateway._call("chat", "m", rate_limited_request)))
+    retrying.start()
+    assert failed_once.wait(5)
+
+    start = time.monotonic()
+    assert gateway._call("chat", "m", lambda: "other") == "other"
+    assert time.monotonic() - start < 0.5
+    retrying.join()
+    assert results["first"] == "retried"
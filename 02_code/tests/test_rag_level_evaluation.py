@@ -0,0 +1,20 @@
+from collection_config import CollectionConfig
+from rag_level_evaluation import compare_search_modes
+from test_vectordb import documents, make_vector_db
+
+
+def test_compare_search_modes_generates_each_query_once(embedder):
+    vector_db = make_vector_db(embedder, CollectionConfig(sparse=True))
+    vector_db.add_documents(documents(["Qdrant stores vectors.", "Payload indexes speed up filters.",
+                                       "Snapshots back up data."]))
+    generated = []
+
+    def query_generator(document, query_generator_prompt, openai_client):
+        generated.append(document)
+        return document
+
+    results = compare_search_modes(vector_db, query_generator=query_generator, top_k=1, batch_size=2)
+
+    assert sorted(generated) == sorted(document["text"] for document in vector_db.iter_documents())
+    assert set(results) == {"dense", "sparse", "hybrid"}
+    assert all(metrics["total_queries"] == 3 and metrics["recall"] == 1.0 for metrics in results.values())
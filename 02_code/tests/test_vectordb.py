@@ -0,0 +1,80 @@
+import os
+
+from qdrant_client import QdrantClient
+
+from collection_config import CollectionConfig
+from data_uploading import upload_documents_to_qdrant
+from sparse_encoder import BM25Encoder
+from vector_backends import QdrantBackend
+from vectordb import VectorDB, content_hash, point_id_for
+
+
+def documents(texts, file_path="/docs/v1.0.x/a.md"):
+    return [
+        {"text": text, "metadata": {"file_path": file_path, "file_name": "a.md", "version": "v1.0.x", "chunk_index": i}}
+        for i, text in enumerate(texts)
+    ]
+
+
+def make_vector_db(embedder, collection_config: CollectionConfig = None) -> VectorDB:
+    backend = QdrantBackend(client=QdrantClient(":memory:"), collection_config=collection_config)
+    return VectorDB(backend=backend, embedder=embedder, use_embedding_cache=False, use_query_cache=False)
+
+
+def test_point_ids_are_stable():
+    point_id = point_id_for("/docs/a.md", 3, content_hash("some text"))
+
+    assert point_id == point_id_for("/docs/a.md", 3, content_hash("some text"))
+    assert point_id != point_id_for("/docs/a.md", 4, content_hash("some text"))
+    assert point_id != point_id_for("/docs/a.md", 3, content_hash("other text"))
+    assert VectorDB.document_ids(documents(["some text"])) == VectorDB.document_ids(documents(["some text"]))
+
+
+def test_adding_documents_again_is_idempotent(embedder):
+    vector_db = make_vector_db(embedder)
+    docs = documents(["Qdrant stores vectors.", "Payload indexes speed up filters.", "Snapshots back up data."])
+
+    first = vector_db.add_documents(docs)
+    second = vector_db.add_documents(docs)
+
+    assert first == second == VectorDB.document_ids(docs)
+    stored = list(vector_db.iter_documents())
+    assert len(stored) == 3
+    assert {document["metadata"]["content_hash"] for document in stored} == {content_hash(doc["text"]) for doc in docs}
+    assert vector_db.search("Snapshots back up data.", limit=1)[0]["id"] == first[2]
+
+
+def test_incremental_upload_embeds_only_changed_chunks(embedder):
+    vector_db = make_vector_db(embedder)
+    texts = ["Qdrant stores vectors.", "Payload indexes speed up filters.", "Snapshots back up data."]
+    upload_documents_to_qdrant(documents(texts), vector_db, enable_chunking=False)
+
+    embedder.embedded_texts.clear()
+    changed = texts[:2] + ["Snapshots back up collections."]
+    uploaded = upload_documents_to_qdrant(documents(changed), vector_db, enable_chunking=False)
+
+    assert uploaded == 1
+    assert embedder.embedded_texts == ["Snapshots back up collections."]
+    assert sorted(document["text"] for document in vector_db.iter_documents()) == sorted(changed)
+
+
+def test_hybrid_search_with_sparse_vectors(embedder):
+    vector_db = make_vector_db(embedder, CollectionConfig(sparse=True))
+    docs = documents(["Qdrant stores vectors.", "Payload indexes speed up filters.", "Snapshots back up data."])
+    vector_db.add_documents(docs)
+
+    assert vector_db.search("payload filters", limit=1, mode="sparse")[0]["text"] == "Payload indexes speed up filters."
+    assert vector_db.search("payload filters", limit=1, mode="hybrid")[0]["text"] == "Payload indexes speed up filters."
+    assert os.path.exists(vector_db.sparse_encoder.path)
+
+
+def test_bm25_statistics_count_each_text_once(tmp_path):
+    encoder = BM25Encoder(str(tmp_path / "bm25.json"))
+    first = encoder.encode_documents(["Qdrant stores vectors.", "Payload indexes speed up filters."])
+    encoder.save()
+
+    reloaded = BM25Encoder(str(tmp_path / "bm25.json"))
+    second = reloaded.encode_documents(["Qdrant stores vectors.", "Payload indexes speed up filters."])
+
+    assert (reloaded.doc_count, reloaded.total_length) == (2, 8)
+    assert second == first
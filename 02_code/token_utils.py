@@ -0,0 +1,62 @@
+import re
+from typing import List
+
+# text-embedding-3-* and the gpt-3.5/4 family all use the cl100k_base encoding
+DEFAULT_ENCODING = "cl100k_base"
+
+_encodings = {}
+
+
+class ApproximateEncoding:
+    """
+    Fallback used when tiktoken or its encoding files are not available (e.g. offline machines).
+    Splits text into pieces of at most 4 word characters, which is close to the BPE token count
+    of English text.
+    """
+    _pattern = re.compile(r"\s?\w{1,4}|\s?[^\w\s]|\s+")
+
+    def encode(self, text: str, disallowed_special=()) -> List[str]:
+        return self._pattern.findall(text)
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+def get_encoding(name: str = DEFAULT_ENCODING):
+    """Return a cached tiktoken encoding, or the approximate encoding if tiktoken can't be loaded"""
+    if name not in _encodings:
+        try:
+            import tiktoken
+            _encodings[name] = tiktoken.get_encoding(name)
+        except Exception as e:
+            print(f"Could not load tiktoken encoding {name}, using approximate token counts: {e}")
+            _encodings[name] = ApproximateEncoding()
+    return _encodings[name]
+
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    """Count the tokens of a text with the given encoding"""
+    return len(get_encoding(encoding_name).encode(text, disallowed_special=()))
+
+
+def batch_by_token_budget(token_counts: List[int], max_items: int, max_tokens: int) -> List[List[int]]:
+    """
+    Group item indexes into consecutive batches so that no batch exceeds
+    max_items items or max_tokens tokens in total
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+
+    for i, n_tokens in enumerate(token_counts):
+        if current and (len(current) >= max_items or current_tokens + n_tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += n_tokens
+
+    if current:
+        batches.append(current)
+
+    return batches
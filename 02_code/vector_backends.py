@@ -0,0 +1,672 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Union
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    FieldCondition, Filter, Fusion, FusionQuery, MatchAny, MatchValue, PayloadSchemaType, PayloadSelectorExclude,
+    PointIdsList, PointStruct, Prefetch, QueryRequest, Range, Record, ScoredPoint, SearchParams, SparseVector
+)
+
+from collection_config import (
+    CollectionConfig, DEFAULT_PAYLOAD_INDEXES, MINI_VECTOR_NAME, SPARSE_VECTOR_NAME, match_collection_layout
+)
+
+# True (whole payload), False (none), a list of fields to include or {"exclude": [fields]}
+PayloadSelector = Union[bool, List[str], Dict[str, List[str]]]
+# Sparse vector as (indices, values)
+SparseVectorData = Tuple[List[int], List[float]]
+
+SEARCH_MODES = ("dense", "sparse", "hybrid")
+
+# Hybrid search fetches this many times the limit from each retriever before fusing
+HYBRID_PREFETCH_FACTOR = 4
+MIN_HYBRID_PREFETCH = 20
+
+RANGE_OPERATORS = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+FIELD_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+
+class VectorBackend:
+    """
+    Storage engine interface used by VectorDB.
+    A backend is bound to one collection and stores (id, vector, payload) points.
+    Search methods return qdrant_client ScoredPoint objects and scroll returns Record objects,
+    so VectorDB handles the results of every backend the same way.
+    """
+    # Search modes query_batch accepts
+    supported_modes = SEARCH_MODES
+
+    def ensure_collection(self, vector_size: int, metadata: Dict[str, Any] = None):
+        """
+        Create the collection if it doesn't exist.
+        metadata (e.g. the embedding model) is recorded on the collection, keys that are already
+        recorded keep their value.
+        """
+        raise NotImplementedError
+
+    def collection_metadata(self) -> Dict[str, Any]:
+        """Return the metadata recorded on the collection"""
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], vectors: List[List[float]], payloads: List[Dict[str, Any]], wait: bool = True,
+               sparse_vectors: List[SparseVectorData] = None):
+        """Insert or overwrite points, sparse_vectors are only stored by backends that support hybrid search"""
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        """Delete points by id"""
+        raise NotImplementedError
+
+    def set_payload(self, ids: List[str], payload: Dict[str, Any]):
+        """Set payload fields of existing points, other fields are kept"""
+        raise NotImplementedError
+
+    def create_payload_index(self, field_name: str, field_schema: str):
+        """Index a payload field ('keyword', 'integer', 'float', ...) so it can be filtered on efficiently"""
+        raise NotImplementedError
+
+    def query(self, vector: List[float], limit: int, search_params: SearchParams = None,
+              query_filter: Dict[str, Any] = None, sparse_vector: SparseVectorData = None,
+              mode: str = "dense", with_payload: PayloadSelector = True) -> List[ScoredPoint]:
+        """
+        Return the limit most similar points to the vector.
+        search_params tunes approximate search (HNSW ef, quantization rescoring), exact backends ignore it.
+        query_filter restricts the search to points whose payload matches, see build_qdrant_filter.
+        mode selects dense, sparse or hybrid (both fused with reciprocal rank fusion) retrieval.
+        with_payload selects the payload fields returned with each hit, False returns ids and scores only.
+        """
+        return self.query_batch([vector], limit, search_params, query_filter, [sparse_vector], mode, with_payload)[0]
+
+    def query_batch(self, vectors: List[List[float]], limit: int, search_params: SearchParams = None,
+                    query_filter: Dict[str, Any] = None, sparse_vectors: List[SparseVectorData] = None,
+                    mode: str = "dense", with_payload: PayloadSelector = True) -> List[List[ScoredPoint]]:
+        """Run several searches at once, results are in the order of the vectors"""
+        raise NotImplementedError
+
+    def scroll(self, limit: int, offset: Any = None, with_payload: PayloadSelector = True,
+               with_vectors: bool = False) -> Tuple[List[Record], Any]:
+        """Return a page of points and the offset of the next page (None on the last page)"""
+        raise NotImplementedError
+
+    def retrieve(self, ids: List[str], with_payload: PayloadSelector = True) -> List[Record]:
+        """Return the points with the given ids that exist, without vectors"""
+        raise NotImplementedError
+
+
+class QdrantBackend(VectorBackend):
+    """Backend that stores the collection on a Qdrant server"""
+    def __init__(self, collection_name: str = "documents", host: str = "localhost", port: int = 6333,
+                 client: QdrantClient = None, collection_config: CollectionConfig = None):
+        self.client = client or QdrantClient(host=host, port=port)
+        self.collection_name = collection_name
+        self.collection_config = collection_config or CollectionConfig()
+
+    def ensure_collection(self, vector_size: int, metadata: Dict[str, Any] = None):
+        collections = self.client.get_collections()
+        collection_names = [col.name for col in collections.collections]
+
+        if self.collection_name not in collection_names:
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=self.collection_config.vectors_config(vector_size),
+                sparse_vectors_config=self.collection_config.sparse_vectors_config(),
+                quantization_config=self.collection_config.quantization_config(),
+                hnsw_config=self.collection_config.hnsw_config(),
+                on_disk_payload=self.collection_config.on_disk_payload,
+                metadata=metadata or None
+            )
+
+        info = self.client.get_collection(self.collection_name)
+        self.collection_config = match_collection_layout(self.collection_config, info.config.params)
+        # Collections created before the metadata was recorded get it added
+        missing_metadata = {k: v for k, v in (metadata or {}).items() if k not in (info.config.metadata or {})}
+        if missing_metadata:
+            self.client.update_collection(collection_name=self.collection_name, metadata=missing_metadata)
+
+        # Index the configured payload fields that are not indexed yet
+        payload_schema = info.payload_schema or {}
+        for field_name, field_schema in self.collection_config.payload_indexes.items():
+            if field_name not in payload_schema:
+                self.create_payload_index(field_name, field_schema)
+
+    @property
+    def _dense_name(self) -> str:
+        return self.collection_config.dense_vector_name
+
+    @property
+    def _has_named_vectors(self) -> bool:
+        return _has_named_vectors(self.collection_config)
+
+    def collection_metadata(self) -> Dict[str, Any]:
+        return self.client.get_collection(self.collection_name).config.metadata or {}
+
+    def upsert(self, ids: List[str], vectors: List[List[float]], payloads: List[Dict[str, Any]], wait: bool = True,
+               sparse_vectors: List[SparseVectorData] = None):
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=build_points(self.collection_config, ids, vectors, payloads, sparse_vectors),
+            wait=wait
+        )
+
+    def delete(self, ids: List[str]):
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=PointIdsList(points=ids)
+        )
+
+    def set_payload(self, ids: List[str], payload: Dict[str, Any]):
+        self.client.set_payload(
+            collection_name=self.collection_name,
+            payload=payload,
+            points=ids
+        )
+
+    def create_payload_index(self, field_name: str, field_schema: str):
+        self.client.create_payload_index(
+            collection_name=self.collection_name,
+            field_name=field_name,
+            field_schema=PayloadSchemaType(field_schema)
+        )
+
+    def query_batch(self, vectors: List[List[float]], limit: int, search_params: SearchParams = None,
+                    query_filter: Dict[str, Any] = None, sparse_vectors: List[SparseVectorData] = None,
+                    mode: str = "dense", with_payload: PayloadSelector = True) -> List[List[ScoredPoint]]:
+        requests = build_query_requests(self.collection_config, vectors, limit, search_params, query_filter,
+                                        sparse_vectors, mode, with_payload)
+        responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        return [response.points for response in responses]
+
+    def scroll(self, limit: int, offset: Any = None, with_payload: PayloadSelector = True,
+               with_vectors: bool = False) -> Tuple[List[Record], Any]:
+        records, next_offset = self.client.scroll(
+            collection_name=self.collection_name,
+            limit=limit,
+            offset=offset,
+            with_payload=_qdrant_payload_selector(with_payload),
+            with_vectors=dense_vector_selector(self.collection_config, with_vectors)
+        )
+        # Collections with named vectors return a dict of vectors, only the dense one is exposed
+        for record in records:
+            if isinstance(record.vector, dict):
+                record.vector = record.vector.get(self._dense_name)
+        return records, next_offset
+
+    def retrieve(self, ids: List[str], with_payload: PayloadSelector = True) -> List[Record]:
+        return self.client.retrieve(
+            collection_name=self.collection_name,
+            ids=ids,
+            with_payload=_qdrant_payload_selector(with_payload),
+            with_vectors=False
+        )
+
+
+class LocalVectorBackend(VectorBackend):
+    """
+    In-process backend for offline evaluation and tests, no server needed.
+    Normalized float32 vectors are kept in a memory-mapped .npy matrix (one row per point) and the
+    payloads in a SQLite sidecar next to it. Search is an exact top-k cosine search done with one
+    matrix multiplication and argpartition.
+
+    Files:
+        <path>/<collection_name>/vectors.npy
+        <path>/<collection_name>/payloads.sqlite
+    """
+    supported_modes = ("dense",)
+
+    # Upper bound on the size of the (queries x points) score matrix computed at once
+    MAX_SCORE_MATRIX_SIZE = 32 * 1024 * 1024
+    # A filter matching less than this share of the rows has its rows gathered and scored,
+    # otherwise every row is scored in place and the others are masked
+    GATHER_RATIO = 0.25
+
+    def __init__(self, path: str = "local_vectordb", collection_name: str = "documents",
+                 payload_indexes: Dict[str, str] = None):
+        self.collection_name = collection_name
+        self.payload_indexes = DEFAULT_PAYLOAD_INDEXES if payload_indexes is None else payload_indexes
+        self.directory = os.path.join(path, collection_name)
+        self.vectors_path = os.path.join(self.directory, "vectors.npy")
+        self._lock = threading.RLock()
+        self._vectors = None
+        self._live = np.zeros(0, dtype=bool)
+        self._row_count = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.directory, "payloads.sqlite"), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS points (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS collection_metadata (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+        if os.path.exists(self.vectors_path):
+            self._vectors = np.load(self.vectors_path, mmap_mode="r+")
+            rows = [row for (row,) in self._conn.execute("SELECT row FROM points")]
+            self._row_count = max(rows) + 1 if rows else 0
+            self._live = np.zeros(len(self._vectors), dtype=bool)
+            self._live[rows] = True
+
+    def ensure_collection(self, vector_size: int, metadata: Dict[str, Any] = None):
+        with self._lock:
+            if self._vectors is None:
+                self._allocate(vector_size, capacity=1024)
+            elif self._vectors.shape[1] != vector_size:
+                raise ValueError(f"Collection {self.collection_name} stores {self._vectors.shape[1]}-dim vectors, "
+                                 f"not {vector_size}-dim")
+            if metadata:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO collection_metadata (key, value) VALUES (?, ?)",
+                    [(key, json.dumps(value)) for key, value in metadata.items()]
+                )
+                self._conn.commit()
+
+        for field_name, field_schema in self.payload_indexes.items():
+            self.create_payload_index(field_name, field_schema)
+
+    def collection_metadata(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM collection_metadata").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def _allocate(self, vector_size: int, capacity: int):
+        """Create (or grow) the memory-mapped vector matrix, keeping the existing rows"""
+        tmp_path = self.vectors_path + ".tmp.npy"
+        vectors = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, vector_size))
+        live = np.zeros(capacity, dtype=bool)
+        if self._vectors is not None:
+            n = min(self._row_count, len(self._vectors))
+            vectors[:n] = self._vectors[:n]
+            live[:n] = self._live[:n]
+        vectors.flush()
+        del vectors
+        self._vectors = None
+        os.replace(tmp_path, self.vectors_path)
+        self._vectors = np.load(self.vectors_path, mmap_mode="r+")
+        self._live = live
+
+    def upsert(self, ids: List[str], vectors: List[List[float]], payloads: List[Dict[str, Any]], wait: bool = True,
+               sparse_vectors: List[SparseVectorData] = None):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            if self._vectors is None:
+                self._allocate(matrix.shape[1], capacity=max(1024, len(ids)))
+
+            ids = [str(point_id) for point_id in ids]
+            existing = self._rows_of_ids(ids)
+
+            rows = []
+            for point_id in ids:
+                if point_id not in existing:
+                    existing[point_id] = self._row_count
+                    self._row_count += 1
+                rows.append(existing[point_id])
+
+            if self._row_count > len(self._vectors):
+                self._allocate(self._vectors.shape[1], capacity=max(2 * len(self._vectors), self._row_count))
+
+            self._vectors[rows] = matrix
+            self._live[rows] = True
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO points (row, id, payload) VALUES (?, ?, ?)",
+                [(row, point_id, json.dumps(payload)) for row, point_id, payload in zip(rows, ids, payloads)]
+            )
+            self._conn.commit()
+            if wait:
+                self._vectors.flush()
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            rows = list(self._rows_of_ids([str(point_id) for point_id in ids]).values())
+            self._live[rows] = False
+            self._conn.executemany("DELETE FROM points WHERE row = ?", [(row,) for row in rows])
+            self._conn.commit()
+
+    def set_payload(self, ids: List[str], payload: Dict[str, Any]):
+        with self._lock:
+            rows = list(self._rows_of_ids([str(point_id) for point_id in ids]).values())
+            updated = []
+            for row, (_, current) in self._load_points(rows).items():
+                updated.append((json.dumps({**current, **payload}), row))
+            self._conn.executemany("UPDATE points SET payload = ? WHERE row = ?", updated)
+            self._conn.commit()
+
+    def _rows_of_ids(self, ids: List[str]) -> Dict[str, int]:
+        rows = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            query = f"SELECT id, row FROM points WHERE id IN ({','.join('?' * len(chunk))})"
+            rows.update(self._conn.execute(query, chunk).fetchall())
+        return rows
+
+    def _load_points(self, rows: List[int], with_payload: PayloadSelector = True) -> Dict[int, Tuple[str, Dict[str, Any]]]:
+        """Load the ids and (selected) payloads of the given rows"""
+        points = {}
+        # Without payload the JSON column is neither read nor decoded
+        columns = "row, id, payload" if with_payload else "row, id, NULL"
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            query = f"SELECT {columns} FROM points WHERE row IN ({','.join('?' * len(chunk))})"
+            for row, point_id, payload in self._conn.execute(query, chunk):
+                points[row] = (point_id, _select_payload(json.loads(payload), with_payload) if with_payload else None)
+        return points
+
+    def create_payload_index(self, field_name: str, field_schema: str):
+        """Index the payload field with a SQLite expression index, so filters don't scan every payload"""
+        column = _json_path(field_name)
+        with self._lock:
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_payload_{field_name.replace('.', '_')} "
+                f"ON points(json_extract(payload, '{column}'))"
+            )
+            self._conn.commit()
+
+    def _filter_rows(self, query_filter: Dict[str, Any]) -> np.ndarray:
+        """
+        Return the rows of the points whose payload matches the filter.
+        Like in Qdrant, a condition on an array field holds if it holds for any element.
+        """
+        clauses = []
+        params = []
+        for field_name, condition in query_filter.items():
+            # json_each yields the elements of an array, or the value itself if it is not one
+            values = f"SELECT value FROM json_each(points.payload, '{_json_path(field_name)}')"
+            if isinstance(condition, dict):
+                for operator in condition:
+                    if operator not in RANGE_OPERATORS:
+                        raise ValueError(f"Unknown range operator {operator!r} for field {field_name}")
+                bounds = " AND ".join(f"value {RANGE_OPERATORS[operator]} ?" for operator in condition)
+                clauses.append(f"EXISTS ({values} WHERE {bounds})")
+                params.extend(condition.values())
+            elif isinstance(condition, (list, tuple, set)):
+                condition = list(condition)
+                clauses.append(f"EXISTS ({values} WHERE value IN ({','.join('?' * len(condition))}))")
+                params.extend(condition)
+            else:
+                clauses.append(f"EXISTS ({values} WHERE value = ?)")
+                params.append(condition)
+
+        where = " AND ".join(clauses) or "1"
+        rows = [row for (row,) in self._conn.execute(f"SELECT row FROM points WHERE {where} ORDER BY row", params)]
+        return np.asarray(rows, dtype=np.int64)
+
+    def query_batch(self, vectors: List[List[float]], limit: int, search_params: SearchParams = None,
+                    query_filter: Dict[str, Any] = None, sparse_vectors: List[SparseVectorData] = None,
+                    mode: str = "dense", with_payload: PayloadSelector = True) -> List[List[ScoredPoint]]:
+        if mode not in self.supported_modes:
+            raise ValueError(f"LocalVectorBackend only supports dense search, not {mode!r}")
+
+        queries = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries /= np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            if self._row_count == 0 or limit <= 0:
+                return [[] for _ in vectors]
+
+            # Deleted rows (and rows not matching the filter) stay in the matrix and get a -inf score,
+            # so the memory-mapped matrix is read in place instead of being copied into memory.
+            # Only the rows of selective filters are gathered
+            if query_filter:
+                matching_rows = self._filter_rows(query_filter)
+                match_count = len(matching_rows)
+            else:
+                match_count = int(np.count_nonzero(self._live[:self._row_count]))
+            k = min(limit, match_count)
+            if k == 0:
+                return [[] for _ in vectors]
+
+            if query_filter and match_count < self.GATHER_RATIO * self._row_count:
+                candidate_rows = matching_rows
+                matrix = self._vectors[candidate_rows]
+                excluded = None
+            else:
+                candidate_rows = np.arange(self._row_count)
+                matrix = self._vectors[:self._row_count]
+                if query_filter:
+                    excluded = np.ones(self._row_count, dtype=bool)
+                    excluded[matching_rows] = False
+                else:
+                    excluded = ~self._live[:self._row_count]
+                if not excluded.any():
+                    excluded = None
+
+            block_size = max(1, self.MAX_SCORE_MATRIX_SIZE // len(candidate_rows))
+            top_rows = []
+            top_scores = []
+            for start in range(0, len(queries), block_size):
+                scores = queries[start:start + block_size] @ matrix.T
+                if excluded is not None:
+                    scores[:, excluded] = -np.inf
+                candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+                order = np.argsort(-candidate_scores, axis=1)
+                top_rows.extend(candidate_rows[np.take_along_axis(candidates, order, axis=1)].tolist())
+                top_scores.extend(np.take_along_axis(candidate_scores, order, axis=1).tolist())
+
+            points = self._load_points(sorted({row for rows in top_rows for row in rows}), with_payload)
+
+        return [
+            [
+                ScoredPoint(id=points[row][0], version=0, score=score, payload=points[row][1])
+                for row, score in zip(rows, scores)
+            ]
+            for rows, scores in zip(top_rows, top_scores)
+        ]
+
+    def scroll(self, limit: int, offset: Any = None, with_payload: PayloadSelector = True,
+               with_vectors: bool = False) -> Tuple[List[Record], Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT row, id, payload FROM points WHERE row >= ? ORDER BY row LIMIT ?",
+                (offset or 0, limit + 1)
+            ).fetchall()
+
+            records = []
+            for row, point_id, payload in rows[:limit]:
+                records.append(Record(
+                    id=point_id,
+                    payload=_select_payload(json.loads(payload), with_payload),
+                    vector=self._vectors[row].tolist() if with_vectors else None
+                ))
+
+        next_offset = rows[limit][0] if len(rows) > limit else None
+        return records, next_offset
+
+    def retrieve(self, ids: List[str], with_payload: PayloadSelector = True) -> List[Record]:
+        with self._lock:
+            rows = list(self._rows_of_ids([str(point_id) for point_id in ids]).values())
+            points = self._load_points(rows, with_payload)
+        return [Record(id=point_id, payload=payload) for point_id, payload in points.values()]
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._conn.close()
+
+
+def truncate_vectors(vectors: List[List[float]], dimensions: int) -> np.ndarray:
+    """
+    Keep the first dimensions of each (Matryoshka) embedding and renormalize to unit length,
+    which is what the embeddings API returns when asked for fewer dimensions.
+    """
+    truncated = np.asarray(vectors, dtype=np.float32)[:, :dimensions].copy()
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    truncated /= np.where(norms == 0, 1, norms)
+    return truncated
+
+
+def _has_named_vectors(collection_config: CollectionConfig) -> bool:
+    return collection_config.sparse or bool(collection_config.mini_dimensions)
+
+
+def dense_vector_selector(collection_config: CollectionConfig, with_vectors: bool):
+    """Return the with_vectors selector that fetches only the dense vector of a collection"""
+    return [collection_config.dense_vector_name] if with_vectors and _has_named_vectors(collection_config) else with_vectors
+
+
+def build_points(collection_config: CollectionConfig, ids: List[str], vectors: List[List[float]],
+                 payloads: List[Dict[str, Any]], sparse_vectors: List[SparseVectorData] = None) -> List[PointStruct]:
+    """Build the Qdrant points of a collection, with the named vectors its configuration defines"""
+    mini_dimensions = collection_config.mini_dimensions
+    if _has_named_vectors(collection_config):
+        named_vectors = [{collection_config.dense_vector_name: vector} for vector in vectors]
+        if mini_dimensions:
+            for named, mini_vector in zip(named_vectors, truncate_vectors(vectors, mini_dimensions).tolist()):
+                named[MINI_VECTOR_NAME] = mini_vector
+        if collection_config.sparse and sparse_vectors is not None:
+            for named, (indices, values) in zip(named_vectors, sparse_vectors):
+                named[SPARSE_VECTOR_NAME] = SparseVector(indices=indices, values=values)
+        vectors = named_vectors
+
+    return [
+        PointStruct(id=point_id, vector=vector, payload=payload)
+        for point_id, vector, payload in zip(ids, vectors, payloads)
+    ]
+
+
+def build_query_requests(collection_config: CollectionConfig, vectors: List[List[float]], limit: int,
+                         search_params: SearchParams = None, query_filter: Dict[str, Any] = None,
+                         sparse_vectors: List[SparseVectorData] = None, mode: str = "dense",
+                         with_payload: PayloadSelector = True) -> List[QueryRequest]:
+    """Build the Qdrant query requests of a batch of searches, see VectorBackend.query"""
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}")
+    if mode != "dense" and not collection_config.sparse:
+        raise ValueError(f"Search mode {mode!r} needs a collection created with CollectionConfig(sparse=True)")
+
+    qdrant_filter = build_qdrant_filter(query_filter)
+    payload_selector = _qdrant_payload_selector(with_payload)
+    dense_name = collection_config.dense_vector_name or None
+    if sparse_vectors is None:
+        sparse_vectors = [None] * len(vectors)
+
+    mini_vectors = [None] * len(vectors)
+    if collection_config.mini_dimensions and mode != "sparse":
+        mini_vectors = truncate_vectors(vectors, collection_config.mini_dimensions).tolist()
+
+    def mini_prefetch(mini_vector: Optional[List[float]], prefetch_limit: int) -> Optional[Prefetch]:
+        # First stage of two-stage search: oversampled candidates from the small vector, rescored by the caller
+        if mini_vector is None:
+            return None
+        return Prefetch(query=mini_vector, using=MINI_VECTOR_NAME,
+                        limit=max(prefetch_limit, int(prefetch_limit * collection_config.mini_oversampling)),
+                        params=search_params, filter=qdrant_filter)
+
+    requests = []
+    for vector, mini_vector, sparse_vector in zip(vectors, mini_vectors, sparse_vectors):
+        if mode == "dense":
+            requests.append(QueryRequest(prefetch=mini_prefetch(mini_vector, limit),
+                                         query=vector, using=dense_name, limit=limit,
+                                         params=search_params, filter=qdrant_filter, with_payload=payload_selector))
+            continue
+
+        sparse_query = SparseVector(indices=sparse_vector[0], values=sparse_vector[1])
+        if mode == "sparse":
+            requests.append(QueryRequest(query=sparse_query, using=SPARSE_VECTOR_NAME, limit=limit,
+                                         filter=qdrant_filter, with_payload=payload_selector))
+        else:
+            # Both retrievers run server side and their rankings are fused with reciprocal rank fusion
+            prefetch_limit = max(limit * HYBRID_PREFETCH_FACTOR, MIN_HYBRID_PREFETCH)
+            requests.append(QueryRequest(
+                prefetch=[
+                    Prefetch(prefetch=mini_prefetch(mini_vector, prefetch_limit),
+                             query=vector, using=dense_name, limit=prefetch_limit,
+                             params=search_params, filter=qdrant_filter),
+                    Prefetch(query=sparse_query, using=SPARSE_VECTOR_NAME, limit=prefetch_limit,
+                             filter=qdrant_filter)
+                ],
+                query=FusionQuery(fusion=Fusion.RRF),
+                limit=limit,
+                with_payload=payload_selector
+            ))
+    return requests
+
+
+def build_qdrant_filter(conditions: Optional[Dict[str, Any]]) -> Optional[Filter]:
+    """
+    Compile a simple filter dictionary into a Qdrant filter, all conditions must hold:
+        {"version": "v1.2.x"}                  -> field equals the value
+        {"file_name": ["a.md", "b.md"]}        -> field equals any of the values
+        {"chunk_index": {"gte": 2, "lt": 10}}  -> field is in the range (gt, gte, lt, lte)
+    """
+    if not conditions:
+        return None
+
+    must = []
+    for field_name, condition in conditions.items():
+        if isinstance(condition, dict):
+            unknown = set(condition) - set(RANGE_OPERATORS)
+            if unknown:
+                raise ValueError(f"Unknown range operators {sorted(unknown)} for field {field_name}")
+            must.append(FieldCondition(key=field_name, range=Range(**condition)))
+        elif isinstance(condition, (list, tuple, set)):
+            must.append(FieldCondition(key=field_name, match=MatchAny(any=list(condition))))
+        else:
+            must.append(FieldCondition(key=field_name, match=MatchValue(value=condition)))
+
+    return Filter(must=must)
+
+
+def _json_path(field_name: str) -> str:
+    if not FIELD_NAME_PATTERN.match(field_name):
+        raise ValueError(f"Invalid payload field name {field_name!r}")
+    return f"$.{field_name}"
+
+
+def _select_payload(payload: Dict[str, Any], with_payload: PayloadSelector) -> Optional[Dict[str, Any]]:
+    if with_payload is True:
+        return payload
+    if not with_payload:
+        return None
+    if isinstance(with_payload, dict):
+        return {k: v for k, v in payload.items() if k not in with_payload["exclude"]}
+    return {k: v for k, v in payload.items() if k in with_payload}
+
+
+def _qdrant_payload_selector(with_payload: PayloadSelector):
+    if isinstance(with_payload, dict):
+        return PayloadSelectorExclude(exclude=list(with_payload["exclude"]))
+    return with_payload
+
+
+def snapshot_collection(source: VectorBackend, target: VectorBackend, batch_size: int = 1024) -> int:
+    """
+    Copy every point of the source backend into the target backend, e.g. a Qdrant collection
+    into a LocalVectorBackend for offline evaluation.
+
+    Returns:
+        Number of copied points
+    """
+    copied = 0
+    offset = None
+    metadata = source.collection_metadata()
+    while True:
+        records, offset = source.scroll(limit=batch_size, offset=offset, with_payload=True, with_vectors=True)
+        if records:
+            target.ensure_collection(len(records[0].vector), metadata)
+            target.upsert(
+                [record.id for record in records],
+                [record.vector for record in records],
+                [record.payload for record in records]
+            )
+            copied += len(records)
+        if offset is None:
+            break
+    return copied
@@ -1,134 +1,439 @@
 
 
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from openai import OpenAI
+import hashlib
 import uuid
-import os
+from itertools import islice
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+from embedders import Embedder, OpenAIEmbedder
+from embedding_cache import EmbeddingCache
+from query_cache import QueryEmbeddingCache
+from llm_gateway import LLMGateway, get_gateway
+from vector_backends import VectorBackend, QdrantBackend, PayloadSelector
+from collection_config import CollectionConfig, build_search_params
+from dedup import sources_payload
+from sparse_encoder import BM25Encoder
+from metrics import get_metrics
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Namespace of the uuid5 point ids derived from (file_path, chunk_index, content hash)
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a8e-3d5b-4f7a-9c0e-2b8d4e6f1a3c")
+
+# Number of points sent to Qdrant in one upsert request
+UPSERT_BATCH_SIZE = 256
+
+# Number of queries sent to Qdrant in one batch search request
+SEARCH_BATCH_SIZE = 100
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def point_id_for(file_path: str, chunk_index: int, text_hash: str) -> str:
+    """
+    Derive a stable point id from the chunk's source file, position and content.
+    Re-ingesting an unchanged chunk therefore overwrites the same point instead of adding a duplicate.
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{file_path}:{chunk_index}:{text_hash}"))
+
+
+def check_embedding_model(collection_name: str, metadata: Dict[str, Any], embedding_model: str):
+    """Raise a ValueError if the collection metadata records another embedding model"""
+    recorded_model = metadata.get("embedding_model")
+    if recorded_model is not None and recorded_model != embedding_model:
+        raise ValueError(f"Collection {collection_name} was built with {recorded_model}, not {embedding_model}")
+
 
 class VectorDB:
     """
-    Vector DB class, that implements the vector db interface by connecting to a qdrant server
+    Vector DB class, that implements the vector db interface on top of a storage backend.
+    By default it connects to a qdrant server, pass e.g. a LocalVectorBackend to run in-process.
     """
     def __init__(self, host: str = "localhost", port: int = 6333, collection_name: str = "documents",
-                 openai_api_key: str = None):
-        self.client = QdrantClient(host=host, port=port)
-        self.collection_name = collection_name
+                 openai_api_key: str = None, embedding_cache: EmbeddingCache = None,
+                 use_embedding_cache: bool = True, backend: VectorBackend = None,
+                 collection_config: CollectionConfig = None, sparse_encoder: BM25Encoder = None,
+                 gateway: LLMGateway = None, query_cache: QueryEmbeddingCache = None,
+                 use_query_cache: bool = True, embedder: Embedder = None):
+        self.backend = backend or QdrantBackend(collection_name=collection_name, host=host, port=port,
+                                                collection_config=collection_config)
+        self.collection_name = self.backend.collection_name
 
-        # Initialize OpenAI client
-        api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OpenAI API key must be provided either as parameter or OPENAI_API_KEY environment variable")
+        # Texts are embedded with text-embedding-3-small through the shared OpenAI gateway, unless
+        # another embedder (e.g. a local CPU model) is given, which then needs no API key
+        if embedder is None:
+            gateway = gateway or get_gateway(openai_api_key)
+            embedder = OpenAIEmbedder(gateway=gateway)
+        self.embedder = embedder
+        self.gateway = gateway
+        self.openai_client = gateway.client if gateway is not None else None
+        self.embedding_model = embedder.model_name
+        self.vector_size = embedder.dimensions
 
-        self.openai_client = OpenAI(api_key=api_key)
-        self.embedding_model = "text-embedding-3-small"
-        self.vector_size = 1536  # Default dimension for text-embedding-3-small
+        # Embeddings are cached on disk, so re-ingesting or re-evaluating unchanged texts is free
+        if embedding_cache is None and use_embedding_cache:
+            embedding_cache = EmbeddingCache()
+        self.embedding_cache = embedding_cache
+
+        # Repeated queries are served from memory, in front of the persistent cache
+        if query_cache is None and use_query_cache:
+            query_cache = QueryEmbeddingCache()
+        self.query_cache = query_cache
+
+        # Collections with a sparse vector get BM25 vectors computed locally at ingest time
+        collection_config = collection_config or getattr(self.backend, "collection_config", None)
+        wants_sparse = sparse_encoder is not None or (collection_config is not None and collection_config.sparse)
+        if wants_sparse and "sparse" not in self.backend.supported_modes:
+            raise ValueError(f"{type(self.backend).__name__} only supports {', '.join(self.backend.supported_modes)} "
+                             f"search, it can't store sparse vectors (CollectionConfig(sparse=True) or a sparse_encoder)")
+        if sparse_encoder is None and collection_config is not None and collection_config.sparse:
+            sparse_encoder = BM25Encoder.for_collection(self.collection_name)
+        self.sparse_encoder = sparse_encoder
 
         self._create_collection_if_not_exists()
 
     def _create_collection_if_not_exists(self):
-        """Create collection if it doesn't exist"""
+        """Create collection if it doesn't exist, and check that it was built with the same embedding model"""
         try:
-            collections = self.client.get_collections()
-            collection_names = [col.name for col in collections.collections]
-
-            if self.collection_name not in collection_names:
-                self.client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE)
-                )
+            self.backend.ensure_collection(self.vector_size, {"embedding_model": self.embedding_model,
+                                                              "embedding_dimensions": self.vector_size})
+            metadata = self.backend.collection_metadata()
         except Exception as e:
             print(f"Error creating collection: {e}")
+            return
+
+        check_embedding_model(self.collection_name, metadata, self.embedding_model)
 
     def add_document(self, document: str, metadata: Dict[str, Any] = None):
         """Add a document to the vector database"""
-        if metadata is None:
-            metadata = {}
-
-        # Get embedding from OpenAI
-        response = self.openai_client.embeddings.create(
-            model=self.embedding_model,
-            input=document
-        )
-        vector = response.data[0].embedding
-
-        point_id = str(uuid.uuid4())
-
-        point = PointStruct(
-            id=point_id,
-            vector=vector,
-            payload={
-                "text": document,
-                **metadata
-            }
-        )
-
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=[point]
-        )
-
-        return point_id
-
-    def search(self, query: str, limit: int = 5):
-        """Search for similar documents"""
-        # Get embedding from OpenAI
-        response = self.openai_client.embeddings.create(
-            model=self.embedding_model,
-            input=query
-        )
-        query_vector = response.data[0].embedding
-
-        search_result = self.client.search(
-            collection_name=self.collection_name,
-            query_vector=query_vector,
-            limit=limit
-        )
+        return self.add_documents([{"text": document, "metadata": metadata}])[0]
+
+    def embed_texts(self, texts: List[str], embedder: Embedder = None) -> List[List[float]]:
+        """
+        Embed many texts with the embedder, which batches them as its model or API allows.
+        Texts found in the embedding cache are not embedded again.
+
+        Args:
+            embedder: Embedder of the same model to use instead of self.embedder, e.g. a paced one
+                for bulk loads (see embedders.paced_embedder)
+        """
+        vectors = [None] * len(texts)
+        if self.embedding_cache is not None:
+            vectors = self.embedding_cache.get_many(self.embedding_model, self.vector_size, texts)
+
+        # Embed each missing text only once, even if it occurs multiple times in the input
+        missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing_texts:
+            embedded = dict(zip(missing_texts, (embedder or self.embedder).embed(missing_texts)))
+            if self.embedding_cache is not None:
+                self.embedding_cache.put_many(self.embedding_model, self.vector_size,
+                                              missing_texts, [embedded[text] for text in missing_texts])
+            vectors = [vector if vector is not None else embedded[text] for text, vector in zip(texts, vectors)]
+
+        return vectors
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed search queries, looking them up in the in-memory query cache first.
+        Misses fall through to embed_texts (persistent cache, then the API).
+        """
+        if self.query_cache is None:
+            return self.embed_texts(queries)
+
+        vectors = self.query_cache.get_many(self.embedding_model, self.vector_size, queries)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Queries that normalize to the same key are embedded once
+            originals = {}
+            for i in missing:
+                originals.setdefault(self.query_cache.normalize(queries[i]), queries[i])
+            embedded = self.embed_texts(list(originals.values()))
+            self.query_cache.put_many(self.embedding_model, self.vector_size, list(originals.values()), embedded)
+            embedded_by_key = dict(zip(originals, embedded))
+            for i in missing:
+                vectors[i] = embedded_by_key[self.query_cache.normalize(queries[i])]
+
+        return vectors
+
+    def add_documents(self, documents: List[Dict[str, Any]], upsert_batch_size: int = UPSERT_BATCH_SIZE,
+                      save_sparse: bool = True, embedder: Embedder = None) -> List[str]:
+        """
+        Add many documents to the vector database with batched embedding and upsert calls.
+
+        Args:
+            documents: List of dictionaries with 'text' and optional 'metadata'
+            upsert_batch_size: Number of points sent to Qdrant per upsert request
+            save_sparse: Save the sparse vocabulary afterwards. Bulk uploads pass False and call
+                save_sparse_encoder() once at the end
+            embedder: Embedder of the same model to use instead of self.embedder, see embed_texts
+
+        Returns:
+            List of point ids in the order of the input documents
+        """
+        if not documents:
+            return []
+
+        with get_metrics().stage("document_embedding", items=len(documents)):
+            vectors = self.embed_texts([doc["text"] for doc in documents], embedder=embedder)
+
+        return self.upsert_embedded(documents, vectors, upsert_batch_size, save_sparse=save_sparse)
+
+    def upsert_embedded(self, documents: List[Dict[str, Any]], vectors: List[List[float]],
+                        upsert_batch_size: int = UPSERT_BATCH_SIZE, wait: bool = True,
+                        save_sparse: bool = True) -> List[str]:
+        """
+        Store documents whose dense vectors were already computed (e.g. by a separate pipeline stage).
+        Sparse vectors, payloads and point ids are derived here, like in add_documents.
+        Concurrent callers should pass save_sparse=False and call save_sparse_encoder() once they are done.
+
+        Returns:
+            List of point ids in the order of the input documents
+        """
+        if not documents:
+            return []
+
+        metrics = get_metrics()
+        sparse_vectors = None
+        if self.sparse_encoder is not None:
+            with metrics.stage("sparse_encoding", items=len(documents)):
+                sparse_vectors = self.sparse_encoder.encode_documents([doc["text"] for doc in documents])
+
+        point_ids = self.document_ids(documents)
+        payloads = self.document_payloads(documents)
+
+        # Qdrant applies updates of a collection in order, so only the last batch has to be
+        # waited for: once it is acknowledged every earlier batch has been applied as well
+        for start in range(0, len(point_ids), upsert_batch_size):
+            end = start + upsert_batch_size
+            with metrics.stage("upsert", items=len(point_ids[start:end])):
+                self.backend.upsert(
+                    point_ids[start:end],
+                    vectors[start:end],
+                    payloads[start:end],
+                    wait=wait and end >= len(point_ids),
+                    sparse_vectors=sparse_vectors[start:end] if sparse_vectors is not None else None
+                )
+
+        if save_sparse:
+            self.save_sparse_encoder()
+
+        return point_ids
+
+    def save_sparse_encoder(self):
+        """Persist the vocabulary of the sparse encoder, if the collection has one"""
+        if self.sparse_encoder is not None:
+            self.sparse_encoder.save()
+
+    @staticmethod
+    def document_ids(documents: List[Dict[str, Any]]) -> List[str]:
+        """Return the deterministic point ids the documents are stored under"""
+        ids = []
+        for doc in documents:
+            metadata = doc.get("metadata") or {}
+            ids.append(point_id_for(metadata.get("file_path", ""), metadata.get("chunk_index", 0),
+                                    content_hash(doc["text"])))
+        return ids
+
+    @staticmethod
+    def document_payloads(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return the payloads the documents are stored with: text, metadata and content hash"""
+        return [
+            {"text": doc["text"], **(doc.get("metadata") or {}), "content_hash": content_hash(doc["text"])}
+            for doc in documents
+        ]
+
+    def existing_point_files(self) -> Dict[str, List[str]]:
+        """
+        Return the id of every point in the collection with the files it comes from, without fetching
+        texts or vectors. Points shared by several files (see dedup.py) list all of them.
+        """
+        point_files = {}
+        for document in self.iter_documents(batch_size=1024, with_payload=["file_path"]):
+            file_path = document["metadata"].get("file_path", "")
+            point_files[str(document["id"])] = file_path if isinstance(file_path, list) else [file_path]
+        return point_files
+
+    def release_files(self, point_ids: List[str], file_paths: Iterable[str]) -> List[str]:
+        """
+        Drop the references of the files to the points, e.g. because their chunks are no longer in them.
+        Points still referenced by another file (see dedup.py) only lose these sources, the ids of the
+        others are returned for the caller to delete.
+        """
+        file_paths = set(file_paths)
+        unreferenced = set(str(point_id) for point_id in point_ids)
+        for point in self.backend.retrieve(list(point_ids), with_payload=["file_path", "sources"]):
+            payload = point.payload or {}
+            sources = payload.get("sources") or [{"file_path": payload.get("file_path", "")}]
+            remaining = [source for source in sources if source.get("file_path") not in file_paths]
+            if remaining:
+                unreferenced.discard(str(point.id))
+                if len(remaining) < len(sources):
+                    self.backend.set_payload([point.id], sources_payload(remaining))
+        return sorted(unreferenced)
+
+    def delete_documents(self, point_ids: List[str]):
+        """Delete points by id"""
+        if point_ids:
+            self.backend.delete(point_ids)
+
+    def set_payload(self, point_ids: List[str], payload: Dict[str, Any]):
+        """Set payload fields of existing points, other fields are kept"""
+        if point_ids:
+            self.backend.set_payload(point_ids, payload)
+
+    def create_payload_index(self, field_name: str, field_schema: str = "keyword"):
+        """Index a payload field so that filtered searches on it don't have to scan the collection"""
+        self.backend.create_payload_index(field_name, field_schema)
+
+    def search(self, query: str, limit: int = 5, filter: Optional[Dict[str, Any]] = None, mode: str = "dense",
+               rescore: Optional[bool] = None, oversampling: Optional[float] = None, hnsw_ef: Optional[int] = None,
+               fields: Optional[List[str]] = None, exclude_fields: Optional[List[str]] = None, ids_only: bool = False):
+        """
+        Search for similar documents.
+        filter restricts the search to documents whose metadata matches, e.g.
+        {"version": "v1.2.x", "chunk_index": {"lt": 3}}, and is evaluated by the vector db during the search.
+        mode is "dense" (embeddings), "sparse" (BM25) or "hybrid" (both, fused with reciprocal rank fusion),
+        sparse and hybrid need a collection created with CollectionConfig(sparse=True).
+        On quantized collections, rescore and oversampling control how the candidates found with the
+        quantized vectors are re-ranked with the original ones, hnsw_ef trades speed for recall.
+        fields (or exclude_fields) restrict the payload returned with each hit, e.g. fields=["chunk_index"]
+        skips the chunk text, and ids_only=True returns only {"id", "score"} per hit.
+        """
+        return self.search_many([query], limit, filter=filter, mode=mode, rescore=rescore,
+                                oversampling=oversampling, hnsw_ef=hnsw_ef, fields=fields,
+                                exclude_fields=exclude_fields, ids_only=ids_only)[0]
+
+    def search_many(self, queries: List[str], limit: int = 5, batch_size: int = SEARCH_BATCH_SIZE,
+                    filter: Optional[Dict[str, Any]] = None, mode: str = "dense", rescore: Optional[bool] = None,
+                    oversampling: Optional[float] = None, hnsw_ef: Optional[int] = None,
+                    fields: Optional[List[str]] = None, exclude_fields: Optional[List[str]] = None,
+                    ids_only: bool = False) -> List[List[Dict[str, Any]]]:
+        """
+        Search for many queries at once.
+        All queries are embedded with batched embeddings requests, and each batch of batch_size
+        queries is sent to the backend in a single batch search request.
+
+        Returns:
+            List of search results, in the order of the input queries
+        """
+        if not queries:
+            return []
+
+        if mode not in self.backend.supported_modes:
+            raise ValueError(f"Search mode {mode!r} is not supported by {type(self.backend).__name__}, "
+                             f"expected one of {self.backend.supported_modes}")
+
+        metrics = get_metrics()
+        metrics.inc("search_queries_total", len(queries), mode=mode)
+
+        # Sparse-only search doesn't need the query embeddings
+        if mode == "sparse":
+            query_vectors = [None] * len(queries)
+        else:
+            with metrics.stage("query_embedding", items=len(queries)):
+                query_vectors = self.embed_queries(queries)
+
+        sparse_vectors = None
+        if mode != "dense":
+            if self.sparse_encoder is None:
+                raise ValueError(f"Search mode {mode!r} needs a collection created with CollectionConfig(sparse=True)")
+            with metrics.stage("sparse_encoding", items=len(queries)):
+                sparse_vectors = [self.sparse_encoder.encode_query(query) for query in queries]
+
+        search_params = build_search_params(hnsw_ef, rescore, oversampling)
+        with_payload = self._payload_selector(fields, exclude_fields, ids_only)
 
         results = []
-        for hit in search_result:
-            results.append({
-                "id": hit.id,
-                "score": hit.score,
-                "text": hit.payload.get("text", ""),
-                "metadata": {k: v for k, v in hit.payload.items() if k != "text"}
-            })
+        for start in range(0, len(query_vectors), batch_size):
+            end = start + batch_size
+            with metrics.stage("vector_search", items=len(query_vectors[start:end])):
+                batch_hits = self.backend.query_batch(
+                    query_vectors[start:end], limit, search_params, filter,
+                    sparse_vectors[start:end] if sparse_vectors is not None else None, mode, with_payload
+                )
+            for hits in batch_hits:
+                results.append([self._hit_to_result(hit) for hit in hits])
 
         return results
 
-    def get_all_documents(self):
+    @staticmethod
+    def _payload_selector(fields: Optional[List[str]], exclude_fields: Optional[List[str]],
+                          ids_only: bool) -> PayloadSelector:
+        if ids_only:
+            return False
+        if fields is not None:
+            return list(fields)
+        if exclude_fields:
+            return {"exclude": list(exclude_fields)}
+        return True
+
+    @staticmethod
+    def _hit_to_result(hit) -> Dict[str, Any]:
+        if hit.payload is None:
+            return {"id": hit.id, "score": hit.score}
+        return {
+            "id": hit.id,
+            "score": hit.score,
+            "text": hit.payload.get("text", ""),
+            "metadata": {k: v for k, v in hit.payload.items() if k != "text"}
+        }
+
+    def iter_documents(self, batch_size: int = 256, with_payload: PayloadSelector = True,
+                       with_vectors: bool = False) -> Iterator[Dict[str, Any]]:
         """
-        If the vector db is not too large, we can get all the documents from the vector db
+        Lazily iterate over every document of the collection.
+        Pages of batch_size points are scrolled one at a time by following next_page_offset,
+        so memory use doesn't depend on the size of the collection.
+
+        Args:
+            batch_size: Number of points fetched per scroll request
+            with_payload: True for the whole payload, False for none, a list of payload fields to fetch
+                or {"exclude": [fields]}
+            with_vectors: Whether to also return the vector of each document
+
+        Yields:
+            Dictionaries with 'id', 'text', 'metadata' (and 'vector' if requested)
         """
-        try:
-            points, _ = self.client.scroll(
-                collection_name=self.collection_name,
-                limit=10000
+        offset = None
+        while True:
+            points, offset = self.backend.scroll(
+                limit=batch_size,
+                offset=offset,
+                with_payload=with_payload,
+                with_vectors=with_vectors
             )
 
-            documents = []
             for point in points:
-                documents.append({
+                payload = point.payload or {}
+                document = {
                     "id": point.id,
-                    "text": point.payload.get("text", ""),
-                    "metadata": {k: v for k, v in point.payload.items() if k != "text"}
-                })
+                    "text": payload.get("text", ""),
+                    "metadata": {k: v for k, v in payload.items() if k != "text"}
+                }
+                if with_vectors:
+                    document["vector"] = point.vector
+                yield document
 
-            return documents
+            if offset is None:
+                break
+
+    def get_all_documents(self):
+        """
+        Get all the documents from the vector db as a list.
+        Prefer iter_documents for large collections, this materializes every payload in memory.
+        """
+        try:
+            return list(self.iter_documents())
         except Exception as e:
             print(f"Error retrieving documents: {e}")
             return []
 
 if __name__ == "__main__":
     vector_db = VectorDB()
-    documents = vector_db.get_all_documents()
-    for document in documents[:10]:
+    for document in islice(vector_db.iter_documents(batch_size=10), 10):
         print(document["text"])
         print("METADATA:")
         print(document["metadata"])
@@ -1,5 +1,5 @@
 from typing import List
-from openai import OpenAI
+from src.gateway import get_gateway
 from src.types import (
     ConversationState,
     ConversationGoal,
@@ -24,7 +24,7 @@ class ConversationEvaluator:
     Scores are normalized to 0-1 floats for metrics compatibility.
     """
     def __init__(self, openai_api_key: str):
-        self.client = OpenAI(api_key=openai_api_key)
+        self.gateway = get_gateway(openai_api_key)
 
     def evaluate(
         self,
@@ -104,7 +104,7 @@ class ConversationEvaluator:
 
         Respond with only "TRUE" if the goal was achieved, or "FALSE" if not."""
 
-        response = self.client.chat.completions.create(
+        response = self.gateway.chat(
             model='gpt-4o',
             messages=[{'role': 'user', 'content': prompt}],
             max_completion_tokens=10,
@@ -146,7 +146,7 @@ class ConversationEvaluator:
         REASONING: [Your analysis]
         SCORE: [0, 1, 2, or 3]"""
 
-        response = self.client.chat.completions.create(
+        response = self.gateway.chat(
             model='gpt-4o',
             messages=[{'role': 'user', 'content': prompt}],
             max_completion_tokens=200,
@@ -196,7 +196,7 @@ class ConversationEvaluator:
         REASONING: [Your analysis]
         SCORE: [0, 1, 2, or 3]"""
 
-        response = self.client.chat.completions.create(
+        response = self.gateway.chat(
             model='gpt-4o',
             messages=[{'role': 'user', 'content': prompt}],
             max_completion_tokens=200,
@@ -249,7 +249,7 @@ class ConversationEvaluator:
         REASONING: [Your analysis]
         SCORE: [0, 1, 2, or 3]"""
 
-        response = self.client.chat.completions.create(
+        response = self.gateway.chat(
             model='gpt-4o',
             messages=[{'role': 'user', 'content': prompt}],
             max_completion_tokens=200,
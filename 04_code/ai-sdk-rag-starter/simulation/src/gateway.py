@@ -0,0 +1,17 @@
+"""
+Shared LLM gateway for the simulator and the judge. It reuses llm_gateway from 02_code, so both share
+one connection pool, the per-model concurrency limits and the retries
+"""
+import os
+import sys
+
+GATEWAY_DIR = os.getenv(
+    "LLM_GATEWAY_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "..", "02_code"),
+)
+if os.path.abspath(GATEWAY_DIR) not in [os.path.abspath(path) for path in sys.path]:
+    sys.path.append(os.path.abspath(GATEWAY_DIR))
+
+from llm_gateway import LLMGateway, get_gateway  # noqa: E402
+
+__all__ = ["LLMGateway", "get_gateway"]
@@ -1,6 +1,6 @@
 from typing import Dict, Tuple
 from datetime import datetime
-from openai import OpenAI
+from src.gateway import get_gateway
 from src.types import (
     UserPersona,
     ConversationGoal,
@@ -11,7 +11,7 @@ from src.types import (
 
 class UserSimulator:
     def __init__(self, openai_api_key: str, persona: UserPersona, goal: ConversationGoal):
-        self.client = OpenAI(api_key=openai_api_key)
+        self.gateway = get_gateway(openai_api_key)
         self.persona = persona
         self.goal = goal
         self.state = ConversationState(
@@ -35,7 +35,7 @@ class UserSimulator:
 
         Make the message natural and consistent with these traits."""
 
-        response = self.client.chat.completions.create(
+        response = self.gateway.chat(
             model='gpt-4o',
             messages=[
                 {'role': 'system', 'content': system_prompt},
@@ -89,7 +89,7 @@ class UserSimulator:
 
         IMPORTANT: Always include all four fields (MESSAGE, CONTINUE, SATISFACTION, REASON) in your response."""
 
-        response = self.client.chat.completions.create(
+        response = self.gateway.chat(
             model='gpt-4o',
             messages=[
                 {'role': 'system', 'content': system_prompt},
@@ -4,20 +4,20 @@ import os
 from typing import Dict, List, Any  # Standard könyvtárak
 
 import requests                     # HTTP requestekhez (API hívásokhoz)
-from openai import OpenAI           # OpenAI API kliens (LLM Judge)
+from gateway import get_gateway    # Megosztott LLM gateway (LLM Judge)
 from dotenv import load_dotenv # Harmadik fél könyvtárai. 
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize OpenAI client for LLM Judge
+# Initialize the shared LLM gateway for LLM Judge
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY must be set in .env file")
 
-# Az OpenAI API kliens létrehozása az LLM Judge-hoz. Ez később hívni fogja a GPT-4-et az értékeléshez.    
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# A megosztott LLM gateway az LLM Judge-hoz. Ez később hívni fogja a GPT-4-et az értékeléshez.
+gateway = get_gateway(OPENAI_API_KEY)
 
 # API endpoint
 API_URL = "http://localhost:3000/api/chat"
@@ -120,7 +120,7 @@ def evaluate_accuracy(generated_response: str, expected_response: str) -> Dict[s
     )
     
     try:
-        response = openai_client.chat.completions.create(
+        response = gateway.chat(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3
@@ -179,7 +179,7 @@ def evaluate_relevance(generated_response: str, query: str) -> Dict[str, Any]:
     )
     
     try:
-        response = openai_client.chat.completions.create(
+        response = gateway.chat(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3
@@ -3,8 +3,8 @@ import json
 import glob
 from pathlib import Path
 from typing import List, Dict, Any, Optional
-from openai import OpenAI
 from dotenv import load_dotenv
+from gateway import get_gateway
 from datetime import datetime
 
 load_dotenv()
@@ -59,7 +59,7 @@ class GoldenDatasetGenerator:
         if not api_key:
             raise ValueError("OpenAI API key must be provided either as parameter or OPENAI_API_KEY environment variable")
         
-        self.openai_client = OpenAI(api_key=api_key)
+        self.gateway = get_gateway(api_key)
         self.data_dir = Path(data_dir)
         
     def read_markdown_files(self, version: str = "v1.2.x", max_files: Optional[int] = None) -> List[Dict[str, str]]:
@@ -135,7 +135,7 @@ class GoldenDatasetGenerator:
         )
         
         try:
-            response = self.openai_client.chat.completions.create(
+            response = self.gateway.chat(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=1000,
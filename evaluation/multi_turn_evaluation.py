@@ -4,16 +4,16 @@ import json
 import os
 import re
 from typing import Dict, List, Any
-from openai import OpenAI
 from dotenv import load_dotenv
+from gateway import get_gateway
 
-# Környezeti változók és OpenAI kliens inicializálása
+# Környezeti változók és a megosztott LLM gateway inicializálása
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise ValueError("Az OPENAI_API_KEY-t be kell állítani a .env fájlban")
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+gateway = get_gateway(OPENAI_API_KEY)
 
 # --- LLM-AS-A-JUDGE PROMPT A TELJES BESZÉLGETÉSHEZ ---
 
@@ -83,7 +83,7 @@ def evaluate_conversation(conversation_log: Dict[str, Any]) -> Dict[str, Any]:
     )
     
     try:
-        response = openai_client.chat.completions.create(
+        response = gateway.chat(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.1,
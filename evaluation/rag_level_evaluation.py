@@ -1,10 +1,9 @@
-import os
 import json
 from datetime import datetime
 from typing import List, Dict, Any, Callable, Optional, Tuple
-from openai import OpenAI
 from dotenv import load_dotenv
 from tqdm import tqdm
+from gateway import LLMGateway, get_gateway
 from vectordb import VectorDB
 
 load_dotenv()
@@ -25,27 +24,24 @@ Document:
 
 Query:"""
 
-def simulate_user_query_for_document(document: str, query_generator_prompt: str = DEFAULT_QUERY_GENERATOR_PROMPT, openai_client: OpenAI = None) -> str:
+def simulate_user_query_for_document(document: str, query_generator_prompt: str = DEFAULT_QUERY_GENERATOR_PROMPT, gateway: LLMGateway = None) -> str:
     """
     Simulate a user query for a given document.
-    It calls OpenAI API to get the user query.
+    It calls OpenAI API to get the user query, through the shared gateway.
     """
-    if openai_client is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OpenAI API key must be provided either as parameter or OPENAI_API_KEY environment variable")
-        openai_client = OpenAI(api_key=api_key)
+    if gateway is None:
+        gateway = get_gateway()
     
     prompt = query_generator_prompt.format(document=document)
     
-    response = openai_client.chat.completions.create(
+    response = gateway.chat(
         model="gpt-5-mini",
         messages=[{"role": "user", "content": prompt}]
     )
     
     return response.choices[0].message.content.strip()
 
-def simulate_user_query_for_all_documents(documents: List[Dict[str, Any]], query_generator: Optional[Callable] = None, query_generator_prompt: str = DEFAULT_QUERY_GENERATOR_PROMPT, openai_client: OpenAI = None) -> List[Tuple[Dict[str, Any], str]]:
+def simulate_user_query_for_all_documents(documents: List[Dict[str, Any]], query_generator: Optional[Callable] = None, query_generator_prompt: str = DEFAULT_QUERY_GENERATOR_PROMPT, gateway: LLMGateway = None) -> List[Tuple[Dict[str, Any], str]]:
     """
     Simulate a user query for all documents
     Returns list of tuples (document_dict, generated_query)
@@ -56,7 +52,7 @@ def simulate_user_query_for_all_documents(documents: List[Dict[str, Any]], query
     results = []
     for document in tqdm(documents, desc="Generating queries"):
         try:
-            query = query_generator(document["text"], query_generator_prompt, openai_client)
+            query = query_generator(document["text"], query_generator_prompt, gateway)
             results.append((document, query))
         except Exception as e:
             print(f"Error generating query for document: {e}")
@@ -99,7 +95,7 @@ def evaluate_rag_level(vector_db: VectorDB, documents: Optional[List[Dict[str, A
         })
     
     # Generate queries for all documents
-    document_queries = simulate_user_query_for_all_documents(documents, query_generator, query_generator_prompt, vector_db.openai_client)
+    document_queries = simulate_user_query_for_all_documents(documents, query_generator, query_generator_prompt, vector_db.gateway)
     
     if not document_queries:
         return {"precision": 0.0, "recall": 0.0, "f1_score": 0.0, "total_queries": 0}
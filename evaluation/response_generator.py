@@ -1,7 +1,6 @@
 
-from openai import OpenAI
-import os
 from dotenv import load_dotenv
+from gateway import get_gateway
 from vectordb import VectorDB
 
 # Load environment variables
@@ -28,12 +27,8 @@ def generate_response(query: str, documents: list[str]) -> str:
     Returns:
         Generated response string
     """
-    # Initialize OpenAI client
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OpenAI API key must be provided as OPENAI_API_KEY environment variable")
-    
-    client = OpenAI(api_key=api_key)
+    # Shared LLM gateway
+    gateway = get_gateway()
     
     # Format documents for the prompt
     formatted_documents = "\n\n".join([f"Document {i+1}: {doc}" for i, doc in enumerate(documents)])
@@ -42,7 +37,7 @@ def generate_response(query: str, documents: list[str]) -> str:
     user_message = USER_PROMPT.format(query=query, documents=formatted_documents)
     
     try:
-        response = client.chat.completions.create(
+        response = gateway.chat(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
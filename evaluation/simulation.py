@@ -3,19 +3,19 @@
 import json
 import os
 from typing import Dict, List, Any
-from openai import OpenAI
 import requests
 from dotenv import load_dotenv
+from gateway import get_gateway
 
 # Környezeti változók betöltése a .env fájlból
 load_dotenv()
 
-# OpenAI kliens inicializálása a perszóna szimulációjához
+# A megosztott LLM gateway inicializálása a perszóna szimulációjához
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise ValueError("Az OPENAI_API_KEY-t be kell állítani a .env fájlban")
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+gateway = get_gateway(OPENAI_API_KEY)
 
 # A te chatbotod API végpontja
 API_URL = "http://localhost:3000/api/chat"
@@ -108,7 +108,7 @@ def get_next_user_turn(persona: Persona, goal: Goal, history: List[Dict[str, Any
 What is your next question/response to the chatbot based on your persona and goal described above? **Respond ONLY in English.** Return only the response, without any extra text."""
 
     try:
-        response = openai_client.chat.completions.create(
+        response = gateway.chat(
             model="gpt-4",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -1,9 +1,9 @@
 import json
 import os
 from typing import Dict, List, Any
-from openai import OpenAI
 from dotenv import load_dotenv
 from response_generator import full_response_pipeline
+from gateway import get_gateway
 from vectordb import VectorDB
 
 # Load environment variables
@@ -54,11 +54,7 @@ def evaluate_correctness(generated_response: str, ground_truth: str) -> Dict[str
     Returns:
         Dictionary with evaluation result and explanation
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OpenAI API key must be provided as OPENAI_API_KEY environment variable")
-    
-    client = OpenAI(api_key=api_key)
+    gateway = get_gateway()
     
     prompt = CORRECTNESS_JUDGE_PROMPT.format(
         ground_truth=ground_truth,
@@ -66,7 +62,7 @@ def evaluate_correctness(generated_response: str, ground_truth: str) -> Dict[str
     )
     
     try:
-        response = client.chat.completions.create(
+        response = gateway.chat(
             model="gpt-5",
             messages=[{"role": "user", "content": prompt}]
         )
@@ -120,11 +116,7 @@ def evaluate_relevance(generated_response: str, query: str) -> Dict[str, Any]:
     Returns:
         Dictionary with evaluation result and explanation
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OpenAI API key must be provided as OPENAI_API_KEY environment variable")
-    
-    client = OpenAI(api_key=api_key)
+    gateway = get_gateway()
     
     prompt = RELEVANCE_JUDGE_PROMPT.format(
         query=query,
@@ -132,7 +124,7 @@ def evaluate_relevance(generated_response: str, query: str) -> Dict[str, Any]:
     )
     
     try:
-        response = client.chat.completions.create(
+        response = gateway.chat(
             model="gpt-5",
             messages=[{"role": "user", "content": prompt}]
         )
@@ -1,13 +1,13 @@
 import psycopg2
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from gateway import get_gateway
 
 # Load environment from parent directory
 load_dotenv("../ai-sdk-rag-starter/.env")
 
-# Get OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Get the shared LLM gateway
+gateway = get_gateway(os.getenv("OPENAI_API_KEY"))
 
 # Get database connection
 conn = psycopg2.connect(os.getenv("DATABASE_URL"))
@@ -20,7 +20,7 @@ print(f"Query: {query}")
 print("=" * 60)
 
 # Generate embedding for the query
-response = client.embeddings.create(
+response = gateway.embed(
     model="text-embedding-ada-002",
     input=query
 )
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from gateway import get_gateway
 
 # Load .env from parent directory
 load_dotenv("../ai-sdk-rag-starter/.env")
@@ -10,8 +10,7 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 print(f"API Key loaded: {OPENAI_API_KEY[:20]}..." if OPENAI_API_KEY else "No API key found")
 
 try:
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    response = client.chat.completions.create(
+    response = get_gateway(OPENAI_API_KEY).chat(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": "Say hello"}],
         max_tokens=10
@@ -2,16 +2,14 @@
 
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
-from openai import OpenAI
 import uuid
-import os
 from dotenv import load_dotenv
+from gateway import get_gateway
 from typing import List, Dict, Any
 
 # Load environment variables from .env file
 load_dotenv()
 
-
 class VectorDB:
     """
     Vector DB class, that implements the vector db interface by connecting to a qdrant server
@@ -21,12 +19,7 @@ class VectorDB:
         self.client = QdrantClient(host=host, port=port)
         self.collection_name = collection_name
 
-        # Initialize OpenAI client
-        api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OpenAI API key must be provided either as parameter or OPENAI_API_KEY environment variable")
-
-        self.openai_client = OpenAI(api_key=api_key)
+        self.gateway = get_gateway(openai_api_key)
         self.embedding_model = "text-embedding-3-small"
         self.vector_size = 1536  # Default dimension for text-embedding-3-small
 
@@ -51,8 +44,8 @@ class VectorDB:
         if metadata is None:
             metadata = {}
 
-        # Get embedding from OpenAI
-        response = self.openai_client.embeddings.create(
+        # Get embedding from OpenAI through the shared gateway
+        response = self.gateway.embed(
             model=self.embedding_model,
             input=document
         )
@@ -78,8 +71,8 @@ class VectorDB:
 
     def search(self, query: str, limit: int = 5):
         """Search for similar documents"""
-        # Get embedding from OpenAI
-        response = self.openai_client.embeddings.create(
+        # Get embedding from OpenAI through the shared gateway
+        response = self.gateway.embed(
             model=self.embedding_model,
             input=query
         )